@@ -0,0 +1,145 @@
+"""
+Analytics over large batches of recorded hands: how often each combination is made, textures of the boards, and which
+combinations win at showdown. Everything is computed with array operations over the encoded cards, by chunks of hands
+to bound the memory used by the intermediate arrays.
+"""
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+
+from drunkpoker.main import engine
+
+
+"""
+Textures of a board are flags, combined in a number from 0 to TEXTURES - 1
+PAIRED: at least two cards of the same value
+MONOTONE: all the cards of the same suit
+CONNECTED: at least three different values that fit in a straight, the ace being high or low
+"""
+PAIRED = 1
+MONOTONE = 2
+CONNECTED = 4
+TEXTURES = 8
+
+COMBINATIONS = engine.Combinations.STRAIGHT_FLUSH + 1
+
+CHUNK_SIZE = 100000
+
+# Bits of the values of the cards of a straight, from the lowest (ace to five) to the highest (ten to ace), the ace
+# being counted on both bit 1 and bit 14
+_STRAIGHTS_BITS = [0b11111 << lowest for lowest in range(1, 11)]
+
+"""
+hands: number of hands analysed
+combinations_counts: number of hands of players at showdown of each combination
+textures_counts: number of flops of each texture
+winning_combinations_counts: number of hands won with each combination
+winning_combinations_by_texture: array of shape (TEXTURES, COMBINATIONS), number of hands won with each combination for
+    each texture of the flop
+"""
+HandsAnalytics = namedtuple(
+    "HandsAnalytics",
+    "hands combinations_counts textures_counts winning_combinations_counts winning_combinations_by_texture"
+)
+
+
+def describe_texture(texture):
+    return ", ".join(
+        name for flag, name in ((PAIRED, "paired"), (MONOTONE, "monotone"), (CONNECTED, "connected"))
+        if texture & flag
+    ) or "dry"
+
+
+@lru_cache(maxsize=None)
+def _bits_counts():
+    """
+    Number of bits set of all the numbers of 15 bits
+    """
+    bits_counts = np.zeros(1 << 15, dtype=np.uint8)
+    for bit in range(15):
+        bits_counts[1 << bit:2 << bit] = bits_counts[:1 << bit] + 1
+    return bits_counts
+
+
+def board_textures(boards):
+    """
+    :param boards: array like of shape (N, number of community cards) of encoded cards
+    :return: array of shape (N,) of the textures of each board, see PAIRED, MONOTONE and CONNECTED
+    """
+    boards = np.asarray(boards, dtype=np.intp).reshape(len(boards), -1)
+    values = (boards >> 2) + 2
+    suits = boards & 3
+
+    sorted_values = np.sort(values, axis=1)
+    paired = (sorted_values[:, 1:] == sorted_values[:, :-1]).any(axis=1)
+    monotone = (suits == suits[:, :1]).all(axis=1)
+
+    values_bits = np.bitwise_or.reduce(np.left_shift(1, values), axis=1)
+    values_bits |= (values_bits >> 14 & 1) << 1
+    bits_counts = _bits_counts()
+    connected = np.zeros(len(boards), dtype=bool)
+    for straight_bits in _STRAIGHTS_BITS:
+        connected |= bits_counts[values_bits & straight_bits] >= 3
+
+    return (paired * PAIRED | monotone * MONOTONE | connected * CONNECTED).astype(np.uint8)
+
+
+def showdown_scores(hole_cards, boards):
+    """
+    :param hole_cards: array like of shape (N, number of players, 2) of encoded cards, -1 for the seats of players that
+        didn't go to showdown
+    :param boards: array like of shape (N, 5) of encoded cards
+    :return: array of shape (N, number of players) of the hand_score of each player, -1 for missing players
+    """
+    hole_cards = np.asarray(hole_cards, dtype=np.intp)
+    present = hole_cards[:, :, 0] >= 0
+    # Missing players are evaluated with any card and their scores overwritten, cheaper than selecting the others
+    hole_cards = np.where(hole_cards >= 0, hole_cards, 0)
+
+    scores = engine.evaluate_many_players(hole_cards.transpose(1, 0, 2), boards).T
+    scores[~present] = -1
+    return scores
+
+
+def _analyse_chunk(hole_cards, boards) -> HandsAnalytics:
+    scores = showdown_scores(hole_cards, boards)
+    textures = board_textures(boards[:, :3])
+    winning_combinations = engine.score_combination(scores.max(axis=1))
+    return HandsAnalytics(
+        hands=len(boards),
+        combinations_counts=np.bincount(engine.score_combination(scores[scores >= 0]), minlength=COMBINATIONS),
+        textures_counts=np.bincount(textures, minlength=TEXTURES),
+        winning_combinations_counts=np.bincount(winning_combinations, minlength=COMBINATIONS),
+        winning_combinations_by_texture=np.bincount(
+            textures.astype(np.intp) * COMBINATIONS + winning_combinations,
+            minlength=TEXTURES * COMBINATIONS
+        ).reshape(TEXTURES, COMBINATIONS)
+    )
+
+
+def analyse_hands(hole_cards, boards, chunk_size=CHUNK_SIZE) -> HandsAnalytics:
+    """
+    :param hole_cards: see showdown_scores, at least one player per hand
+    :param boards: array like of shape (N, 5) of encoded cards, the flop being the first 3
+    """
+    hole_cards = np.asarray(hole_cards, dtype=np.intp)
+    boards = np.asarray(boards, dtype=np.intp)
+    if hole_cards.shape[:1] != boards.shape[:1]:
+        raise ValueError("There must be as many boards as hands")
+    chunks = [
+        _analyse_chunk(hole_cards[start:start + chunk_size], boards[start:start + chunk_size])
+        for start in range(0, len(boards), chunk_size)
+    ]
+    return HandsAnalytics(
+        hands=len(boards),
+        combinations_counts=sum((chunk.combinations_counts for chunk in chunks), np.zeros(COMBINATIONS, np.int64)),
+        textures_counts=sum((chunk.textures_counts for chunk in chunks), np.zeros(TEXTURES, np.int64)),
+        winning_combinations_counts=sum(
+            (chunk.winning_combinations_counts for chunk in chunks),
+            np.zeros(COMBINATIONS, np.int64)
+        ),
+        winning_combinations_by_texture=sum(
+            (chunk.winning_combinations_by_texture for chunk in chunks),
+            np.zeros((TEXTURES, COMBINATIONS), np.int64)
+        )
+    )
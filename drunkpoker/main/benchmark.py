@@ -0,0 +1,157 @@
+"""
+Exhaustive benchmark of the hand evaluators: all the 133784560 hands of 7 cards are evaluated, spread over a pool of
+processes, and the number of hands of each combination is checked against the known totals. Results are also checked
+against best_combination, for a sample of the hands as it is much slower than the vectorized evaluators.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import os
+import time
+import numpy as np
+
+from drunkpoker.main import engine
+
+
+"""
+Number of hands of 7 cards for each combination, indexed by engine.Combinations
+"""
+SEVEN_CARDS_COMBINATIONS_COUNTS = (
+    23294460,  # High card
+    58627800,  # One pair
+    31433400,  # Two pairs
+    6461620,  # Three of a kind
+    6180020,  # Straight
+    4047644,  # Flush
+    3473184,  # Full house
+    224848,  # Four of a kind
+    41584,  # Straight flush
+)
+
+
+def _reference_scores(hands):
+    return np.array([engine.hand_score(engine.best_combination(hand)) for hand in hands.tolist()], dtype=np.int64)
+
+
+"""
+Evaluators that can be benchmarked, taking an array of hands of shape (N, 7) and returning the array of their hand_score
+"""
+EVALUATORS = {
+    "evaluate_many": engine.evaluate_many,
+    "best_combination": _reference_scores,
+}
+
+"""
+hands: number of hands evaluated
+combinations_counts: number of hands of each combination
+checked: number of hands checked against best_combination
+mismatches: up to MAX_MISMATCHES hands for which the evaluator and best_combination disagree
+seconds: time spent evaluating, excluding the time to generate the hands and to check them, summed over the processes
+wall_clock_seconds: time the whole benchmark took, including starting the processes, generating the hands and checking
+    them
+"""
+BenchmarkResult = namedtuple(
+    "BenchmarkResult", "hands combinations_counts checked mismatches seconds wall_clock_seconds"
+)
+
+MAX_MISMATCHES = 10
+
+
+def number_of_combinations(n, k):
+    result = 1
+    for i in range(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+@lru_cache(maxsize=None)
+def _five_numbers_combinations():
+    """
+    All the combinations of 5 numbers from 0 to 49, sorted by their highest number, then their next highest... so that
+    the combinations of the numbers from 0 to n - 1 come first
+    """
+    numbers = 50
+    combinations_ = np.arange(numbers, dtype=np.int8).reshape(-1, 1)
+    for size in range(2, 6):
+        # Combinations with a highest number of top are the smaller combinations of the numbers below top, plus top
+        combinations_ = np.vstack([
+            np.hstack([
+                combinations_[:number_of_combinations(top, size - 1)],
+                np.full((number_of_combinations(top, size - 1), 1), top, dtype=np.int8)
+            ])
+            for top in range(size - 1, numbers)
+        ])
+    return combinations_
+
+
+def seven_cards_units():
+    """
+    Hands are split in units by their two lowest cards, the other 5 being any 5 of the higher cards
+    """
+    return [
+        (lowest, second_lowest)
+        for lowest in range(len(engine.deck))
+        for second_lowest in range(lowest + 1, len(engine.deck) - 5)
+    ]
+
+
+def seven_cards_hands(lowest, second_lowest):
+    """
+    :return: array of shape (N, 7) of all the hands of a unit
+    """
+    higher_cards = len(engine.deck) - second_lowest - 1
+    others = _five_numbers_combinations()[:number_of_combinations(higher_cards, 5)]
+    hands = np.empty((len(others), 7), dtype=np.intp)
+    hands[:, 0] = lowest
+    hands[:, 1] = second_lowest
+    hands[:, 2:] = others + second_lowest + 1
+    return hands
+
+
+def benchmark_unit(evaluator_name, unit, check_fraction, seed) -> BenchmarkResult:
+    unit_start = time.perf_counter()
+    hands = seven_cards_hands(*unit)
+
+    start = time.perf_counter()
+    scores = EVALUATORS[evaluator_name](hands)
+    seconds = time.perf_counter() - start
+
+    checked = np.flatnonzero(np.random.default_rng(seed).random(len(hands)) < check_fraction)
+    wrong = checked[np.asarray(scores)[checked] != _reference_scores(hands[checked])]
+    return BenchmarkResult(
+        hands=len(hands),
+        combinations_counts=np.bincount(
+            engine.score_combination(np.asarray(scores)),
+            minlength=len(SEVEN_CARDS_COMBINATIONS_COUNTS)
+        ).tolist(),
+        checked=len(checked),
+        mismatches=hands[wrong[:MAX_MISMATCHES]].tolist(),
+        seconds=seconds,
+        wall_clock_seconds=time.perf_counter() - unit_start
+    )
+
+
+def benchmark(evaluator_name, check_fraction=0.001, processes=None, units=None, seed=0) -> BenchmarkResult:
+    """
+    :param check_fraction: fraction of the hands checked against best_combination
+    :param units: the units of hands to evaluate (see seven_cards_units), all of them by default
+    :return: the results of all the units
+    """
+    units = seven_cards_units() if units is None else units
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as executor:
+        units_results = list(executor.map(
+            benchmark_unit,
+            [evaluator_name] * len(units),
+            units,
+            [check_fraction] * len(units),
+            np.random.SeedSequence(seed).spawn(len(units))
+        ))
+    return BenchmarkResult(
+        hands=sum(result.hands for result in units_results),
+        combinations_counts=[sum(counts) for counts in zip(*(result.combinations_counts for result in units_results))],
+        checked=sum(result.checked for result in units_results),
+        mismatches=[hand for result in units_results for hand in result.mismatches][:MAX_MISMATCHES],
+        seconds=sum(result.seconds for result in units_results),
+        wall_clock_seconds=time.perf_counter() - start
+    )
@@ -126,19 +126,15 @@ class PlayerActions(AsyncHttpConsumer):
         table_type = self.scope["url_route"]["kwargs"]["table_type"]
         table_group_name = f'table_{table_type}_{table_name}'
 
-        new_state = engine.process_event(
-            await persistent_state.get_table(table_name, table_type),
+        new_state = await persistent_state.apply_event(
+            table_name,
+            table_type,
             {
                 "type": self.event_type(),
                 "player_id": player_id,
-                "parameters": json.loads(body)
+                "parameters": engine.event_parameters(self.event_type(), json.loads(body))
             }
         )
-        await persistent_state.set_table(
-            table_name,
-            table_type,
-            new_state
-        )
         await self.channel_layer.group_send(
             table_group_name,
             {
@@ -175,9 +171,11 @@ class StreamGameState(AsyncWebsocketConsumer):
 
         await self.accept()
         await self.send(text_data=json.dumps(
-            engine.strip_state_for_player(
-                await persistent_state.get_table(self.table_name, self.table_type),
-                player_id
+            engine.decode_cards_for_client(
+                engine.strip_state_for_player(
+                    await persistent_state.get_table(self.table_name, self.table_type),
+                    player_id
+                )
             )
         ))
 
@@ -187,18 +185,14 @@ class StreamGameState(AsyncWebsocketConsumer):
 
             print(f"Player leaving {player_id}")
 
-            new_state = engine.process_event(
-                await persistent_state.get_table(self.table_name, self.table_type),
+            new_state = await persistent_state.apply_event(
+                self.table_name,
+                self.table_type,
                 {
                     "type": engine.Event.PLAYER_LEAVE,
                     "player_id": player_id,
                 }
             )
-            await persistent_state.set_table(
-                self.table_name,
-                self.table_type,
-                new_state
-            )
             await self.channel_layer.group_send(
                 self.table_group_name,
                 {
@@ -214,7 +208,7 @@ class StreamGameState(AsyncWebsocketConsumer):
         print(f'Streaming state to {player_id}')
 
         state = json.loads(text_data["message"])
-        new_state = engine.strip_state_for_player(state, player_id)
+        new_state = engine.decode_cards_for_client(engine.strip_state_for_player(state, player_id))
 
         text_state_to_send = json.dumps(new_state)
         print(text_state_to_send)
@@ -1,10 +1,19 @@
 """A poker engine"""
 from enum import Enum, auto
-from collections import namedtuple
-from random import shuffle
-from itertools import groupby
+from collections import namedtuple, Counter, OrderedDict
+from random import shuffle, Random
+from itertools import groupby, combinations, combinations_with_replacement
+from functools import lru_cache
+from math import factorial
 from typing import List, Tuple
-import copy
+import base64
+import json
+import os
+import secrets
+import threading
+import numpy as np
+
+from drunkpoker.main.journal import journaled, JournaledDict
 
 
 class EventRejected(Exception):
@@ -79,37 +88,379 @@ class Combinations:
     STRAIGHT_FLUSH = 8
 
 
+COMBINATIONS_NAMES = {value: name for name, value in vars(Combinations).items() if not name.startswith("_")}
+
+
 """
 Probably don't want to change that as the python natural tuple comparison is used. Combination is a number and 
 best_cards a tuple of numbers
 """
 Result = namedtuple("Result", "combination best_cards")
 
+
+# The combination of a hand_score is above the values of its 5 best cards, on 4 bits each
+SCORE_COMBINATION_SHIFT = 5 * 4
+
+
+def hand_score(result: Result) -> int:
+    """
+    Packs a Result in one int that compares the same way: the combination, followed by the values of the (up to 5)
+    best cards on 4 bits each
+    """
+    score = result.combination
+    for value in result.best_cards + (0,) * (5 - len(result.best_cards)):
+        score = score << 4 | value
+    return score
+
+
+def score_combination(score):
+    """
+    :return: the combination of a hand_score, or of each score of an array of them
+    """
+    return score >> SCORE_COMBINATION_SHIFT
+
+
+def decode_hand_score(score, game_type="drinking") -> Result:
+    """
+    Result of a hand_score, or of a short_deck_score for short deck
+    """
+    best_cards = tuple(score >> shift & 0xF for shift in (16, 12, 8, 4, 0))
+    combination = score_combination(score)
+    if game_type == "shortdeck":
+        combination = _SHORT_DECK_COMBINATIONS[combination]
+    return Result(combination, tuple(value for value in best_cards if value))
+
+
+"""
+Human readable form of a card, only used at the boundary with the client (see decode_cards_for_client), where it
+serializes as a [value, suit] list. The engine itself only deals with cards encoded as ints (see encode_card)
+"""
 Card = namedtuple("Card", "value suit")
 
 card_values = range(2, 15)  # J = 11, Q = 12, K = 13, As = 14 for sorting reasons
 
-deck = (
-        tuple([(Card(value=x, suit=Suit.SPADE)) for x in card_values])
-        + tuple([(Card(value=x, suit=Suit.DIAMONDS)) for x in card_values])
-        + tuple([(Card(value=x, suit=Suit.HEART)) for x in card_values])
-        + tuple([(Card(value=x, suit=Suit.CLUBS)) for x in card_values])
+suits = (Suit.SPADE, Suit.DIAMONDS, Suit.HEART, Suit.CLUBS)
+
+_SUIT_INDEXES = {suit: index for index, suit in enumerate(suits)}
+
+
+def encode_card(value, suit) -> int:
+    """
+    A card is the int (value - 2) * 4 + index of its suit, from 0 (2 of spades) to 51 (As of clubs): cards sort by
+    value, card >> 2 is the value - 2 and card & 3 the index of the suit
+    """
+    return (value - 2) << 2 | _SUIT_INDEXES[suit]
+
+
+_DECODED_CARDS = tuple(Card(value, suit) for value in card_values for suit in suits)
+
+
+def decode_card(card) -> Card:
+    return _DECODED_CARDS[card]
+
+
+deck = tuple(encode_card(value, suit) for suit in suits for value in card_values)
+
+
+"""
+Hand tables, used by best_combination.
+A set of card values is represented either by:
+ - a bit mask, with one bit per value (_VALUE_BITS), when values are all different, i.e. for cards of one suit
+ - a key, sum of one _VALUE_KEYS per card. Keys are powers of 5, and there are at most 4 cards of a value, so two
+   different sets of values can't have the same key
+"""
+_VALUE_BITS = {value: 1 << (value - 2) for value in card_values}
+_VALUE_KEYS = {value: 5 ** (value - 2) for value in card_values}
+_CARD_BITS = tuple(_VALUE_BITS[decode_card(card).value] for card in range(len(_DECODED_CARDS)))
+_CARD_KEYS = tuple(_VALUE_KEYS[decode_card(card).value] for card in range(len(_DECODED_CARDS)))
+
+# Bits of the 5 values of each straight, highest straight first. The As also plays as a 1 for 5-4-3-2-As
+_STRAIGHTS = tuple(
+    (top, sum(_VALUE_BITS[value] for value in range(top - 4, top + 1)))
+    for top in range(14, 5, -1)
+) + ((5, sum(_VALUE_BITS[value] for value in (14, 2, 3, 4, 5))),)
+
+
+def _straight_top(values_bits, straights=_STRAIGHTS):
+    for top, straight_bits in straights:
+        if values_bits & straight_bits == straight_bits:
+            return top
+    return None
+
+
+def _same_suit_result(values_bits, straights=_STRAIGHTS):
+    values = tuple(value for value in reversed(card_values) if values_bits & _VALUE_BITS[value])
+    top = _straight_top(values_bits, straights)
+    if top:
+        return Result(Combinations.STRAIGHT_FLUSH, (top,))
+    return Result(Combinations.FLUSH, values[0:5])
+
+
+def _values_result(counts, straights=_STRAIGHTS):
+    """
+    :param counts: (value, number of cards with that value) pairs, highest value first
+    """
+    values = [value for value, _ in counts]
+    # Stable sort: for a same number of cards, highest value comes first
+    by_count = sorted(counts, key=lambda value_count: value_count[1], reverse=True)
+
+    def best_other_values(excluded, how_many):
+        return tuple(value for value in values if value not in excluded)[0:how_many]
+
+    (first_value, first_count), (second_value, second_count) = (by_count + [(None, 0)])[0:2]
+    if first_count == 4:
+        return Result(Combinations.FOUR_OF_A_KIND, (first_value,) + best_other_values({first_value}, 1))
+    if first_count == 3 and second_count >= 2:
+        return Result(Combinations.FULL_HOUSE, (first_value, second_value))
+    top = _straight_top(sum(_VALUE_BITS[value] for value in values), straights)
+    if top:
+        return Result(Combinations.STRAIGHT, (top,))
+    if first_count == 3:
+        return Result(Combinations.THREE_OF_A_KIND, (first_value,) + best_other_values({first_value}, 2))
+    if first_count == 2 and second_count == 2:
+        return Result(
+            Combinations.TWO_PAIRS,
+            (first_value, second_value) + best_other_values({first_value, second_value}, 1)
+        )
+    if first_count == 2:
+        return Result(Combinations.ONE_PAIR, (first_value,) + best_other_values({first_value}, 3))
+    return Result(Combinations.HIGH_CARD, tuple(values[0:5]))
+
+
+def _build_hand_tables(max_cards=7, values=card_values, straights=_STRAIGHTS):
+    """
+    Returns the (flush table, values table) pair:
+     - the flush table maps the bits of 5 to max_cards values of one suit to their Result
+     - the values table maps the key of any 1 to max_cards values to their Result, ignoring flushes
+    """
+    values_bits_in_deck = sum(_VALUE_BITS[value] for value in values)
+    flush_table = {}
+    for values_bits in range(1 << len(card_values)):
+        if values_bits & values_bits_in_deck == values_bits and 5 <= bin(values_bits).count("1") <= max_cards:
+            flush_table[values_bits] = _same_suit_result(values_bits, straights)
+
+    values_table = {}
+
+    def add_values(counts, key, number_of_cards, next_values):
+        if counts:
+            values_table[key] = _values_result(counts, straights)
+        for index, value in enumerate(next_values):
+            for count in range(1, min(4, max_cards - number_of_cards) + 1):
+                add_values(
+                    counts + [(value, count)],
+                    key + count * _VALUE_KEYS[value],
+                    number_of_cards + count,
+                    next_values[index + 1:]
+                )
+
+    add_values([], 0, 0, tuple(reversed(values)))
+    return flush_table, values_table
+
+
+_FLUSH_TABLE, _VALUES_TABLE = _build_hand_tables()
+
+
+"""
+Short deck hold'em is played without the 2s to 5s. The As still plays as a low card, for 9-8-7-6-As, and as there are
+fewer cards of each suit a flush beats a full house.
+"""
+short_deck_values = range(6, 15)
+
+short_deck = tuple(encode_card(value, suit) for suit in suits for value in short_deck_values)
+
+_SHORT_DECK_STRAIGHTS = tuple((top, straight_bits) for top, straight_bits in _STRAIGHTS if top >= 10) + (
+    (9, sum(_VALUE_BITS[value] for value in (14, 6, 7, 8, 9))),
 )
 
+_SHORT_DECK_COMBINATIONS_ORDER = {
+    combination: order
+    for order, combination in enumerate((
+        Combinations.HIGH_CARD,
+        Combinations.ONE_PAIR,
+        Combinations.TWO_PAIRS,
+        Combinations.THREE_OF_A_KIND,
+        Combinations.STRAIGHT,
+        Combinations.FULL_HOUSE,
+        Combinations.FLUSH,
+        Combinations.FOUR_OF_A_KIND,
+        Combinations.STRAIGHT_FLUSH
+    ))
+}
+
+_SHORT_DECK_COMBINATIONS = tuple(sorted(_SHORT_DECK_COMBINATIONS_ORDER, key=_SHORT_DECK_COMBINATIONS_ORDER.get))
+
+
+def short_deck_score(result: Result) -> int:
+    """
+    hand_score of a Result in the short deck order of the combinations
+    """
+    return hand_score(Result(_SHORT_DECK_COMBINATIONS_ORDER[result.combination], result.best_cards))
+
+
+class ShortDeckResult(Result):
+    """
+    A Result that compares with the short deck order of the combinations
+    """
+    __slots__ = ()
+
+    def __lt__(self, other):
+        if self[0] == other[0]:
+            return self[1] < other[1]
+        return _SHORT_DECK_COMBINATIONS_ORDER[self[0]] < _SHORT_DECK_COMBINATIONS_ORDER[other[0]]
+
+    def __gt__(self, other):
+        return other < self
+
+    def __le__(self, other):
+        return not other < self
+
+    def __ge__(self, other):
+        return not self < other
+
+
+@lru_cache(maxsize=None)
+def _short_deck_tables():
+    """
+    (flush table, values table) pair for short deck, of ShortDeckResult, see _build_hand_tables. Only built for the
+    first short deck game
+    """
+    return tuple(
+        {key: ShortDeckResult(*result) for key, result in table.items()}
+        for table in _build_hand_tables(values=short_deck_values, straights=_SHORT_DECK_STRAIGHTS)
+    )
+
+
+"""
+In hi/lo, the pot is split between the best high hand and the best low hand. A low hand is made of 5 cards of different
+values, 8 or lower, the As playing as a 1, and the best one has the lowest highest card, then the lowest second
+highest card...
+"""
+_LOW_VALUES = {14: 1, 2: 2, 3: 3, 4: 4, 5: 5, 6: 6, 7: 7, 8: 8}
+
+
+@lru_cache(maxsize=None)
+def _low_table():
+    """
+    Maps the bits of the values of some cards (see _VALUE_BITS), whatever their suits, to their best low: its 5 values
+    highest first, the As being a 1, or None when they don't make a low. Only built for the first hi/lo game
+    """
+    low_table = []
+    for values_bits in range(1 << len(card_values)):
+        lows = sorted(low for value, low in _LOW_VALUES.items() if values_bits & _VALUE_BITS[value])
+        low_table.append(tuple(reversed(lows[0:5])) if len(lows) >= 5 else None)
+    return tuple(low_table)
+
+
+def hand_tables(game_type):
+    """
+    :return: the (flush table, values table) pair used to evaluate the hands of game_type
+    """
+    if game_type == "shortdeck":
+        return _short_deck_tables()
+    return _FLUSH_TABLE, _VALUES_TABLE
+
+
+@lru_cache(maxsize=None)
+def _standard_score_tables():
+    return tuple({key: hand_score(result) for key, result in table.items()} for table in (_FLUSH_TABLE, _VALUES_TABLE))
+
+
+@lru_cache(maxsize=None)
+def _short_deck_score_tables():
+    return tuple({key: short_deck_score(result) for key, result in table.items()} for table in _short_deck_tables())
+
+
+def score_tables(game_type):
+    """
+    :return: the hand tables of game_type (see hand_tables) with the scores of the Results (see decode_hand_score),
+        that are cheaper to sort, compare and store. Built for the first showdown
+    """
+    if game_type == "shortdeck":
+        return _short_deck_score_tables()
+    return _standard_score_tables()
+
+
+HAND_SEED_BITS = 128
 
-def shuffle_deck():
-    the_deck = list(deck)
-    shuffle(the_deck)
+# By thread, the seed of the next hand when it is given (see process_event and replay)
+_seeded = threading.local()
+
+
+def draw_hand_seed():
+    """
+    :return: the seed the deck of a new hand is shuffled with, drawn from the CSPRNG of the system so that decks can't
+        be predicted, unless it is given
+    """
+    hand_seed = getattr(_seeded, "hand_seed", None)
+    if hand_seed is not None:
+        _seeded.hand_seed = None
+        return hand_seed
+    return secrets.randbits(HAND_SEED_BITS)
+
+
+def shuffle_deck(the_deck=deck, seed=None):
+    """
+    :param seed: if given, the deck is always shuffled the same way for the same seed
+    """
+    the_deck = list(the_deck)
+    if seed is None:
+        shuffle(the_deck)
+        return the_deck
+    # Fisher-Yates, the index of each swap being a digit of a single random number below the number of orders of the
+    # deck: one draw from the generator instead of one per card
+    order = Random(seed).randrange(factorial(len(the_deck)))
+    for i in range(len(the_deck) - 1, 0, -1):
+        order, j = divmod(order, i + 1)
+        the_deck[i], the_deck[j] = the_deck[j], the_deck[i]
     return the_deck
 
 
+def deal(state, number_of_cards):
+    """
+    Takes the next cards of the deck, which is only shifted once per deal rather than once per card
+    """
+    cards = state["deck"][:number_of_cards]
+    del state["deck"][:number_of_cards]
+    return cards
+
+
+def pack_deck(cards):
+    """
+    Compact form of the cards left in a deck, to be stored: one byte per card, base64 encoded to fit in JSON
+    """
+    return base64.b64encode(bytes(cards)).decode("ascii")
+
+
+def unpack_deck(packed_deck):
+    return list(base64.b64decode(packed_deck))
+
+
+"""
+Game types: in drinking poker players bet sips, in Texas hold'em ("normal"), pot limit Omaha ("omaha"), short deck
+hold'em ("shortdeck") and hold'em hi/lo ("hilo") they bet chips from their stack. Only drinking and normal tables are
+routed: the client doesn't send the type of the table with its actions, nor shows more than 2 hole cards and the low
+results yet
+"""
+GAME_TYPES = ("drinking", "normal", "omaha", "shortdeck", "hilo")
+
+# Number of cards dealt to each player, 2 unless stated otherwise
+HOLE_CARDS = {"omaha": 4}
+
+# Deck of the game, the whole deck unless stated otherwise
+DECKS = {"shortdeck": short_deck}
+
+
+def plays_with_stacks(state):
+    return state["game_type"] != "drinking"
+
+
 def initial_state(game_type="drinking"):
     """
     The initial state, any state should *always* be serializable to json
     Players is a dict with who's playing order as keys
     """
     return {
-        'deck': shuffle_deck(),
+        'deck': shuffle_deck(DECKS.get(game_type, deck)),
         'community_cards': [],
         'seats': {
             "1": "",
@@ -129,7 +480,7 @@ def initial_state(game_type="drinking"):
         'dealing': '',
         'small_blind': 1 if game_type == "drinking" else 10,
         'big_blind': 2 if game_type == "drinking" else 20,
-        'all_in': 20,  # Maximum sips all-in, unused for normal game
+        'all_in': 20,  # Maximum sips all-in, unused for games with stacks
         'game_type': game_type,
         'players_stacks': {}  # Memory of the size of a player stack, unused for drinking game
     }
@@ -176,11 +527,18 @@ def is_table_empty(state):
 def strip_state_for_player(state, player_id):
     if "deck" in state:
         del state["deck"]
+    state.pop("hands_analyses", None)
+    state.pop("seat_ring", None)
+    state.pop("hand_seed", None)
+    outs = state.pop("outs", {})
+    if player_id in outs:
+        state["players"][player_id]["outs"] = outs[player_id]
     game_over = state["game_state"] == GameState.GAME_OVER
     should_show_cards_because_end_of_game = (
-            not all_folded_but_one(state["players"])
+            not all_folded_but_one(state)
             and game_over
     )
+    state.pop("betting", None)
 
     def player_shows_cards(player_id_):
         return ("show_cards" in state["players"][a_player_id]
@@ -200,6 +558,43 @@ def strip_state_for_player(state, player_id):
     return state
 
 
+def encode_legacy_cards(state):
+    """
+    Tables stored before cards were ints hold [value, suit] pairs in their deck, community cards and players cards:
+    encodes them in place. Their results are left as they are, they are only sent to the client
+    """
+    def encoded(cards):
+        return [card if isinstance(card, int) else encode_card(*card) for card in cards]
+
+    if isinstance(state.get("deck"), list):
+        state["deck"] = encoded(state["deck"])
+    state["community_cards"] = encoded(state["community_cards"])
+    for player in state["players"].values():
+        if "cards" in player:
+            player["cards"] = encoded(player["cards"])
+    return state
+
+
+def decode_cards_for_client(state):
+    """
+    Replaces the encoded cards and hand scores of a state about to be sent to the client by their human readable form
+    """
+    if "results" in state and "scores" in state["results"]:
+        # Tables over before scores were ints still hold the Results
+        state["results"]["scores"] = {
+            player_id: decode_hand_score(score, state["game_type"]) if isinstance(score, int) else score
+            for player_id, score in state["results"]["scores"].items()
+        }
+    if "community_cards" in state:
+        state["community_cards"] = [decode_card(card) for card in state["community_cards"]]
+    for player in state["players"].values():
+        if "cards" in player:
+            player["cards"] = [decode_card(card) for card in player["cards"]]
+        if "outs" in player:
+            player["outs"] = [decode_card(card) for card in player["outs"]]
+    return state
+
+
 def determine_next(state, current):
     seats_in_order = sorted([
         seat_number
@@ -236,24 +631,27 @@ def start_game(state):
             del state["players"][player_id]["show_cards"]
 
     state["community_cards"] = []
+    state.pop("hands_analyses", None)
+    state.pop("outs", None)
 
     state["dealing"] = determine_next_dealer_seat(state)
-    state["deck"] = shuffle_deck()
+    state["hand_seed"] = draw_hand_seed()
+    state["deck"] = shuffle_deck(DECKS.get(state["game_type"], deck), seed=state["hand_seed"])
     sitted_players_ids = [
         player_id
         for (seat_number, player_id) in sorted(state["seats"].items(), key=lambda x: int(x[0]))
         if player_id
     ]
-    sitted_players_ids_starting_after_dealer = rotate(
-        sitted_players_ids,
-        sitted_players_ids.index(
-            state["seats"][state["dealing"]]
-        ) + 1
+    state["seat_ring"] = make_seat_ring(
+        rotate(sitted_players_ids, sitted_players_ids.index(state["seats"][state["dealing"]]))
     )
+    sitted_players_ids_starting_after_dealer = rotate(state["seat_ring"]["order"], 1)
     # Deal 2 cards to all players, without respecting the poker rules
     # because it's random anyway
-    for player_id in sitted_players_ids:
-        state["players"][player_id]["cards"] = [state["deck"].pop(0), state["deck"].pop(0)]
+    hole_cards = HOLE_CARDS.get(state["game_type"], 2)
+    dealt_cards = deal(state, hole_cards * len(sitted_players_ids))
+    for index, player_id in enumerate(sitted_players_ids):
+        state["players"][player_id]["cards"] = dealt_cards[index * hole_cards:(index + 1) * hole_cards]
     state["game_state"] = GameState.PREFLOP
     # Blinds and set who's turn it is to play
     state["players"][
@@ -265,6 +663,7 @@ def start_game(state):
     state["players"][
         sitted_players_ids_starting_after_dealer[-2]
     ]["committed_by"] = state["big_blind"]
+    state["betting"] = compute_betting(state)
 
     return None, state
 
@@ -281,8 +680,10 @@ def sit_player(state, player_id, player_name, seat_number):
         "committed_by": 0
     }
     state["seats"][str(seat_number)] = player_id
+    update_seat_ring(state)
+    update_betting(state)
 
-    if state["game_type"] == "normal":
+    if plays_with_stacks(state):
         if player_id not in state["players_stacks"]:
             state["players_stacks"][player_id] = 1000
 
@@ -316,25 +717,29 @@ def exclude_player(state, the_player_id):
         (players_after_current_not_folded,
          players_before_current_not_folded_not_aligned) = determine_next_players_for_this_round(state, the_player_id)
         next_player_id = (players_after_current_not_folded + players_before_current_not_folded_not_aligned)[0]
-        state["players"][next_player_id]["state"] = PlayerState.MY_TURN
+        set_player_state(state, next_player_id, PlayerState.MY_TURN)
 
     # Remove player from seats
     state["seats"] = {
         seat_number: player_id if player_id != the_player_id else ""
         for seat_number, player_id in state["seats"].items()
     }
+    update_seat_ring(state)
     # Remove player
     del state["players"][the_player_id]
+    update_betting(state)
 
     event = None
     if len(state["players"]) >= 2 and state["game_state"] == GameState.NOT_STARTED:
         event = {
             "type": Event.START_GAME
         }
-    elif all_folded_but_one(state["players"]):
+    elif all_folded_but_one(state):
         # Game is over
         state["game_state"] = GameState.GAME_OVER
         state["results"] = generate_end_game_results(state)
+    if "outs" in state:
+        update_outs(state, [])
 
     return event, state
 
@@ -350,6 +755,36 @@ def list_of_players_ids_starting_at_dealer(seats, dealer):
     return rotate(player_ids_in_order, int(dealer) - 1)
 
 
+def make_seat_ring(players_ids_starting_at_dealer):
+    """
+    :return: the seated players in the order they act, starting at the dealer, and the position of each of them in
+        that order
+    """
+    return {
+        "order": players_ids_starting_at_dealer,
+        "positions": {player_id: position for position, player_id in enumerate(players_ids_starting_at_dealer)}
+    }
+
+
+def seat_ring(state):
+    """
+    The seat ring is computed once per hand by start_game and kept up to date when players sit or leave, so that
+    finding who acts next doesn't sort the seats on every action. States of tables that didn't start a hand since don't
+    have it.
+    """
+    if "seat_ring" in state:
+        return state["seat_ring"]
+    return make_seat_ring(
+        remove_empty(list_of_players_ids_starting_at_dealer(state["seats"], state["dealing"] or "1"))
+    )
+
+
+def update_seat_ring(state):
+    if "seat_ring" in state:
+        del state["seat_ring"]
+        state["seat_ring"] = seat_ring(state)
+
+
 def remove_empty(a_string_list):
     return [x for x in a_string_list if x]
 
@@ -362,14 +797,108 @@ def find_player_ids_if(players, predicate) -> List[str]:
     return [x[0] for x in players.items() if predicate(x[1])]
 
 
-def all_folded_but_one(players):
+def is_all_in(state, player_id, player):
+    if "committed_by" not in player:
+        return False
+    if plays_with_stacks(state):
+        return state["players_stacks"][player_id] == player["committed_by"]
+    return player["committed_by"] == state.get("all_in")
+
+
+def _betting_counts(state, player_id, player):
+    return (
+        PlayerState.is_in_game(player["state"]),
+        player["state"] == PlayerState.FOLDED,
+        PlayerState.could_play(player["state"]) and not is_all_in(state, player_id, player)
+    )
+
+
+def compute_betting(state):
+    """
+    Aggregates of the bets of the players, computed by start_game and then kept in the state:
+    max_bet: highest committed_by
+    pot: sum of the committed_by
+    at_max_bet: number of players who committed max_bet
+    in_game: number of players in game, folded or not
+    folded: number of players who folded
+    live_not_all_in: number of players who could play and are not all in
+    Event handlers update them as they change players (see set_player_state and set_committed_by), or recompute them
+    when players sit or leave.
+    """
+    committed = [player.get("committed_by", 0) for player in state["players"].values()]
+    max_bet = max(committed + [0])
+    counts = [_betting_counts(state, player_id, player) for player_id, player in state["players"].items()]
+    return {
+        "max_bet": max_bet,
+        "pot": sum(committed),
+        "at_max_bet": committed.count(max_bet),
+        "in_game": sum(in_game for in_game, _, _ in counts),
+        "folded": sum(folded for _, folded, _ in counts),
+        "live_not_all_in": sum(live_not_all_in for _, _, live_not_all_in in counts)
+    }
+
+
+def update_betting(state):
+    if "betting" in state:
+        state["betting"] = compute_betting(state)
+
+
+def _update_player(state, player_id, key, value):
+    player = state["players"][player_id]
+    betting = state.get("betting")
+    if betting is None:
+        player[key] = value
+        return
+    counts_before = _betting_counts(state, player_id, player)
+    committed_before = player.get("committed_by", 0)
+    player[key] = value
+    counts_after = _betting_counts(state, player_id, player)
+    committed_after = player.get("committed_by", 0)
+
+    for name, before, after in zip(("in_game", "folded", "live_not_all_in"), counts_before, counts_after):
+        betting[name] += after - before
+    if committed_after < committed_before:
+        # Bets only go up during a hand
+        state["betting"] = compute_betting(state)
+    elif committed_after > committed_before:
+        betting["pot"] += committed_after - committed_before
+        if committed_after > betting["max_bet"]:
+            betting["max_bet"] = committed_after
+            betting["at_max_bet"] = 1
+        elif committed_after == betting["max_bet"]:
+            betting["at_max_bet"] += 1
+
+
+def set_player_state(state, player_id, player_state):
+    _update_player(state, player_id, "state", player_state)
+
+
+def set_committed_by(state, player_id, committed_by):
+    _update_player(state, player_id, "committed_by", committed_by)
+
+
+def all_folded_but_one(state):
+    if "betting" in state:
+        return state["betting"]["in_game"] - state["betting"]["folded"] == 1
+    players = state["players"]
     folded_count = count_if(players.values(), lambda player: player["state"] == PlayerState.FOLDED)
     in_game_count = count_if(players.values(), lambda player: PlayerState.is_in_game(player["state"]))
     return in_game_count - folded_count == 1
 
 
 def all_players_all_in(state):
-    if state["game_type"] != "normal":
+    if "betting" in state:
+        live_not_all_in = state["betting"]["live_not_all_in"]
+        if live_not_all_in == 0:
+            return True
+        elif live_not_all_in > 1 or not plays_with_stacks(state):
+            return False
+        # The one player who's not all in doesn't have to play if they already called
+        return next(
+            player["committed_by"] for player_id, player in state["players"].items()
+            if PlayerState.could_play(player["state"]) and not is_all_in(state, player_id, player)
+        ) == get_max_bet(state)
+    if not plays_with_stacks(state):
         return all([
             (True if ("committed_by" in player and player["committed_by"] == state["all_in"])
                      or not PlayerState.could_play(player["state"])
@@ -398,6 +927,8 @@ def all_players_all_in(state):
 
 
 def all_aligned(state):
+    if "betting" in state:
+        return state["betting"]["at_max_bet"] == len(state["players"])
     players = state["players"].values()
     one_player_in_game_commitment = [
         player["committed_by"] for player in players
@@ -410,6 +941,8 @@ def all_aligned(state):
 
 
 def get_max_bet(state):
+    if "betting" in state:
+        return state["betting"]["max_bet"]
     return max([
         player["committed_by"]
         for player in state["players"].values()
@@ -417,6 +950,12 @@ def get_max_bet(state):
     ] + [0])
 
 
+def get_pot(state):
+    if "betting" in state:
+        return state["betting"]["pot"]
+    return sum(player.get("committed_by", 0) for player in state["players"].values())
+
+
 def next_state_event(game_state):
     def event_type():
         if game_state == GameState.PREFLOP:
@@ -442,24 +981,20 @@ def determine_next_players_for_this_round(state, current_player_id):
              for normal game)
     )
     """
-    players_in_order = remove_empty(
-        list_of_players_ids_starting_at_dealer(
-            state["seats"],
-            state["dealing"] if state["dealing"] else "1"
-        )
-    )
+    ring = seat_ring(state)
+    players_in_order = ring["order"]
 
     def is_in_game(player_id):
         return (
             state["players"][player_id]["state"] == PlayerState.IN_GAME
             and (
-                state["game_type"] != "normal"
+                not plays_with_stacks(state)
                 or int(state["players_stacks"][player_id]) > int(state["players"][player_id]["committed_by"])
             )
         )
 
     # Find out players that have to play in order:
-    current_player_index = players_in_order.index(current_player_id)
+    current_player_index = ring["positions"][current_player_id]
     # players after the current player that are not folded
     players_after_current_not_folded = [
         player_id
@@ -481,16 +1016,43 @@ def determine_next_players_for_this_round(state, current_player_id):
     return players_after_current_not_folded, players_before_current_not_folded_not_aligned
 
 
-def rank_players(players, community_cards) -> List[List[Tuple[str, Result]]]:
-    def key(player_id_combination_tuple):
-        return player_id_combination_tuple[1]
+def rank_players(players, community_cards, game_type="drinking") -> List[List[Tuple[str, int]]]:
+    """
+    :return: the players grouped by score of their hand (see decode_hand_score), best first
+    """
+    def key(player_id_score_tuple):
+        return player_id_score_tuple[1]
+
+    # Community cards are shared by all players, only analyse them once
+    if game_type == "omaha":
+        omaha_board_analysis = analyse_omaha_board(community_cards)
+
+        def player_score(player_id):
+            return best_omaha_score(players[player_id]["cards"], omaha_board_analysis)
+    else:
+        community_cards_analysis = analyse_cards(community_cards)
+
+        if hand_cache is not None and game_type != "shortdeck":
+            community_mask = cards_mask(community_cards)
+
+            def player_score(player_id):
+                return hand_cache.best_score(players[player_id]["cards"], community_mask, community_cards_analysis)
+        else:
+            flush_scores, values_scores = score_tables(game_type)
+
+            def player_score(player_id):
+                return best_score_from_analysis(
+                    analyse_cards(players[player_id]["cards"], community_cards_analysis),
+                    flush_scores,
+                    values_scores
+                )
 
     return [
         list(players)
         for _, players in groupby(
             sorted(
                 [
-                    (player_id, best_combination(players[player_id]["cards"] + community_cards))
+                    (player_id, player_score(player_id))
                     for player_id in players
                 ],
                 key=key,
@@ -501,9 +1063,33 @@ def rank_players(players, community_cards) -> List[List[Tuple[str, Result]]]:
     ]
 
 
+def rank_players_low(players, community_cards) -> List[List[Tuple[str, Tuple[int]]]]:
+    """
+    Like rank_players, for the low hands of hi/lo. Players who don't have a low hand aren't ranked
+    """
+    low_table = _low_table()
+    community_values_bits = 0
+    for card in community_cards:
+        community_values_bits |= _CARD_BITS[card]
+
+    players_lows = []
+    for player_id in players:
+        values_bits = community_values_bits
+        for card in players[player_id]["cards"]:
+            values_bits |= _CARD_BITS[card]
+        low = low_table[values_bits]
+        if low:
+            players_lows.append((player_id, low))
+
+    def key(player_id_low_tuple):
+        return player_id_low_tuple[1]
+
+    return [list(players_lows) for _, players_lows in groupby(sorted(players_lows, key=key), key=key)]
+
+
 def generate_end_game_results(state):
     # By fold
-    if all_folded_but_one(state["players"]):
+    if all_folded_but_one(state):
         folded_players = find_player_ids_if(
             state["players"],
             lambda player: player["state"] == PlayerState.FOLDED
@@ -542,7 +1128,8 @@ def generate_end_game_results(state):
                 for player_id, player in state["players"].items()
                 if PlayerState.could_play(player["state"])
             },
-            state["community_cards"]
+            state["community_cards"],
+            state["game_type"]
         )
         winners_ids = [player_score[0] for player_score in players_ranked_with_score[0]]
         folded_player_ids = find_player_ids_if(state["players"], lambda player: player["state"] == PlayerState.FOLDED)
@@ -556,7 +1143,7 @@ def generate_end_game_results(state):
             for list_of_losers_scores in players_ranked_with_score
             for looser_and_score in list_of_losers_scores
         }
-        return {
+        results = {
             "winners": winners_ids,
             "drinkers": {
                 loser_id: state["players"][loser_id]["committed_by"]
@@ -569,6 +1156,26 @@ def generate_end_game_results(state):
                 for list_of_players_and_score in players_ranked_with_score
             ] + [folded_player_ids]
         }
+        if state["game_type"] == "hilo":
+            players_ranked_with_low = rank_players_low(
+                {
+                    player_id: player
+                    for player_id, player in state["players"].items()
+                    if PlayerState.could_play(player["state"])
+                },
+                state["community_cards"]
+            )
+            results["low_winners"] = [player_id for player_id, _ in (players_ranked_with_low or [[]])[0]]
+            results["low_scores"] = {
+                player_id: low
+                for players_and_lows in players_ranked_with_low
+                for player_id, low in players_and_lows
+            }
+            results["low_ranking"] = [
+                [player_id for player_id, _ in players_and_lows]
+                for players_and_lows in players_ranked_with_low
+            ]
+        return results
 
 
 def fold_player(state, player_id):
@@ -577,16 +1184,18 @@ def fold_player(state, player_id):
     (players_after_current_not_folded,
      players_before_current_not_folded_not_aligned) = determine_next_players_for_this_round(state, player_id)
 
-    state["players"][player_id]["state"] = PlayerState.FOLDED
+    set_player_state(state, player_id, PlayerState.FOLDED)
+    if "outs" in state:
+        update_outs(state, [])
     event = None
-    if players_after_current_not_folded and not all_folded_but_one(state["players"]):
-        state["players"][players_after_current_not_folded[0]]["state"] = PlayerState.MY_TURN
+    if players_after_current_not_folded and not all_folded_but_one(state):
+        set_player_state(state, players_after_current_not_folded[0], PlayerState.MY_TURN)
     elif players_before_current_not_folded_not_aligned:
-        state["players"][players_before_current_not_folded_not_aligned[0]]["state"] = PlayerState.MY_TURN
+        set_player_state(state, players_before_current_not_folded_not_aligned[0], PlayerState.MY_TURN)
     else:
         # Either game ends if we're at the turn or all folded but one
         if (state["game_state"] == GameState.TURN
-                or all_folded_but_one(state["players"])):
+                or all_folded_but_one(state)):
             event = Event.make_event(Event.END_GAME)
         # Or draw next state
         else:
@@ -599,7 +1208,7 @@ def player_ready(state, player_id):
     if state["game_state"] != GameState.GAME_OVER:
         return None, state
 
-    state["players"][player_id]["state"] = PlayerState.WAITING_NEW_GAME
+    set_player_state(state, player_id, PlayerState.WAITING_NEW_GAME)
 
     all_ready = count_if(
         state["players"].values(),
@@ -621,10 +1230,10 @@ def player_check(state, player_id):
 
     players_after_current_not_folded, _ = determine_next_players_for_this_round(state, player_id)
 
-    state["players"][player_id]["state"] = PlayerState.IN_GAME
+    set_player_state(state, player_id, PlayerState.IN_GAME)
     event = None
     if players_after_current_not_folded:
-        state["players"][players_after_current_not_folded[0]]["state"] = PlayerState.MY_TURN
+        set_player_state(state, players_after_current_not_folded[0], PlayerState.MY_TURN)
     else:
         event = next_state_event(state["game_state"])
 
@@ -640,20 +1249,22 @@ def draw_x(state, number_of_cards, next_state):
 
     in_game_players_starting_at_dealer = list(filter(
         lambda player_id: PlayerState.could_play(state["players"][player_id]["state"]),
-        remove_empty(list_of_players_ids_starting_at_dealer(state["seats"], state["dealing"]))
+        seat_ring(state)["order"]
     ))
 
     if not in_game_players_starting_at_dealer:
         raise EventRejected("Something went very wrong, no next player on draw event")
 
     next_player_id = in_game_players_starting_at_dealer[0]
-    state["players"][next_player_id]["state"] = PlayerState.MY_TURN
+    set_player_state(state, next_player_id, PlayerState.MY_TURN)
     state["game_state"] = next_state
-    state["community_cards"] = state["community_cards"] + [state["deck"].pop(0) for _ in range(0, number_of_cards)]
+    drawn_cards = deal(state, number_of_cards)
+    state["community_cards"] = state["community_cards"] + drawn_cards
+    update_outs(state, drawn_cards)
 
     event = None
     if all_players_all_in(state):
-        state["players"][next_player_id]["state"] = PlayerState.IN_GAME
+        set_player_state(state, next_player_id, PlayerState.IN_GAME)
         event = next_state_event(next_state)
 
     return event, state
@@ -671,6 +1282,105 @@ def draw_turn(state):
     return draw_x(state, 1, GameState.TURN)
 
 
+def update_outs(state, drawn_cards):
+    """
+    Outs of a player are the cards left in the deck that would give them the best hand, alone, on the next street when
+    they don't already have it. Every player in the hand has their list, the one who has the best hand an empty one, so
+    that the outs don't tell who is ahead. Only the river and the turn are single cards, so there are no outs before
+    the flop and after the turn.
+    Except in Omaha, the analyses of the hands of the players with the community cards are kept in the state from one
+    street to the next, and only extended with the cards that were just drawn.
+    :param drawn_cards: empty when the outs are updated because players left the hand
+    """
+    if state["game_state"] not in (GameState.FLOP, GameState.RIVER):
+        state.pop("hands_analyses", None)
+        state.pop("outs", None)
+        return
+
+    live_players_ids = [
+        player_id for player_id, player in state["players"].items()
+        if PlayerState.could_play(player["state"]) and "cards" in player
+    ]
+
+    def alone_best(scores):
+        """
+        :return: id of the player with the best score, None if they share it with others
+        """
+        best_id = max(scores, key=scores.__getitem__)
+        best_score = scores[best_id]
+        return best_id if sum(score == best_score for score in scores.values()) == 1 else None
+
+    if state["game_type"] == "omaha":
+        # Hands are made of exactly three community cards, that have to be analysed again with every new card
+        def scores_with(cards):
+            board_analysis = analyse_omaha_board(state["community_cards"] + list(cards))
+            return {
+                player_id: best_omaha_score(state["players"][player_id]["cards"], board_analysis)
+                for player_id in live_players_ids
+            }
+
+        def alone_best_with_card(card):
+            return alone_best(scores_with((card,)))
+    else:
+        previous_analyses = state.get("hands_analyses", {})
+        hands_analyses = {
+            player_id: (
+                analyse_cards(drawn_cards, CardsAnalysis(*previous_analyses[player_id]))
+                if player_id in previous_analyses
+                else analyse_cards(state["players"][player_id]["cards"] + state["community_cards"])
+            )
+            for player_id in live_players_ids
+        }
+        state["hands_analyses"] = hands_analyses
+        flush_scores, values_scores = score_tables(state["game_type"])
+
+        def scores_with(cards):
+            return {
+                player_id: best_score_from_analysis(analyse_cards(cards, analysis), flush_scores, values_scores)
+                for player_id, analysis in hands_analyses.items()
+            }
+
+        # Same as alone_best(scores_with((card,))), inlined as it's called for every card of the deck. With up to 7
+        # cards, only one suit can make a flush: a flush a player already has is still their best combination with a
+        # card of another suit
+        players_flushes = [
+            (
+                player_id,
+                analysis.values_key,
+                analysis.suits_values,
+                next((flush_scores[bits] for bits in analysis.suits_values if bits in flush_scores), None)
+            )
+            for player_id, analysis in hands_analyses.items()
+        ]
+
+        def alone_best_with_card(card):
+            card_key = _CARD_KEYS[card]
+            card_suit = card & 3
+            card_bits = _CARD_BITS[card]
+            best_id, best_score, alone = None, -1, False
+            for player_id, values_key, suits_values, flush_score in players_flushes:
+                flush_score = flush_scores.get(suits_values[card_suit] | card_bits, flush_score)
+                score = values_scores[values_key + card_key] if flush_score is None else flush_score
+                if score > best_score:
+                    best_id, best_score, alone = player_id, score, True
+                elif score == best_score:
+                    alone = False
+            return best_id if alone else None
+
+    if len(live_players_ids) < 2:
+        state.pop("hands_analyses", None)
+        state.pop("outs", None)
+        return
+
+    current_best_id = alone_best(scores_with(()))
+    outs = {player_id: [] for player_id in live_players_ids}
+    for card in state["deck"]:
+        best_id = alone_best_with_card(card)
+        if best_id is not None and best_id != current_best_id:
+            outs[best_id].append(card)
+    state["outs"] = outs
+
+
 def player_call(state, player_id):
     validate_check_or_call_or_fold(state, player_id)
 
@@ -680,15 +1390,15 @@ def player_call(state, player_id):
     current_player = state["players"][player_id]
     max_bet = get_max_bet(state)
     if current_player["committed_by"] < max_bet:
-        if state["game_type"] == "drinking" or state["players_stacks"][player_id] > max_bet:
-            current_player["committed_by"] = max_bet
+        if not plays_with_stacks(state) or state["players_stacks"][player_id] > max_bet:
+            set_committed_by(state, player_id, max_bet)
         else:
-            current_player["committed_by"] = state["players_stacks"][player_id]
+            set_committed_by(state, player_id, state["players_stacks"][player_id])
 
     (players_after_current_not_folded,
      players_before_current_not_folded_not_aligned) = determine_next_players_for_this_round(state, player_id)
 
-    state["players"][player_id]["state"] = PlayerState.IN_GAME
+    set_player_state(state, player_id, PlayerState.IN_GAME)
     event = None
 
     bing_blind_called_and_turn_to_big_blind = (
@@ -699,212 +1409,550 @@ def player_call(state, player_id):
     if all_players_all_in(state) or (all_aligned(state) and not bing_blind_called_and_turn_to_big_blind):
         event = next_state_event(state["game_state"])
     elif players_after_current_not_folded:
-        state["players"][players_after_current_not_folded[0]]["state"] = PlayerState.MY_TURN
+        set_player_state(state, players_after_current_not_folded[0], PlayerState.MY_TURN)
     elif players_before_current_not_folded_not_aligned:
-        state["players"][players_before_current_not_folded_not_aligned[0]]["state"] = PlayerState.MY_TURN
+        set_player_state(state, players_before_current_not_folded_not_aligned[0], PlayerState.MY_TURN)
     else:
         event = next_state_event(state["game_state"])
 
     return event, state
 
 
+"""
+What best_combination needs to know about a set of cards: the key of their values and the bits of the values of each
+suit (see _build_hand_tables). It can be extended with more cards, so that cards shared by several hands, like the
+community cards, are only analysed once.
+"""
+CardsAnalysis = namedtuple("CardsAnalysis", "values_key suits_values")
+
+_NO_CARDS_ANALYSIS = CardsAnalysis(0, (0, 0, 0, 0))
+
+
+def analyse_cards(cards, analysis=_NO_CARDS_ANALYSIS) -> CardsAnalysis:
+    """
+    :param analysis: analysis of other cards, that the returned analysis includes. It is left untouched, so it can be
+        extended several times
+    """
+    values_key, (spades, diamonds, hearts, clubs) = analysis
+    suits_values = [spades, diamonds, hearts, clubs]
+    for card in cards:
+        values_key += _CARD_KEYS[card]
+        suits_values[card & 3] |= _CARD_BITS[card]
+    return CardsAnalysis(values_key, suits_values)
+
+
+def best_combination_from_analysis(
+        analysis: CardsAnalysis,
+        flush_table=_FLUSH_TABLE,
+        values_table=_VALUES_TABLE
+) -> Result:
+    """
+    Found with a couple of lookups in the precomputed hand tables (see hand_tables): if 5 or more cards share a suit the
+    hand is a flush or a straight flush, otherwise it only depends on the values of the cards. With 7 cards or less, a
+    flush can't be a full house or a four of a kind at the same time.
+    """
+    for values_bits in analysis.suits_values:
+        if values_bits in flush_table:
+            return flush_table[values_bits]
+    return values_table[analysis.values_key]
+
+
+def best_score_from_analysis(analysis: CardsAnalysis, flush_scores, values_scores) -> int:
+    """
+    Same as best_combination_from_analysis, with score tables (see score_tables)
+    """
+    for values_bits in analysis.suits_values:
+        if values_bits in flush_scores:
+            return flush_scores[values_bits]
+    return values_scores[analysis.values_key]
+
+
 def best_combination(cards) -> Result:
-    def get_sequences_in_len_reversed_order(
-            ordered_cards,
-            are_following_each_other,
-            skip_if=lambda card1, card2: False
-    ):
-        sequences = [[ordered_cards[0]]]
-        for card in ordered_cards[1:]:
-            if are_following_each_other(sequences[-1][-1], card):
-                sequences[-1].append(card)
-            elif skip_if(sequences[-1][-1], card):
-                pass
-            else:
-                sequences.append([card])
-        return sorted(sequences, key=lambda seq: len(seq), reverse=True)
-
-    def get_longest_sequence(ordered_cards, are_following_each_other, skip_if=lambda card1, card2: False):
-        sequences = get_sequences_in_len_reversed_order(ordered_cards, are_following_each_other, skip_if=skip_if)
-        return sequences[0]
-
-    def check_straight_flush(ordered_cards):
-        longest_straight_flush_sequence = get_longest_sequence(
-            ordered_cards,
-            lambda card1, card2: card1.value == card2.value + 1 and card1.suit == card2.suit
-        )
-        if len(longest_straight_flush_sequence) >= 5:
-            return Result(
-                Combinations.STRAIGHT_FLUSH,
-                (max([card.value for card in longest_straight_flush_sequence]),)
-            )
+    """
+    Best poker combination that can be made with the given cards (up to 7 of them).
+    Same as best_combination_from_analysis(analyse_cards(cards)), inlined as it's called for every single hand.
+    """
+    values_key = 0
+    suits_values = [0, 0, 0, 0]
+    for card in cards:
+        values_key += _CARD_KEYS[card]
+        suits_values[card & 3] |= _CARD_BITS[card]
+    for values_bits in suits_values:
+        if values_bits in _FLUSH_TABLE:
+            return _FLUSH_TABLE[values_bits]
+    return _VALUES_TABLE[values_key]
+
+
+class HandCache:
+    """
+    Bounded cache of the scores of the best combinations of sets of cards (see decode_hand_score), least recently used
+    ones being evicted first. Sets of cards are keyed by their mask, with the bit number card set for each of them, so
+    the order of the cards doesn't matter.
+    """
 
-    def check_four_of_a_kind(ordered_cards):
-        longest_same_value_sequence = get_longest_sequence(
-            ordered_cards,
-            lambda card1, card2: card1.value == card2.value
-        )
-        if len(longest_same_value_sequence) == 4:
-            value = longest_same_value_sequence[0].value
-            return Result(
-                Combinations.FOUR_OF_A_KIND,
-                (value,
-                 max({card.value for card in ordered_cards} - {value}))
-            )
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def best_score(self, cards, community_mask=0, community_analysis=_NO_CARDS_ANALYSIS) -> int:
+        """
+        :param community_mask: mask of other cards, the analysis of which is community_analysis, that are part of the
+            hand. Community cards are shared by all players, so only computed once
+        """
+        key = community_mask
+        for card in cards:
+            key |= 1 << card
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self.hits += 1
+                self._scores.move_to_end(key)
+                return score
+            self.misses += 1
+        score = best_score_from_analysis(analyse_cards(cards, community_analysis), *_standard_score_tables())
+        with self._lock:
+            self._scores[key] = score
+            if len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+                self.evictions += 1
+        return score
+
+    def best_combination(self, cards, community_mask=0, community_analysis=_NO_CARDS_ANALYSIS) -> Result:
+        return decode_hand_score(self.best_score(cards, community_mask, community_analysis))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._scores),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0
+        }
 
-    def check_full_house(ordered_cards):
-        same_card_sequences = get_sequences_in_len_reversed_order(
-            ordered_cards,
-            lambda card1, card2: card1.value == card2.value
-        )
-        if len(same_card_sequences[0]) == 3 and len(same_card_sequences[1]) >= 2:
-            return Result(
-                Combinations.FULL_HOUSE,
-                (same_card_sequences[0][0].value, same_card_sequences[1][0].value)
-            )
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+            self.hits = self.misses = self.evictions = 0
 
-    def check_flush(ordered_cards):
-        longest_same_suit_sequence = get_longest_sequence(
-            sorted(ordered_cards, key=lambda card: card.suit),
-            lambda card1, card2: card1.suit == card2.suit
-        )
-        if len(longest_same_suit_sequence) >= 5:
-            return Result(
-                Combinations.FLUSH,
-                tuple([card.value for card in longest_same_suit_sequence][0:5])
-            )
 
-    def check_straight(ordered_cards):
-        longest_sequence = get_longest_sequence(
-            ordered_cards,
-            lambda card1, card2: card1.value == card2.value + 1,
-            skip_if=lambda card1, card2: card1.value == card2.value
-        )
-        if len(longest_sequence) >= 5:
-            return Result(
-                Combinations.STRAIGHT,
-                (longest_sequence[0].value,)
-            )
+def cards_mask(cards) -> int:
+    mask = 0
+    for card in cards:
+        mask |= 1 << card
+    return mask
 
-    def check_three_of_a_kind(ordered_cards):
-        longest_same_card_sequence = get_longest_sequence(
-            ordered_cards,
-            lambda card1, card2: card1.value == card2.value
-        )
-        if len(longest_same_card_sequence) == 3:
-            value_of_triplet = longest_same_card_sequence[0].value
-            return Result(
-                Combinations.THREE_OF_A_KIND,
-                (longest_same_card_sequence[0].value,) +
-                tuple(sorted(list(
-                    {card.value for card in ordered_cards} - {value_of_triplet}
-                ), reverse=True)[0:2])
-            )
 
-    def check_two_pairs(ordered_cards):
-        longest_same_card_sequences = get_sequences_in_len_reversed_order(
-            ordered_cards,
-            lambda card1, card2: card1.value == card2.value
+# Number of hands whose score is cached, about 200 bytes each, 0 to disable the cache
+HAND_CACHE_SIZE = int(os.environ.get("HAND_CACHE_SIZE", 50000))
+
+hand_cache = HandCache(HAND_CACHE_SIZE) if HAND_CACHE_SIZE else None
+
+
+"""
+In Omaha, a hand is made of exactly two of the four cards of the player and three of the community cards: up to 60
+combinations. Without flushes, the best of them only depends on the values of the pairs of hole cards and of the
+community cards, and for 5 community cards it is looked up in a precomputed table (see _omaha_tables): 6 lookups per
+player. Flushes are only looked up for suited pairs of hole cards, in a suit that has at least three community cards.
+"""
+OmahaBoardAnalysis = namedtuple("OmahaBoardAnalysis", "values_keys pairs_results suited_bits")
+
+"""
+boards_indexes: index of the values of 5 community cards, by their key
+pairs_indexes: index of the values of a pair of hole cards, by their key
+best_results: for each board and each pair, index in results of the best combination they make without flush
+results: all the combinations without flush, sorted
+scores: the hand_score of each of the results
+"""
+_OmahaTables = namedtuple("_OmahaTables", "boards_indexes pairs_indexes best_results results scores")
+
+
+@lru_cache(maxsize=None)
+def _omaha_tables() -> _OmahaTables:
+    """
+    Only built for the first Omaha showdown
+    """
+    # Boards are all the possible values of 5 cards, which is also what a pair of hole cards and a triple of community
+    # cards make
+    boards_values_keys = np.array([
+        [_VALUE_KEYS[value] for value in values]
+        for values in combinations_with_replacement(card_values, 5)
+        if max(values.count(value) for value in values) <= 4
+    ], dtype=np.int64)
+    boards_keys = boards_values_keys.sum(axis=1)
+    sorted_boards_keys = np.sort(boards_keys)
+    results = sorted({_VALUES_TABLE[key] for key in boards_keys.tolist()})
+    results_indexes = {result: index for index, result in enumerate(results)}
+    sorted_boards_keys_results = np.array(
+        [results_indexes[_VALUES_TABLE[key]] for key in sorted_boards_keys.tolist()],
+        dtype=np.uint16
+    )
+
+    triples_keys = np.stack([
+        boards_values_keys[:, list(positions)].sum(axis=1)
+        for positions in combinations(range(5), 3)
+    ], axis=1)
+    distinct_triples_keys, boards_triples = np.unique(triples_keys.ravel(), return_inverse=True)
+    pairs_keys = np.array([
+        _VALUE_KEYS[first] + _VALUE_KEYS[second]
+        for first, second in combinations_with_replacement(card_values, 2)
+    ], dtype=np.int64)
+    # More than 4 cards of a value can't happen, whatever is found for them is never looked up
+    triples_pairs_results = sorted_boards_keys_results[np.minimum(
+        np.searchsorted(sorted_boards_keys, distinct_triples_keys[:, np.newaxis] + pairs_keys),
+        len(sorted_boards_keys) - 1
+    )]
+
+    return _OmahaTables(
+        boards_indexes={key: index for index, key in enumerate(boards_keys.tolist())},
+        pairs_indexes={key: index for index, key in enumerate(pairs_keys.tolist())},
+        best_results=triples_pairs_results[boards_triples.reshape(triples_keys.shape)].max(axis=1),
+        results=results,
+        scores=[hand_score(result) for result in results]
+    )
+
+
+def analyse_omaha_board(community_cards) -> OmahaBoardAnalysis:
+    """
+    :return: either the index in _omaha_tables().results of the best combination without flush for each pair of
+        values when there are 5 community cards, or the distinct keys of the values of the triples of community cards.
+        And for each suit that has at least 3 community cards, the bits of the values of its triples.
+    """
+    suited_bits = {}
+    for suit in range(len(suits)):
+        suited_cards = [card for card in community_cards if card & 3 == suit]
+        if len(suited_cards) >= 3:
+            suited_bits[suit] = [
+                _CARD_BITS[first] | _CARD_BITS[second] | _CARD_BITS[third]
+                for first, second, third in combinations(suited_cards, 3)
+            ]
+
+    if len(community_cards) == 5:
+        omaha_tables = _omaha_tables()
+        board_index = omaha_tables.boards_indexes[sum(_CARD_KEYS[card] for card in community_cards)]
+        return OmahaBoardAnalysis(
+            values_keys=None,
+            pairs_results=omaha_tables.best_results[board_index].tolist(),
+            suited_bits=suited_bits
         )
-        two_cards_sequences_in_reverse_value_order = sorted(
-            filter(lambda seq: len(seq) == 2, longest_same_card_sequences),
-            key=lambda seq: seq[0].value,
-            reverse=True
+    return OmahaBoardAnalysis(
+        values_keys={
+            sum(_CARD_KEYS[card] for card in triple)
+            for triple in combinations(community_cards, min(3, len(community_cards)))
+        },
+        pairs_results=None,
+        suited_bits=suited_bits
+    )
+
+
+def best_omaha_score(hole_cards, board_analysis: OmahaBoardAnalysis) -> int:
+    """
+    :return: the hand_score of the best combination of two of the hole cards and three of the community cards
+    """
+    flush_scores, values_scores = _standard_score_tables()
+    pairs = list(combinations(hole_cards, 2))
+    if board_analysis.pairs_results is not None:
+        omaha_tables = _omaha_tables()
+        pairs_results, pairs_indexes = board_analysis.pairs_results, omaha_tables.pairs_indexes
+        best = omaha_tables.scores[max(
+            pairs_results[pairs_indexes[_CARD_KEYS[first] + _CARD_KEYS[second]]]
+            for first, second in pairs
+        )]
+    else:
+        best = max(
+            values_scores[_CARD_KEYS[first] + _CARD_KEYS[second] + triple_key]
+            for first, second in pairs
+            for triple_key in board_analysis.values_keys
         )
-        if len(two_cards_sequences_in_reverse_value_order) >= 2:
-            highest_pair_value = two_cards_sequences_in_reverse_value_order[0][0].value
-            second_highest_pair_value = two_cards_sequences_in_reverse_value_order[1][0].value
-            all_values = {card.value for card in ordered_cards}
-            return Result(
-                Combinations.TWO_PAIRS,
-                (
-                    highest_pair_value,
-                    second_highest_pair_value,
-                    max(all_values - {highest_pair_value, second_highest_pair_value})
-                )
-            )
+    if board_analysis.suited_bits:
+        for first, second in pairs:
+            suit = first & 3
+            if suit == second & 3 and suit in board_analysis.suited_bits:
+                pair_bits = _CARD_BITS[first] | _CARD_BITS[second]
+                for triple_bits in board_analysis.suited_bits[suit]:
+                    best = max(best, flush_scores[pair_bits | triple_bits])
+    return best
+
+
+def best_omaha_combination(hole_cards, board_analysis: OmahaBoardAnalysis) -> Result:
+    return decode_hand_score(best_omaha_score(hole_cards, board_analysis))
+
+
+"""
+Keys of the values for evaluate_many, only unique for exactly 7 cards but small enough (at most 7825759) to index an
+array directly
+"""
+_SEVEN_CARDS_VALUE_KEYS = dict(zip(
+    card_values,
+    (0, 1, 5, 22, 98, 453, 2031, 8698, 22854, 83661, 262349, 636345, 1479181)
+))
+
+_HandArrays = namedtuple(
+    "_HandArrays",
+    "card_keys sorted_values_keys values_scores "
+    "card_seven_cards_keys seven_cards_classes classes_scores "
+    "card_suited_bits flush_scores"
+)
+
+
+@lru_cache(maxsize=None)
+def _hand_arrays() -> _HandArrays:
+    """
+    The hand tables as numpy arrays of hand scores, built on first use as only evaluate_many needs them:
+     - values_scores, the scores of _VALUES_TABLE, in the order of its sorted keys
+     - seven_cards_classes, indexed by the seven cards keys of the values of 7 cards. As only a few thousand different
+       scores exist, it holds the index of the score in classes_scores rather than the score itself to save memory
+     - flush_scores, indexed by the bits of the values of one suit
+    """
+    sorted_values_keys = np.array(sorted(_VALUES_TABLE), dtype=np.int64)
+    values_scores = np.array(
+        [hand_score(_VALUES_TABLE[values_key]) for values_key in sorted_values_keys.tolist()],
+        dtype=np.int32
+    )
+
+    # Number of cards of each value, from the digits of the keys in base 5
+    values_counts = np.stack(
+        [sorted_values_keys // _VALUE_KEYS[value] % 5 for value in card_values],
+        axis=1
+    )
+    seven_cards = values_counts.sum(axis=1) == 7
+    seven_cards_keys = values_counts[seven_cards] @ np.array(list(_SEVEN_CARDS_VALUE_KEYS.values()), dtype=np.int64)
+    classes_scores, seven_cards_classes_scores = np.unique(values_scores[seven_cards], return_inverse=True)
+    seven_cards_classes = np.zeros(seven_cards_keys.max() + 1, dtype=np.uint16)
+    seven_cards_classes[seven_cards_keys] = seven_cards_classes_scores
+
+    flush_scores = np.zeros(1 << len(card_values), dtype=np.int32)
+    for values_bits, result in _FLUSH_TABLE.items():
+        flush_scores[values_bits] = hand_score(result)
+
+    cards = range(len(_DECODED_CARDS))
+    return _HandArrays(
+        card_keys=np.array(_CARD_KEYS, dtype=np.int64),
+        sorted_values_keys=sorted_values_keys,
+        values_scores=values_scores,
+        card_seven_cards_keys=np.array(
+            [_SEVEN_CARDS_VALUE_KEYS[decode_card(card).value] for card in cards],
+            dtype=np.int64
+        ),
+        seven_cards_classes=seven_cards_classes,
+        classes_scores=classes_scores.astype(np.int32),
+        # Each suit gets its own 13 bits, so that summing the bits of a hand gives the values of all its suits at once
+        card_suited_bits=np.array(
+            [_CARD_BITS[card] << len(card_values) * (card & 3) for card in cards],
+            dtype=np.int64
+        ),
+        flush_scores=flush_scores
+    )
+
 
-    def check_one_pair(ordered_cards):
-        longest_same_card_sequences = get_sequences_in_len_reversed_order(
-            ordered_cards,
-            lambda card1, card2: card1.value == card2.value
+def _add_flush_scores(scores, suited_bits, flush_scores):
+    # If 5 cards share a suit, the flush (or straight flush) is always the best combination
+    one_suit_bits = (1 << len(card_values)) - 1
+    for suit_index in range(len(suits)):
+        np.maximum(
+            scores,
+            flush_scores[suited_bits >> len(card_values) * suit_index & one_suit_bits],
+            out=scores
         )
-        if len(longest_same_card_sequences[0]) == 2:
-            pair_value = longest_same_card_sequences[0][0].value
-            three_best_single_card_values = tuple(sorted(
-                {card.value for card in ordered_cards} - {pair_value},
-                reverse=True
-            )[0:3])
-            return Result(
-                Combinations.ONE_PAIR,
-                (pair_value,) + three_best_single_card_values
-            )
+    return scores
 
-    cards_in_order = sorted([Card(*card) for card in cards], reverse=True)
-
-    for check_combination in [
-        check_straight_flush,
-        check_four_of_a_kind,
-        check_full_house,
-        check_flush,
-        check_straight,
-        check_three_of_a_kind,
-        check_two_pairs,
-        check_one_pair
-    ]:
-        combination = check_combination(cards_in_order)
-        if combination:
-            return combination
-
-    return Result(
-        Combinations.HIGH_CARD,
-        tuple(sorted([card.value for card in cards_in_order], reverse=True)[0:5])
+
+def _hands_array(hands):
+    """
+    :param hands: array like of shape (N, number of cards), an empty one being no hand
+    """
+    hands = np.asarray(hands, dtype=np.intp)
+    if not hands.size and hands.ndim < 2:
+        return hands.reshape(0, 0)
+    if hands.ndim != 2:
+        raise ValueError(f"Expected one hand per row, in an array of shape (N, number of cards), got {hands.shape}")
+    return hands
+
+
+def analyse_many(hands):
+    """
+    Vectorized version of analyse_cards, for hands that will end up with 7 cards
+    :param hands: array like of shape (N, number of cards) of encoded cards, one hand per row
+    :return: (seven cards keys, suited bits) pair of arrays of shape (N,). Suited bits hold the values of each suit on
+        13 bits. Both can be summed with the ones of other cards to analyse more cards
+    """
+    hand_arrays = _hand_arrays()
+    hands = _hands_array(hands)
+    return hand_arrays.card_seven_cards_keys[hands].sum(axis=1), hand_arrays.card_suited_bits[hands].sum(axis=1)
+
+
+def evaluate_many_from_analysis(seven_cards_keys, suited_bits):
+    """
+    Vectorized version of best_combination_from_analysis, for analyses of exactly 7 cards
+    :return: array of the hand_score of each analysed hand
+    """
+    hand_arrays = _hand_arrays()
+    return _add_flush_scores(
+        hand_arrays.classes_scores[hand_arrays.seven_cards_classes[seven_cards_keys]],
+        suited_bits,
+        hand_arrays.flush_scores
+    )
+
+
+def evaluate_many_players(players_cards, boards):
+    """
+    Vectorized evaluation of the hands of players sharing the community cards
+    :param players_cards: array like of shape (number of players, N, number of hole cards) of encoded cards, or of shape
+        (number of players, number of hole cards) when each player has the same cards with every board
+    :param boards: array like of shape (N, 7 - number of hole cards) of encoded cards
+    :return: array of shape (number of players, N) of the hand_score of each player with each board
+    """
+    # All players share the community cards: analyse them once, then add each player's cards
+    boards_keys, boards_bits = analyse_many(boards)
+    players_cards = np.asarray(players_cards, dtype=np.intp)
+    scores = np.empty((len(players_cards), len(boards_keys)), dtype=np.int64)
+    for player, cards in enumerate(players_cards):
+        player_keys, player_bits = analyse_many(cards.reshape(-1, cards.shape[-1]))
+        scores[player] = evaluate_many_from_analysis(boards_keys + player_keys, boards_bits + player_bits)
+    return scores
+
+
+def evaluate_many(hands):
+    """
+    Vectorized version of best_combination, for bulk evaluations (analytics, simulations, ...)
+    :param hands: array like of shape (N, up to 7) of encoded cards, one hand per row
+    :return: array of shape (N,) of the hand_score of each hand
+    """
+    hands = _hands_array(hands)
+    if hands.shape[1] == 7:
+        return evaluate_many_from_analysis(*analyse_many(hands))
+    hand_arrays = _hand_arrays()
+    return _add_flush_scores(
+        hand_arrays.values_scores[
+            np.searchsorted(hand_arrays.sorted_values_keys, hand_arrays.card_keys[hands].sum(axis=1))
+        ],
+        hand_arrays.card_suited_bits[hands].sum(axis=1),
+        hand_arrays.flush_scores
     )
 
 
 def end_game(state):
     state["game_state"] = GameState.GAME_OVER
+    state.pop("hands_analyses", None)
+    state.pop("outs", None)
     state["results"] = generate_end_game_results(state)
-    if state["game_type"] == "normal":
+    if plays_with_stacks(state):
         return Event.make_event(Event.RESOLVE_STACKS), state
     return None, state
 
 
-def deal_pot(ranking, commits, players_stacks, pot):
-    if pot == 0 or ranking == []:
-        return
-
-    winners_ids = ranking[0]
-
-    smallest_winner = sorted(
-        winners_ids,
-        key=lambda w_id: commits[w_id],
-        reverse=True
-    )[0]
-    smallest_winner_commit = commits[smallest_winner]
-
-    smallest_winner_pot = 0
-    for _ in commits:  # Read "for _ in players" but we don't have access to players here
-        pot_pull = smallest_winner_commit if smallest_winner_commit <= pot else pot
-        pot = pot - pot_pull
-        smallest_winner_pot = smallest_winner_pot + min(smallest_winner_commit, pot_pull)
-
-    for winner_id in winners_ids:
-        players_stacks[winner_id] += int(smallest_winner_pot/len(winners_ids))
-
-    ranking[0].remove(smallest_winner)
-    del commits[smallest_winner]
-    if not ranking[0]:
-        ranking = ranking[1:]
-    deal_pot(
-        ranking,
-        commits,
-        players_stacks,
-        pot
+def build_pots(commits, ranking, folded_players_ids=()):
+    """
+    The main pot and the side pots, as layers of the commitments: sorted once, each player that is still in the game
+    closes a pot at their commitment, that pot holding what every player committed between the previous pot and it.
+    A pot is won by the best ranked players still in the game who committed to it, the odd chips going to the first
+    ones in the ranking. Pots no such player committed to (uncalled bets of players who folded) are given back.
+    :param commits: amount committed by each player id
+    :param ranking: lists of player ids, from the best hands to the worst, see generate_end_game_results
+    :param folded_players_ids: players who can't win a pot
+    :return: list of pots, from the main pot to the last side pot: dicts with the amount, the ids of the players who
+        could win it, and of the winners
+    """
+    ranks = {player_id: rank for rank, players_ids in enumerate(ranking) for player_id in players_ids}
+    folded_players_ids = set(folded_players_ids)
+    committed = sorted(
+        ((commit, player_id) for player_id, commit in commits.items() if commit > 0),
+        key=lambda commit_and_player_id: commit_and_player_id[0]
     )
+    # Best rank of the players who can win and committed at least as much as each player, from the last one
+    best_ranks = [None] * (len(committed) + 1)
+    for index in range(len(committed) - 1, -1, -1):
+        player_id = committed[index][1]
+        best_ranks[index] = best_ranks[index + 1]
+        if player_id in ranks and player_id not in folded_players_ids and (
+                best_ranks[index] is None or ranks[player_id] < best_ranks[index]):
+            best_ranks[index] = ranks[player_id]
+
+    pots = []
+    amount = 0
+    level = 0
+    for index, (commit, player_id) in enumerate(committed):
+        amount += (commit - level) * (len(committed) - index)
+        level = commit
+        best_rank = best_ranks[index]
+        can_win = player_id in ranks and player_id not in folded_players_ids
+        if not amount or not can_win and best_ranks[index + 1] is not None:
+            continue
+        contributors_ids = [contributor_id for _, contributor_id in committed[index:]]
+        if best_rank is None:
+            players_ids = winners_ids = contributors_ids
+        else:
+            players_ids = [
+                contributor_id for contributor_id in contributors_ids
+                if contributor_id in ranks and contributor_id not in folded_players_ids
+            ]
+            winners_ids = [
+                winner_id for winner_id in ranking[best_rank]
+                if winner_id not in folded_players_ids and commits.get(winner_id, 0) >= level
+            ]
+        pots.append({"amount": amount, "players": players_ids, "winners": winners_ids})
+        amount = 0
+    return pots
+
+
+def pay_pots(pots, players_stacks):
+    for pot in pots:
+        share, odd_chips = divmod(pot["amount"], len(pot["winners"]))
+        for position, winner_id in enumerate(pot["winners"]):
+            players_stacks[winner_id] += share + (position < odd_chips)
+
+
+def build_split_pots(ranking, low_ranking, commits, folded_players_ids=()):
+    """
+    Hi/Lo: the pots are built from the whole commitments, then each is split in two halves, the odd chip going to the
+    high one. High halves are won by the high ranking, and low halves by the low ranking. Players that don't have a low
+    follow the low ranking, in the order of the high ranking: a low half no low hand competes for goes to the best high
+    hand in the pot. Pots given back (see build_pots) are not split, their low half is empty.
+    :return: the high pots and the low pots, the low half of each high pot being at the same index, see build_pots
+    """
+    can_win = {player_id for players_ids in ranking for player_id in players_ids} - set(folded_players_ids)
+    players_with_low = {player_id for players_ids in low_ranking for player_id in players_ids}
+    low_then_high_ranking = [list(players_ids) for players_ids in low_ranking] + [
+        remaining_players_ids
+        for remaining_players_ids in (
+            [player_id for player_id in players_ids if player_id not in players_with_low]
+            for players_ids in ranking
+        )
+        if remaining_players_ids
+    ]
+    high_pots, low_pots = [], []
+    for pot in build_pots(commits, ranking, folded_players_ids):
+        players_ids = set(pot["players"]) & can_win
+        if not players_ids:
+            high_pots.append(pot)
+            low_pots.append({"amount": 0, "players": pot["players"], "winners": pot["winners"]})
+            continue
+        low_amount = pot["amount"] // 2
+        high_pots.append({**pot, "amount": pot["amount"] - low_amount})
+        low_pots.append({
+            "amount": low_amount,
+            "players": pot["players"],
+            "winners": next(
+                low_winners_ids
+                for low_winners_ids in (
+                    [player_id for player_id in ranked_ids if player_id in players_ids]
+                    for ranked_ids in low_then_high_ranking
+                )
+                if low_winners_ids
+            )
+        })
+    return high_pots, low_pots
 
 
 def resolve_stacks(state):
+    """
+    The pots are kept in the results, and the low pots too in Hi/Lo, see build_pots
+    """
     if state["game_state"] != GameState.GAME_OVER:
         raise EventRejected("Trying to resolve stacks for a game that is not over")
 
@@ -914,15 +1962,25 @@ def resolve_stacks(state):
         players_stacks[player_id] -= players[player_id]["committed_by"]
 
     # Now deal the pot
-    pot = sum(players[player_id]["committed_by"] for player_id in players)
     commits = {
         player_id: players[player_id]["committed_by"]
         for player_id in players
         if "committed_by" in players[player_id]
     }
+    folded_players_ids = find_player_ids_if(players, lambda player: player["state"] == PlayerState.FOLDED)
 
-    deal_pot(copy.deepcopy(state["results"]["ranking"]), commits, players_stacks, pot)
+    results = state["results"]
+    if results.get("low_ranking"):
+        results["pots"], results["low_pots"] = build_split_pots(
+            results["ranking"], results["low_ranking"], commits, folded_players_ids
+        )
+        pay_pots(results["low_pots"], players_stacks)
+    else:
+        results["pots"] = build_pots(commits, results["ranking"], folded_players_ids)
+    pay_pots(results["pots"], players_stacks)
 
+    # Who is all in depends on the stacks
+    update_betting(state)
     players_at_0_stack = [player_id for player_id in players if players_stacks[player_id] == 0]
 
     return (
@@ -934,7 +1992,12 @@ def resolve_stacks(state):
 
 
 def get_raise_limit(state, player_id):
-    if state["game_type"] == "normal":
+    if state["game_type"] == "omaha":
+        # Pot limit: call, then raise by the size of the pot once called
+        max_bet = get_max_bet(state)
+        pot_limit = max_bet + get_pot(state) + max_bet - state["players"][player_id].get("committed_by", 0)
+        return min(state["players_stacks"][player_id], pot_limit)
+    elif plays_with_stacks(state):
         return state["players_stacks"][player_id]
     else:
         return state["all_in"]
@@ -948,7 +2011,7 @@ def player_raise(state, player_id, amount):
         else:
             return 0
 
-    new_committed_by = amount if state["game_type"] != "normal" else (amount + committed_by_or_0())
+    new_committed_by = amount if not plays_with_stacks(state) else (amount + committed_by_or_0())
 
     if player_id not in state["players"]:
         raise EventRejected(f"Unknown player {player_id} trying to raise")
@@ -959,17 +2022,17 @@ def player_raise(state, player_id, amount):
     elif new_committed_by > get_raise_limit(state, player_id):
         raise EventRejected(f"Player {player_id} trying to raise over limit")
 
-    state["players"][player_id]["committed_by"] = new_committed_by
+    set_committed_by(state, player_id, new_committed_by)
 
     (players_after_current_not_folded,
      players_before_current_not_folded_not_aligned) = determine_next_players_for_this_round(state, player_id)
 
-    state["players"][player_id]["state"] = PlayerState.IN_GAME
+    set_player_state(state, player_id, PlayerState.IN_GAME)
     next_player_id = (
         players_after_current_not_folded[0] if players_after_current_not_folded
         else players_before_current_not_folded_not_aligned[0]
     )
-    state["players"][next_player_id]["state"] = PlayerState.MY_TURN
+    set_player_state(state, next_player_id, PlayerState.MY_TURN)
 
     return None, state
 
@@ -998,82 +2061,213 @@ def players_lost(state, players_ids: List[str]):
     )
 
 
-def process_event(state, event):
+"""
+Handler of each type of event, taking the state and the event, and returning the (generated event or None, new state)
+pair. Handlers are looked up by name when called so they can be patched.
+"""
+EVENT_HANDLERS = {
+    Event.PLAYER_SIT: lambda state, event: sit_player(
+        state,
+        event["player_id"],
+        event["parameters"]["player_name"],
+        event["parameters"]["seat_number"]
+    ),
+    Event.PLAYER_LEAVE: lambda state, event: exclude_player(state, event["player_id"]),
+    Event.START_GAME: lambda state, event: start_game(state),
+    Event.FOLD: lambda state, event: fold_player(state, event["player_id"]),
+    Event.PLAYER_READY_FOR_NEXT_GAME: lambda state, event: player_ready(state, event["player_id"]),
+    Event.CHECK: lambda state, event: player_check(state, event["player_id"]),
+    Event.DRAW_FLOP: lambda state, event: draw_flop(state),
+    Event.DRAW_RIVER: lambda state, event: draw_river(state),
+    Event.DRAW_TURN: lambda state, event: draw_turn(state),
+    Event.CALL: lambda state, event: player_call(state, event["player_id"]),
+    Event.RAISE: lambda state, event: player_raise(state, event["player_id"], event["parameters"]["amount"]),
+    Event.END_GAME: lambda state, event: end_game(state),
+    Event.SHOW_CARDS: lambda state, event: show_cards(state, event["player_id"]),
+    Event.RESOLVE_STACKS: lambda state, event: resolve_stacks(state),
+    Event.PLAYERS_LOST: lambda state, event: players_lost(state, event["players_ids"]),
+}
+
+"""
+Parameters the handlers use, by type of event
+"""
+EVENT_PARAMETERS = {
+    Event.PLAYER_SIT: ("player_name", "seat_number"),
+    Event.RAISE: ("amount",),
+}
+
+
+def event_parameters(event_type, parameters):
+    """
+    :param parameters: parameters of an event of event_type sent by a client
+    :return: the ones the handler of event_type uses, so that only those are processed and logged
+    """
+    return {key: parameters[key] for key in EVENT_PARAMETERS.get(event_type, ()) if key in parameters}
+
+
+class EventLoopStats:
+    """
+    For each type of event given to process_event, how many were processed and how many events they generated, for
+    profiling
+    """
+
+    def __init__(self):
+        self._processed = Counter()
+        self._generated = Counter()
+        self._max_generated = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, event_type, generated):
+        with self._lock:
+            self._processed[event_type] += 1
+            self._generated[event_type] += generated
+            self._max_generated[event_type] = max(self._max_generated[event_type], generated)
+
+    def stats(self):
+        with self._lock:
+            return {
+                getattr(event_type, "name", event_type): {
+                    "processed": processed,
+                    "generated": self._generated[event_type],
+                    "max_generated": self._max_generated[event_type],
+                    "generated_per_event": self._generated[event_type] / processed
+                }
+                for event_type, processed in self._processed.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._processed.clear()
+            self._generated.clear()
+            self._max_generated.clear()
+
+
+event_loop_stats = EventLoopStats()
+
+
+def _run_event_loop(state, event):
+    """
+    :return: the state after the event and all the events it generated, and the number of generated events
+    """
+    generated = -1
+    pending_events = [event]
+    while pending_events:
+        event = pending_events.pop()
+        generated += 1
+        if event["type"] == Event.MULTI_EVENT:
+            pending_events.extend(reversed(event["events"]))
+            continue
+        handler = EVENT_HANDLERS.get(event["type"])
+        if handler is None:
+            print(f"WARNING: unknown event type: {event['type']}")
+            continue
+        event, state = handler(state, event)
+        if event:
+            pending_events.append(event)
+    return state, generated
+
+
+def process_event(state, event, hand_seed=None):
     """
     Event loop.
-    Event are processed, and if the processing of an event generates an event, then it is processed too before
-    returning to the caller (recursive).
-    Note that it processes MULTI_EVENTs, which combines one or more events, in a list. In that case itill process the
+    Events are processed, and if the processing of an event generates an event, then it is processed too before
+    returning to the caller.
+    Note that it processes MULTI_EVENTs, which combines one or more events, in a list. In that case it will process the
     first event of the list, and all the events it generates, then move on to processing the second and all the events
     the processing generates, then ...
+    Pending events are kept on a stack rather than processed by recursion, so that long chains of events don't go deep
+    in the Python stack.
+    Processing is a transaction: if any of the events is rejected, the state is rolled back to what it was, using the
+    undo log of the state (see journal), which is journaled first if it isn't already. States kept in memory from one
+    event to the next should be the returned ones.
+    :param hand_seed: if given, the seed of the hand the event starts, if it starts one, so that processing the same
+        event on the same state with it gives the same state (see replay_events). Drawn with draw_hand_seed otherwise
     """
-    if event["type"] == Event.PLAYER_SIT:
-        event, new_state = sit_player(
-            state,
-            event["player_id"],
-            event["parameters"]["player_name"],
-            event["parameters"]["seat_number"]
-        )
-    elif event["type"] == Event.PLAYER_LEAVE:
-        event, new_state = exclude_player(
-            state,
-            event["player_id"]
-        )
-    elif event["type"] == Event.START_GAME:
-        event, new_state = start_game(state)
-    elif event["type"] == Event.FOLD:
-        event, new_state = fold_player(
-            state,
-            event["player_id"]
-        )
-    elif event["type"] == Event.PLAYER_READY_FOR_NEXT_GAME:
-        event, new_state = player_ready(
-            state,
-            event["player_id"]
-        )
-    elif event["type"] == Event.CHECK:
-        event, new_state = player_check(
-            state,
-            event["player_id"]
-        )
-    elif event["type"] == Event.DRAW_FLOP:
-        event, new_state = draw_flop(state)
-    elif event["type"] == Event.DRAW_RIVER:
-        event, new_state = draw_river(state)
-    elif event["type"] == Event.DRAW_TURN:
-        event, new_state = draw_turn(state)
-    elif event["type"] == Event.CALL:
-        event, new_state = player_call(
-            state,
-            event["player_id"]
-        )
-    elif event["type"] == Event.RAISE:
-        event, new_state = player_raise(
-            state,
-            event["player_id"],
-            event["parameters"]["amount"],
-        )
-    elif event["type"] == Event.END_GAME:
-        event, new_state = end_game(state)
-    elif event["type"] == Event.SHOW_CARDS:
-        event, new_state = show_cards(
-            state,
-            event["player_id"]
-        )
-    elif event["type"] == Event.RESOLVE_STACKS:
-        event, new_state = resolve_stacks(state)
-    elif event["type"] == Event.PLAYERS_LOST:
-        event, new_state = players_lost(state, event["players_ids"])
-    elif event["type"] == Event.MULTI_EVENT:
-        new_state = state
-        for one_event in event["events"]:
-            new_state = process_event(new_state, one_event)
-        event = None
-    else:
-        print(f"WARNING: unknown event type: {event['type']}")
-        event, new_state = None, state
+    input_event_type = event["type"]
+    state = journaled(state) if isinstance(state, dict) else state
+    transaction = isinstance(state, JournaledDict) and not state.journal.in_transaction()
+    if transaction:
+        state.journal.begin()
+    previous_hand_seed = getattr(_seeded, "hand_seed", None)
+    _seeded.hand_seed = hand_seed
+    try:
+        state, generated = _run_event_loop(state, event)
+    except Exception:
+        if transaction:
+            state.journal.rollback()
+        raise
+    finally:
+        _seeded.hand_seed = previous_hand_seed
+    if transaction and isinstance(state, JournaledDict):
+        state.journal.commit()
+    event_loop_stats.record(input_event_type, generated)
+    return state
 
-    if event:
-        return process_event(new_state, event)
-    else:
-        return new_state
+
+def _event_to_json(event):
+    return {
+        key: [_event_to_json(sub_event) for sub_event in value] if key == "events"
+        else value.name if key == "type"
+        else value
+        for key, value in event.items()
+    }
+
+
+def _event_from_json(event):
+    return {
+        key: [_event_from_json(sub_event) for sub_event in value] if key == "events"
+        else Event[value] if key == "type"
+        else value
+        for key, value in event.items()
+    }
+
+
+def encode_event(event):
+    """
+    :return: JSON of an event, types being stored by name, see decode_event
+    """
+    return json.dumps(_event_to_json(event), separators=(",", ":"))
+
+
+def decode_event(text):
+    return _event_from_json(json.loads(text))
+
+
+def replay_events(state, logged_events):
+    """
+    Rebuilds a table from a snapshot of its state. As in replay, the events having been accepted already, they are
+    processed without the undo log of process_event, nor counted in event_loop_stats
+    :param logged_events: iterable of (event, hand seed), the events accepted on the state and the seeds of the hands
+        they started, None for the ones that didn't start a hand, see process_event
+    :return: the state as it was after the last event, the given state being updated in place
+    """
+    previous_hand_seed = getattr(_seeded, "hand_seed", None)
+    try:
+        for event, hand_seed in logged_events:
+            _seeded.hand_seed = hand_seed
+            state, _ = _run_event_loop(state, event)
+    finally:
+        _seeded.hand_seed = previous_hand_seed
+    return state
+
+
+def replay(seed, events, state=None):
+    """
+    Rebuilds a hand, dealt again from the same deck. The events having been accepted already, they are processed
+    without the undo log process_event keeps in case they are rejected
+    :param seed: the hand_seed of the hand
+    :param events: the events played, from the one that started the hand. Hands started after the first one are dealt
+        from new seeds
+    :param state: the state of the table before the hand started, which is updated in place, a new drinking table by
+        default
+    :return: the state after the last event
+    """
+    state = initial_state() if state is None else state
+    previous_hand_seed = getattr(_seeded, "hand_seed", None)
+    _seeded.hand_seed = seed
+    try:
+        for event in events:
+            state, _ = _run_event_loop(state, event)
+    finally:
+        _seeded.hand_seed = previous_hand_seed
+    return state
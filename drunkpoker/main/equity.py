@@ -0,0 +1,379 @@
+"""
+Equity of the players of a hand: how likely each of them is to win, given the cards that are already known.
+Estimated by dealing random runouts of the community cards, spread over a pool of processes, or computed exactly when
+only a few community cards are missing.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, List
+import asyncio
+import itertools
+import os
+import numpy as np
+
+from drunkpoker.main import engine
+
+
+"""
+win: probability to win the whole pot, tie: probability to share it with other players
+"""
+Equity = namedtuple("Equity", "win tie")
+
+DEFAULT_SAMPLES = 50000
+
+# Runouts are simulated by chunks, each with its own seed derived from the seed of the estimation: results only depend
+# on the seed and the number of samples, not on how many processes are used
+SAMPLES_PER_CHUNK = 5000
+
+# Up to that many missing community cards, all runouts are evaluated rather than sampled
+EXACT_EQUITY_MAX_MISSING_CARDS = 2
+
+EXACT_EQUITY_CACHE_SIZE = 4096
+
+EQUITY_PROCESSES = int(os.environ.get("EQUITY_PROCESSES", os.cpu_count() or 1))
+
+# Equities are the ones of Texas hold'em: 2 hole cards, the whole deck and the usual rankings
+GAME_TYPES = ("drinking", "normal")
+HOLE_CARDS = 2
+
+_executor = None
+
+
+def _warm_up():
+    # Hand arrays are built on first use, do it when the process starts rather than during the first estimation
+    engine.analyse_many([engine.deck[0:7]])
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Process pool shared by all estimations, created on first use
+    """
+    global _executor
+    if _executor is None:
+        _warm_up()
+        _executor = ProcessPoolExecutor(max_workers=EQUITY_PROCESSES, initializer=_warm_up)
+    return _executor
+
+
+def draw_without_replacement(rng, population_size, samples, how_many, excluded=None):
+    """
+    :param excluded: array of shape (samples, number of excluded indexes), indexes that can't be drawn in each row
+    :return: array of shape (samples, how_many), each row being how_many different indexes in [0, population_size)
+    """
+    if excluded is None:
+        excluded = np.empty((samples, 0), dtype=np.intp)
+    drawn = np.hstack([excluded, np.empty((samples, how_many), dtype=np.intp)])
+    for column in range(excluded.shape[1], drawn.shape[1]):
+        # Draw among the indexes not drawn yet, then skip the ones already drawn, smallest first
+        index = rng.integers(0, population_size - column, samples)
+        for already_drawn in np.sort(drawn[:, :column], axis=1).T:
+            index += index >= already_drawn
+        drawn[:, column] = index
+    return drawn[:, excluded.shape[1]:]
+
+
+def count_wins(players_cards, community_cards, runouts):
+    """
+    :param runouts: array of shape (number of runouts, number of missing community cards)
+    :return: (wins, ties) arrays with, for each player, how many runouts they won and how many they tied
+    """
+    scores = engine.evaluate_many_players(
+        players_cards,
+        np.hstack([np.tile(np.asarray(community_cards, dtype=np.intp), (len(runouts), 1)), runouts])
+    )
+    winners = scores == scores.max(axis=0)
+    shared = winners.sum(axis=0) > 1
+    return (winners & ~shared).sum(axis=1), (winners & shared).sum(axis=1)
+
+
+def simulate_runouts(players_cards, community_cards, remaining_cards, samples, seed):
+    """
+    Deals samples random runouts of the community cards from remaining_cards
+    :return: see count_wins
+    """
+    rng = np.random.default_rng(seed)
+    remaining_cards = np.asarray(remaining_cards, dtype=np.intp)
+    return count_wins(
+        players_cards,
+        community_cards,
+        remaining_cards[draw_without_replacement(rng, len(remaining_cards), samples, 5 - len(community_cards))]
+    )
+
+
+def _remaining_cards(players_cards, community_cards, dead_cards):
+    if any(len(cards) != HOLE_CARDS for cards in players_cards):
+        raise ValueError(f"Players must have {HOLE_CARDS} cards")
+    known_cards = set(community_cards) | set(dead_cards) | {card for cards in players_cards for card in cards}
+    if len(known_cards) != len(community_cards) + len(dead_cards) + sum(len(cards) for cards in players_cards):
+        raise ValueError("The same card can't be dealt twice")
+    return [card for card in engine.deck if card not in known_cards]
+
+
+def _chunks(players_cards, community_cards, dead_cards, samples, seed):
+    remaining_cards = _remaining_cards(players_cards, community_cards, dead_cards)
+    chunks_samples = [SAMPLES_PER_CHUNK] * (samples // SAMPLES_PER_CHUNK) + (
+        [samples % SAMPLES_PER_CHUNK] if samples % SAMPLES_PER_CHUNK else []
+    )
+    return [
+        (players_cards, list(community_cards), remaining_cards, chunk_samples, chunk_seed)
+        for chunk_samples, chunk_seed in zip(
+            chunks_samples,
+            np.random.SeedSequence(seed).spawn(len(chunks_samples))
+        )
+    ]
+
+
+def _equities(players_ids, samples, chunks_results) -> Dict[str, Equity]:
+    wins = sum(chunk_wins for chunk_wins, _ in chunks_results)
+    ties = sum(chunk_ties for _, chunk_ties in chunks_results)
+    return {
+        player_id: Equity(win=int(wins[index]) / samples, tie=int(ties[index]) / samples)
+        for index, player_id in enumerate(players_ids)
+    }
+
+
+_SUITS_PERMUTATIONS = [
+    tuple(card & ~3 | permutation[card & 3] for card in range(len(engine.deck)))
+    for permutation in itertools.permutations(range(len(engine.suits)))
+]
+
+
+def canonical_hand(players_cards, community_cards, dead_cards):
+    """
+    Suits don't matter by themselves, only which cards share one: hands that only differ by a permutation of the suits
+    have the same equity. Their canonical form is the smallest of their 24 versions, once cards of each group are
+    sorted (players keep their order)
+    """
+    return min(
+        (
+            tuple(tuple(sorted(permutation[card] for card in cards)) for cards in players_cards),
+            tuple(sorted(permutation[card] for card in community_cards)),
+            tuple(sorted(permutation[card] for card in dead_cards))
+        )
+        for permutation in _SUITS_PERMUTATIONS
+    )
+
+
+@lru_cache(maxsize=EXACT_EQUITY_CACHE_SIZE)
+def _exact_wins(players_cards, community_cards, dead_cards):
+    missing = 5 - len(community_cards)
+    runouts = list(itertools.combinations(_remaining_cards(players_cards, community_cards, dead_cards), missing))
+    wins, ties = count_wins(
+        players_cards,
+        community_cards,
+        np.array(runouts, dtype=np.intp).reshape(len(runouts), missing)
+    )
+    return tuple(wins.tolist()), tuple(ties.tolist()), len(runouts)
+
+
+def exact_equity(players_cards: Dict[str, List[int]], community_cards, dead_cards=()) -> Dict[str, Equity]:
+    """
+    Equity computed over every possible runout, meant for when few community cards are missing (at most 990 runouts
+    with 2 missing cards). Results are cached by canonical_hand, as the same spots come up again and again
+    """
+    players_ids = list(players_cards)
+    wins, ties, runouts = _exact_wins(*canonical_hand(
+        [players_cards[player_id] for player_id in players_ids],
+        community_cards,
+        dead_cards
+    ))
+    return {
+        player_id: Equity(win=wins[index] / runouts, tie=ties[index] / runouts)
+        for index, player_id in enumerate(players_ids)
+    }
+
+
+def estimate_equity(
+        players_cards: Dict[str, List[int]],
+        community_cards=(),
+        dead_cards=(),
+        samples=DEFAULT_SAMPLES,
+        seed=0,
+        executor=None
+) -> Dict[str, Equity]:
+    """
+    :param players_cards: cards of each player still in the hand, by player id
+    :param dead_cards: cards known to be out of the deck, like cards of the players who folded
+    :param executor: where to run the simulations, the shared process pool by default
+    Exact when at most EXACT_EQUITY_MAX_MISSING_CARDS community cards are missing
+    """
+    if 5 - len(community_cards) <= EXACT_EQUITY_MAX_MISSING_CARDS:
+        return exact_equity(players_cards, community_cards, dead_cards)
+    players_ids = list(players_cards)
+    chunks = _chunks([players_cards[player_id] for player_id in players_ids],
+                     community_cards, dead_cards, samples, seed)
+    executor = executor or get_executor()
+    futures = [executor.submit(simulate_runouts, *chunk) for chunk in chunks]
+    return _equities(players_ids, samples, [future.result() for future in futures])
+
+
+async def estimate_equity_async(
+        players_cards: Dict[str, List[int]],
+        community_cards=(),
+        dead_cards=(),
+        samples=DEFAULT_SAMPLES,
+        seed=0,
+        executor=None
+) -> Dict[str, Equity]:
+    """
+    Same as estimate_equity, without blocking the event loop while the simulations run
+    """
+    if 5 - len(community_cards) <= EXACT_EQUITY_MAX_MISSING_CARDS:
+        return exact_equity(players_cards, community_cards, dead_cards)
+    players_ids = list(players_cards)
+    chunks = _chunks([players_cards[player_id] for player_id in players_ids],
+                     community_cards, dead_cards, samples, seed)
+    executor = executor or get_executor()
+    loop = asyncio.get_running_loop()
+    chunks_results = await asyncio.gather(*[
+        loop.run_in_executor(executor, simulate_runouts, *chunk) for chunk in chunks
+    ])
+    return _equities(players_ids, samples, chunks_results)
+
+
+"""
+Preflop equities of the 169 starting hands against each other, heads-up, precomputed by the generate_preflop_equity
+command in a flat binary file of float32: PREFLOP_EQUITY_SHAPE matrices, for the win then the tie probabilities of the
+row hand against the column hand.
+Starting hands are indexed like in the usual 13x13 grid, As first: pairs on the diagonal, suited hands above it (row of
+the highest card) and offsuit hands below it (row of the lowest card).
+"""
+PREFLOP_EQUITY_PATH = os.environ.get(
+    "PREFLOP_EQUITY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "preflop_equity.bin")
+)
+
+STARTING_HANDS = len(engine.card_values) ** 2
+
+PREFLOP_EQUITY_SHAPE = (2, STARTING_HANDS, STARTING_HANDS)
+
+PREFLOP_EQUITY_SAMPLES = 20000
+
+
+def starting_hand_index(cards) -> int:
+    (high_value, high_suit), (low_value, low_suit) = sorted(map(engine.decode_card, cards), reverse=True)
+    high_row, low_row = 14 - high_value, 14 - low_value
+    if high_suit == low_suit:
+        return high_row * len(engine.card_values) + low_row
+    return low_row * len(engine.card_values) + high_row
+
+
+@lru_cache(maxsize=None)
+def _starting_hands_combos():
+    combos = [[] for _ in range(STARTING_HANDS)]
+    for cards in itertools.combinations(engine.deck, 2):
+        combos[starting_hand_index(cards)].append(cards)
+    return combos
+
+
+def starting_hand_combos(index):
+    """
+    :return: list of all the pairs of cards for the starting hand at that index
+    """
+    return _starting_hands_combos()[index]
+
+
+@lru_cache(maxsize=None)
+def preflop_equity_matrix(path=PREFLOP_EQUITY_PATH):
+    """
+    Memory mapped, so that all processes share the one copy of the file in the page cache
+    """
+    try:
+        return np.memmap(path, dtype="<f4", mode="r", shape=PREFLOP_EQUITY_SHAPE)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"No preflop equity file at {path}, generate it with `python manage.py generate_preflop_equity`"
+        )
+
+
+def preflop_equity(cards, other_cards, path=PREFLOP_EQUITY_PATH) -> Equity:
+    """
+    Equity of a starting hand against another, heads-up, averaged over the suits of both hands
+    """
+    matrix = preflop_equity_matrix(path)
+    row, column = starting_hand_index(cards), starting_hand_index(other_cards)
+    return Equity(win=float(matrix[0, row, column]), tie=float(matrix[1, row, column]))
+
+
+def simulate_preflop_row(row, samples, seed):
+    """
+    Win and tie probabilities of the starting hand at index row against the ones at index row and above. Each is
+    estimated over samples random deals of both hands and of the community cards
+    :return: (wins, ties) arrays of length STARTING_HANDS - row
+    """
+    rng = np.random.default_rng(seed)
+    wins = np.empty(STARTING_HANDS - row)
+    ties = np.empty(STARTING_HANDS - row)
+    for column in range(row, STARTING_HANDS):
+        matchups = np.array([
+            combo + other_combo
+            for combo in starting_hand_combos(row)
+            for other_combo in starting_hand_combos(column)
+            if not set(combo) & set(other_combo)
+        ], dtype=np.intp)
+        dealt = matchups[rng.integers(0, len(matchups), samples)]
+        # Encoded cards go from 0 to 51, so indexes in the deck are cards
+        community_keys, community_bits = engine.analyse_many(
+            draw_without_replacement(rng, len(engine.deck), samples, 5, excluded=dealt)
+        )
+        hand_keys, hand_bits = engine.analyse_many(dealt[:, 0:2])
+        other_hand_keys, other_hand_bits = engine.analyse_many(dealt[:, 2:4])
+        scores = engine.evaluate_many_from_analysis(community_keys + hand_keys, community_bits + hand_bits)
+        other_scores = engine.evaluate_many_from_analysis(
+            community_keys + other_hand_keys,
+            community_bits + other_hand_bits
+        )
+        wins[column - row] = np.mean(scores > other_scores)
+        ties[column - row] = np.mean(scores == other_scores)
+    return wins, ties
+
+
+def compute_preflop_equity_matrix(samples=PREFLOP_EQUITY_SAMPLES, seed=0, executor=None):
+    """
+    :return: array of shape PREFLOP_EQUITY_SHAPE, rows being simulated in parallel in executor, the shared process
+        pool by default
+    """
+    executor = executor or get_executor()
+    matrix = np.empty(PREFLOP_EQUITY_SHAPE, dtype="<f4")
+    rows = range(STARTING_HANDS)
+    for row, (wins, ties) in zip(rows, executor.map(
+            simulate_preflop_row,
+            rows,
+            [samples] * STARTING_HANDS,
+            np.random.SeedSequence(seed).spawn(STARTING_HANDS)
+    )):
+        # What one hand wins, the other loses
+        matrix[0, row, row:] = wins
+        matrix[0, row:, row] = 1 - wins - ties
+        matrix[1, row, row:] = ties
+        matrix[1, row:, row] = ties
+        # Against itself, both hands are as likely to win
+        matrix[0, row, row] = (1 - ties[0]) / 2
+    return matrix
+
+
+def write_preflop_equity_matrix(matrix, path=PREFLOP_EQUITY_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.asarray(matrix, dtype="<f4").tofile(path)
+    preflop_equity_matrix.cache_clear()
+
+
+def players_cards_for_state(state):
+    """
+    :return: (cards of the players still in the hand by player id, cards of the players who folded) of a state
+    """
+    if state["game_type"] not in GAME_TYPES:
+        raise ValueError(f"No equity for {state['game_type']} games")
+    players_cards = {
+        player_id: player["cards"]
+        for player_id, player in state["players"].items()
+        if engine.PlayerState.could_play(player["state"]) and "cards" in player
+    }
+    folded_cards = [
+        card
+        for player in state["players"].values()
+        if player["state"] == engine.PlayerState.FOLDED and "cards" in player
+        for card in player["cards"]
+    ]
+    return players_cards, folded_cards
@@ -0,0 +1,163 @@
+"""
+Undo log for the states of the engine. The dicts and lists of a journaled state (see journaled) record the previous
+value of what they change while a transaction is open, so that a state can be rolled back to where it was when the
+transaction began without copying it beforehand: a rejected event leaves the state as it was.
+
+Containers added to a journaled state are plain ones, they are journaled in turn when the transaction is committed,
+or when the next one begins for the ones added out of transactions. A journaled state is still a dict of dicts and
+lists: it compares, serializes and copies like the plain state.
+"""
+
+_MISSING = object()
+
+# Key of the undo entries of lists, which record the whole previous list
+_WHOLE_LIST = object()
+
+
+class Journal:
+    """
+    entries: (container, key, previous value) undo entries of the open transaction, None when there is none
+    new_containers: (container, key) of the plain containers added since the last transaction began, key being None for
+        the items of a list
+    """
+    __slots__ = ("entries", "new_containers")
+
+    def __init__(self):
+        self.entries = None
+        self.new_containers = []
+
+    def in_transaction(self):
+        return self.entries is not None
+
+    def _journal_new_containers(self):
+        for container, key in self.new_containers:
+            if key is None:
+                for index, value in enumerate(container):
+                    if type(value) in (dict, list):
+                        list.__setitem__(container, index, _journaled(value, self))
+            elif key in container and type(dict.__getitem__(container, key)) in (dict, list):
+                dict.__setitem__(container, key, _journaled(dict.__getitem__(container, key), self))
+        self.new_containers = []
+
+    def begin(self):
+        self._journal_new_containers()
+        self.entries = []
+
+    def commit(self):
+        self._journal_new_containers()
+        self.entries = None
+
+    def rollback(self):
+        for container, key, previous_value in reversed(self.entries):
+            if key is _WHOLE_LIST:
+                list.__setitem__(container, slice(None), previous_value)
+            elif previous_value is _MISSING:
+                dict.pop(container, key, None)
+            else:
+                dict.__setitem__(container, key, previous_value)
+        self.entries = None
+        self.new_containers = []
+
+
+def _rebuild(container_type, items, journal):
+    container = container_type(items)
+    container.journal = journal
+    return container
+
+
+class JournaledDict(dict):
+    __slots__ = ("journal",)
+
+    def __reduce__(self):
+        # Items are restored before attributes otherwise, and they are not to be recorded
+        return _rebuild, (JournaledDict, dict(self), self.journal)
+
+    def _record(self, key, value=_MISSING):
+        if self.journal.entries is not None:
+            self.journal.entries.append((self, key, dict.get(self, key, _MISSING)))
+        if type(value) in (dict, list):
+            self.journal.new_containers.append((self, key))
+
+    def __setitem__(self, key, value):
+        self._record(key, value)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._record(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        self._record(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        if self.journal.entries is not None:
+            self.journal.entries.append((self, key, value))
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+
+def _recording_list_method(name):
+    method = getattr(list, name)
+
+    def record_and_call(self, *args, **kwargs):
+        journal = self.journal
+        if journal.entries is not None:
+            journal.entries.append((self, _WHOLE_LIST, list(self)))
+            journal.new_containers.append((self, None))
+        elif any(type(arg) in (dict, list) for arg in args):
+            journal.new_containers.append((self, None))
+        return method(self, *args, **kwargs)
+
+    record_and_call.__name__ = name
+    return record_and_call
+
+
+class JournaledList(list):
+    __slots__ = ("journal",)
+
+    def __reduce__(self):
+        return _rebuild, (JournaledList, list(self), self.journal)
+
+    __setitem__ = _recording_list_method("__setitem__")
+    __delitem__ = _recording_list_method("__delitem__")
+    __iadd__ = _recording_list_method("__iadd__")
+    __imul__ = _recording_list_method("__imul__")
+    append = _recording_list_method("append")
+    extend = _recording_list_method("extend")
+    insert = _recording_list_method("insert")
+    pop = _recording_list_method("pop")
+    remove = _recording_list_method("remove")
+    clear = _recording_list_method("clear")
+    sort = _recording_list_method("sort")
+    reverse = _recording_list_method("reverse")
+
+
+def _journaled(value, journal):
+    if type(value) is dict:
+        return _rebuild(JournaledDict, ((key, _journaled(item, journal)) for key, item in value.items()), journal)
+    if type(value) is list:
+        return _rebuild(JournaledList, (_journaled(item, journal) for item in value), journal)
+    return value
+
+
+def journaled(state) -> JournaledDict:
+    """
+    :return: the state itself if already journaled, or a journaled copy of it
+    """
+    if isinstance(state, JournaledDict):
+        return state
+    return _journaled(state, Journal())
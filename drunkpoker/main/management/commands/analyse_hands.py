@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+import numpy as np
+
+from drunkpoker.main import analytics, engine
+
+
+class Command(BaseCommand):
+    help = (
+        "Analyses recorded hands: how often each combination is made at showdown, textures of the flops, and which "
+        "combinations win for each texture"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "hands",
+            help="A .npz file with a 'boards' array of shape (N, 5) and a 'hole_cards' array of shape "
+                 "(N, number of players, 2) of encoded cards, -1 for the seats of players that didn't go to showdown"
+        )
+        parser.add_argument("--chunk-size", type=int, default=analytics.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            with np.load(options["hands"]) as hands:
+                boards, hole_cards = hands["boards"], hands["hole_cards"]
+        except (OSError, KeyError) as error:
+            raise CommandError(f"Can't read the hands: {error}")
+
+        result = analytics.analyse_hands(hole_cards, boards, chunk_size=options["chunk_size"])
+
+        self.stdout.write(f"{result.hands} hands")
+        self.stdout.write("Combinations at showdown (made, won):")
+        for combination, (count, wins) in enumerate(zip(
+                result.combinations_counts,
+                result.winning_combinations_counts
+        )):
+            self.stdout.write(f"{engine.COMBINATIONS_NAMES[combination]:>16}: {count:>10} {wins:>10}")
+        self.stdout.write("Flop textures (hands, most frequent winning combination):")
+        for texture, (count, wins) in enumerate(zip(result.textures_counts, result.winning_combinations_by_texture)):
+            if count:
+                most_won = engine.COMBINATIONS_NAMES[int(wins.argmax())]
+                self.stdout.write(f"{analytics.describe_texture(texture):>28}: {count:>10} {most_won}")
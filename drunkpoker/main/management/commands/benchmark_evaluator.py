@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from drunkpoker.main import benchmark, engine
+
+
+class Command(BaseCommand):
+    help = (
+        "Evaluates all the hands of 7 cards with an evaluator, checks the number of hands of each combination and a "
+        "sample of the results against best_combination, and reports the number of hands evaluated per second"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--evaluator", choices=sorted(benchmark.EVALUATORS), default="evaluate_many")
+        parser.add_argument("--check-fraction", type=float, default=0.001,
+                            help="Fraction of the hands checked against best_combination")
+        parser.add_argument("--processes", type=int, default=None, help="Number of processes, one per core by default")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        result = benchmark.benchmark(
+            options["evaluator"],
+            check_fraction=options["check_fraction"],
+            processes=options["processes"],
+            seed=options["seed"]
+        )
+
+        self.stdout.write(
+            f"{result.hands} hands evaluated in {result.seconds:.1f}s of all the processes: "
+            f"{result.hands / result.seconds:.0f} hands/s per process, {result.wall_clock_seconds:.1f}s wall clock"
+        )
+        for combination, (count, expected) in enumerate(zip(
+                result.combinations_counts,
+                benchmark.SEVEN_CARDS_COMBINATIONS_COUNTS
+        )):
+            self.stdout.write(f"{engine.COMBINATIONS_NAMES[combination]:>16}: {count:>9} (expected {expected})")
+        self.stdout.write(f"{result.checked} hands checked against best_combination")
+
+        if result.mismatches:
+            raise CommandError(f"Results different from best_combination for: {result.mismatches}")
+        if tuple(result.combinations_counts) != benchmark.SEVEN_CARDS_COMBINATIONS_COUNTS:
+            raise CommandError("Unexpected number of hands of some combinations")
+        self.stdout.write(self.style.SUCCESS("All good"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from drunkpoker.main import equity
+
+
+class Command(BaseCommand):
+    help = "Simulates the preflop equities of all the starting hands against each other and writes them to a file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=equity.PREFLOP_EQUITY_SAMPLES)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default=equity.PREFLOP_EQUITY_PATH)
+
+    def handle(self, *args, **options):
+        matrix = equity.compute_preflop_equity_matrix(samples=options["samples"], seed=options["seed"])
+        equity.write_preflop_equity_matrix(matrix, options["output"])
+        self.stdout.write(self.style.SUCCESS(f"Preflop equities written to {options['output']}"))
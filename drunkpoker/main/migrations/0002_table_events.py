@@ -0,0 +1,32 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='table',
+            name='snapshot_sequence',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TableEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('event', models.TextField()),
+                ('hand_seed', models.CharField(max_length=40, null=True)),
+                ('table', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name='events', to='main.table'
+                )),
+            ],
+            options={
+                'unique_together': {('table', 'sequence')},
+            },
+        ),
+    ]
@@ -2,5 +2,24 @@ from django.db import models
 
 
 class Table(models.Model):
+    """
+    state: snapshot of the state of the table after its first snapshot_sequence events
+    """
     name = models.CharField(max_length=100, primary_key=True)
     state = models.CharField(max_length=10000)
+    snapshot_sequence = models.PositiveIntegerField(default=0)
+
+
+class TableEvent(models.Model):
+    """
+    An event accepted on a table, and the seed of the hand it started if it started one, so that the state of the
+    table can be rebuilt from its snapshot and the events that follow it
+    hand_seed: in decimal, hand seeds have engine.HAND_SEED_BITS bits
+    """
+    table = models.ForeignKey(Table, on_delete=models.CASCADE, related_name="events")
+    sequence = models.PositiveIntegerField()
+    event = models.TextField()
+    hand_seed = models.CharField(max_length=40, null=True)
+
+    class Meta:
+        unique_together = [("table", "sequence")]
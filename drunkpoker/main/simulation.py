@@ -0,0 +1,382 @@
+"""
+Bulk simulation of normal games (no limit, with stacks): many tables are held in arrays, one row per table and one
+column per seat, and are all advanced at once, one action per table. The rules are the ones of the engine for the
+events it supports (start of the hands, fold, check, call and raise, then the streets, the showdown and the stacks): a
+table plays like a state of the engine whose players sat in the order of the seats, which is what decides who gets
+the odd chips of a split pot. Outs and the other display aids of the engine are not computed.
+"""
+import numpy as np
+
+from drunkpoker.main import engine
+
+
+SEATS = 10
+
+"""
+Actions of the players, see Tables.act
+"""
+NONE = 0
+FOLD = 1
+CHECK = 2
+CALL = 3
+RAISE = 4
+
+"""
+States of the players, indexes of PLAYER_STATES
+"""
+WAITING_NEW_GAME = 0
+MY_TURN = 1
+IN_GAME = 2
+FOLDED = 3
+PLAYER_STATES = (
+    engine.PlayerState.WAITING_NEW_GAME, engine.PlayerState.MY_TURN, engine.PlayerState.IN_GAME,
+    engine.PlayerState.FOLDED
+)
+
+"""
+States of the tables, indexes of GAME_STATES. The streets follow each other
+"""
+NOT_STARTED = 0
+PREFLOP = 1
+FLOP = 2
+RIVER = 3
+TURN = 4
+GAME_OVER = 5
+GAME_STATES = (
+    engine.GameState.NOT_STARTED, engine.GameState.PREFLOP, engine.GameState.FLOP, engine.GameState.RIVER,
+    engine.GameState.TURN, engine.GameState.GAME_OVER
+)
+
+# Number of community cards once a street is drawn, by game state
+_COMMUNITY_CARDS = np.array([0, 0, 3, 4, 5, 5])
+
+
+def _first(mask, positions, seats):
+    """
+    :return: for each row, the column of mask with the lowest position, -1 if there is none
+    """
+    keyed = np.where(mask, positions, seats)
+    return np.where(keyed.min(axis=1) < seats, keyed.argmin(axis=1), -1)
+
+
+def _all_players_all_in(states, committed, stacks, max_bets):
+    """
+    Same as engine.all_players_all_in: at most one player who could play isn't all in, and they called
+    """
+    not_all_in = ((states == MY_TURN) | (states == IN_GAME)) & (stacks != committed)
+    not_all_in_count = not_all_in.sum(axis=1)
+    return (not_all_in_count == 0) | (
+        (not_all_in_count == 1) & ((committed * not_all_in).sum(axis=1) == max_bets)
+    )
+
+
+class Tables:
+    """
+    seated: array of shape (N, seats), whether a player sits there
+    stacks: array of shape (N, seats) of the stacks of the players, commitments are taken from them at the end of
+        the hand
+    committed: array of shape (N, seats) of what the players committed to the hand
+    players_states: array of shape (N, seats), see PLAYER_STATES
+    hole_cards: array of shape (N, seats, 2) of encoded cards
+    decks: array of shape (N, 52) of the decks of the hands, the cards being dealt from the first one
+    dealt: number of cards of the decks that were dealt
+    community_cards: array of shape (N, 5) of encoded cards, -1 until they are drawn
+    game_states: array of shape (N,), see GAME_STATES
+    dealers: array of shape (N,) of the seats of the dealers, -1 for none
+    """
+    __slots__ = (
+        "seated", "stacks", "committed", "players_states", "hole_cards", "decks", "dealt", "community_cards",
+        "game_states", "dealers", "small_blind", "big_blind"
+    )
+
+    def __init__(self, stacks, small_blind=10, big_blind=20):
+        """
+        :param stacks: array like of shape (N, up to SEATS) of the stacks of the players, 0 for the free seats
+        """
+        self.stacks = np.array(stacks, dtype=np.int64)
+        tables, seats = self.stacks.shape
+        if seats > SEATS:
+            raise ValueError(f"Tables have {SEATS} seats at most")
+        self.seated = self.stacks > 0
+        self.committed = np.zeros((tables, seats), dtype=np.int64)
+        self.players_states = np.zeros((tables, seats), dtype=np.int8)
+        self.hole_cards = np.full((tables, seats, 2), -1, dtype=np.intp)
+        self.decks = np.zeros((tables, len(engine.deck)), dtype=np.intp)
+        self.dealt = np.zeros(tables, dtype=np.intp)
+        self.community_cards = np.full((tables, 5), -1, dtype=np.intp)
+        self.game_states = np.zeros(tables, dtype=np.int8)
+        self.dealers = np.full(tables, -1, dtype=np.intp)
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+
+    def __len__(self):
+        return len(self.stacks)
+
+    def turns(self):
+        """
+        :return: array of shape (N,) of the seats of the players whose turn it is, -1 for none
+        """
+        my_turn = self.players_states == MY_TURN
+        return np.where(my_turn.any(axis=1), my_turn.argmax(axis=1), -1)
+
+    def _ring_positions(self, tables):
+        """
+        Positions of the seats of tables in the order they play, starting at the dealer
+        """
+        seats = self.stacks.shape[1]
+        return (np.arange(seats) - self.dealers[tables, None]) % seats
+
+    def start_hands(self, decks=None, rng=None):
+        """
+        Starts a hand on all the tables with 2 players or more that are not playing one, like engine.start_game once
+        all the players are ready
+        :param decks: array like of shape (N, 52) of the decks to deal from, only the ones of the tables starting a
+            hand being used, shuffled with rng by default
+        :return: array of shape (N,) of whether a hand started on each table
+        """
+        seats = self.stacks.shape[1]
+        started = (
+            ((self.game_states == NOT_STARTED) | (self.game_states == GAME_OVER))
+            & (self.seated.sum(axis=1) >= 2)
+        )
+        tables = np.flatnonzero(started)
+        if decks is None:
+            rng = np.random.default_rng() if rng is None else rng
+            self.decks[tables] = np.argsort(rng.random((len(tables), len(engine.deck))), axis=1)
+        else:
+            self.decks[tables] = np.asarray(decks)[tables]
+        seated = self.seated[tables]
+        rows = np.arange(len(tables))
+
+        # The next dealer is the next player after the previous one, seat 1 counting as the previous one at first
+        previous_dealers = np.maximum(self.dealers[tables], 0)
+        self.dealers[tables] = _first(seated, (np.arange(seats) - previous_dealers[:, None] - 1) % seats, seats)
+
+        # Two cards to each player, in the order of the seats
+        players_ranks = np.cumsum(seated, axis=1) - 1
+        for card in range(2):
+            self.hole_cards[tables, :, card] = np.where(
+                seated,
+                np.take_along_axis(self.decks[tables], 2 * np.maximum(players_ranks, 0) + card, axis=1),
+                -1
+            )
+        players_counts = seated.sum(axis=1)
+        self.dealt[tables] = 2 * players_counts
+        self.community_cards[tables] = -1
+        self.committed[tables] = 0
+        self.players_states[tables] = np.where(seated, IN_GAME, WAITING_NEW_GAME)
+        self.game_states[tables] = PREFLOP
+
+        # The dealer plays first, after the big blind, who comes right before them, and the small blind before the
+        # big blind, or the dealer with two players
+        ring_order = np.argsort(np.where(seated, self._ring_positions(tables), 2 * seats), axis=1)
+        dealers = ring_order[:, 0]
+        big_blinds = ring_order[rows, players_counts - 1]
+        small_blinds = np.where(players_counts > 2, ring_order[rows, players_counts - 2], dealers)
+        self.players_states[tables, dealers] = MY_TURN
+        self.committed[tables, small_blinds] = self.small_blind
+        self.committed[tables, big_blinds] = self.big_blind
+        return started
+
+    def act(self, actions, amounts=None):
+        """
+        The player whose turn it is plays on each table, like the FOLD, CHECK, CALL and RAISE events of the engine,
+        then the next streets are drawn and the hands that are over are resolved
+        :param actions: array like of shape (N,) of the actions of the players, NONE on the tables where nobody plays
+        :param amounts: array like of shape (N,) of the amounts of the raises, that are added to what the players
+            already committed
+        :return: array of shape (N,) of whether the actions were accepted, the tables where they were rejected being
+            left as they were
+        """
+        seats = self.stacks.shape[1]
+        actions = np.asarray(actions)
+        amounts = np.zeros(len(self), dtype=np.int64) if amounts is None else np.asarray(amounts, dtype=np.int64)
+        turns = self.turns()
+        tables = np.flatnonzero(
+            (self.game_states >= PREFLOP) & (self.game_states <= TURN) & (turns >= 0) & (actions != NONE)
+        )
+        rows = np.arange(len(tables))
+        current = turns[tables]
+        actions = actions[tables]
+        seated = self.seated[tables]
+        stacks = self.stacks[tables]
+        committed = self.committed[tables]
+        states = self.players_states[tables]
+        current_stacks = stacks[rows, current]
+        current_committed = committed[rows, current]
+        max_bets = committed.max(axis=1)
+
+        # Calling when everybody is aligned is checking
+        aligned = ((committed == max_bets[:, None]) | ~seated).all(axis=1)
+        checking = (actions == CHECK) | ((actions == CALL) & aligned)
+        calling = (actions == CALL) & ~aligned
+        raising = actions == RAISE
+        folding = actions == FOLD
+        raised_to = amounts[tables] + current_committed
+        accepted = (
+            (checking & (current_committed >= max_bets))
+            | calling
+            | (raising & (raised_to > max_bets) & (raised_to <= current_stacks))
+            | folding
+        )
+
+        committed[rows, current] = np.where(
+            calling & (current_committed < max_bets),
+            np.minimum(max_bets, current_stacks),
+            np.where(raising, raised_to, current_committed)
+        )
+        max_bets = committed.max(axis=1)
+
+        # Who plays next, see engine.determine_next_players_for_this_round
+        positions = self._ring_positions(tables)
+        current_positions = positions[rows, current]
+        could_be_next = (states == IN_GAME) & (stacks > committed) & seated
+        after = could_be_next & (positions > current_positions[:, None])
+        first_after = _first(after, positions, seats)
+        first_before_not_aligned = _first(
+            could_be_next & (positions < current_positions[:, None]) & (committed < max_bets[:, None]),
+            positions,
+            seats
+        )
+
+        states[rows, current] = np.where(folding, FOLDED, IN_GAME)
+        next_players = np.full(len(tables), -1)
+        next_street = np.zeros(len(tables), dtype=bool)
+
+        next_players[checking] = first_after[checking]
+        next_street |= checking & (first_after < 0)
+
+        big_blind_called_and_turn_to_big_blind = (
+            (after.sum(axis=1) == 1)
+            & (committed[rows, np.maximum(first_after, 0)] == self.big_blind)
+        )
+        calling_next_street = calling & (
+            _all_players_all_in(states, committed, stacks, max_bets)
+            | (
+                ((committed == max_bets[:, None]) | ~seated).all(axis=1)
+                & ~big_blind_called_and_turn_to_big_blind
+            )
+        )
+        calling_next_player = calling & ~calling_next_street
+        next_players[calling_next_player] = np.where(
+            first_after >= 0, first_after, first_before_not_aligned
+        )[calling_next_player]
+        next_street |= (calling_next_player & (next_players < 0)) | calling_next_street
+
+        # A raise nobody can answer is rejected, like the engine fails on it
+        next_players[raising] = np.where(first_after >= 0, first_after, first_before_not_aligned)[raising]
+        accepted &= ~raising | (next_players >= 0)
+
+        all_folded_but_one = ((states == MY_TURN) | (states == IN_GAME)).sum(axis=1) == 1
+        folding_to_after = folding & (first_after >= 0) & ~all_folded_but_one
+        folding_to_before = folding & ~folding_to_after & (first_before_not_aligned >= 0)
+        next_players[folding_to_after] = first_after[folding_to_after]
+        next_players[folding_to_before] = first_before_not_aligned[folding_to_before]
+        folding_ends = folding & ~folding_to_after & ~folding_to_before
+        game_over = folding_ends & ((self.game_states[tables] == TURN) | all_folded_but_one)
+        next_street |= folding_ends & ~game_over
+
+        playing = accepted & (next_players >= 0) & ~next_street & ~game_over
+        states[rows[playing], next_players[playing]] = MY_TURN
+
+        self.committed[tables[accepted]] = committed[accepted]
+        self.players_states[tables[accepted]] = states[accepted]
+        self._end_hands(tables[accepted & game_over])
+        self._draw_next_streets(tables[accepted & next_street])
+        result = np.zeros(len(self), dtype=bool)
+        result[tables[accepted]] = True
+        return result
+
+    def _draw_next_streets(self, tables):
+        """
+        Same as the DRAW_FLOP, DRAW_RIVER and DRAW_TURN events, and the ones they generate when all the players are
+        all in
+        """
+        seats = self.stacks.shape[1]
+        while len(tables):
+            over = self.game_states[tables] == TURN
+            self._end_hands(tables[over])
+            tables = tables[~over]
+
+            states = self.players_states[tables]
+            first_player = _first((states == MY_TURN) | (states == IN_GAME), self._ring_positions(tables), seats)
+            self.players_states[tables, first_player] = MY_TURN
+            drawn_from = _COMMUNITY_CARDS[self.game_states[tables]]
+            self.game_states[tables] += 1
+            drawn_to = _COMMUNITY_CARDS[self.game_states[tables]]
+            for card in range(5):
+                drawing = (drawn_from <= card) & (card < drawn_to)
+                self.community_cards[tables[drawing], card] = self.decks[
+                    tables[drawing], self.dealt[tables[drawing]] + card - drawn_from[drawing]
+                ]
+            self.dealt[tables] += drawn_to - drawn_from
+
+            all_in = _all_players_all_in(
+                self.players_states[tables], self.committed[tables], self.stacks[tables],
+                self.committed[tables].max(axis=1)
+            )
+            self.players_states[tables[all_in], first_player[all_in]] = IN_GAME
+            tables = tables[all_in]
+
+    def _end_hands(self, tables):
+        """
+        Same as the END_GAME, RESOLVE_STACKS and PLAYERS_LOST events: the pots are dealt like engine.build_pots, then
+        the players who lost their stack leave, and the tables with a single player left stop
+        """
+        if not len(tables):
+            return
+        seats = self.stacks.shape[1]
+        self.game_states[tables] = GAME_OVER
+        states = self.players_states[tables]
+        committed = self.committed[tables]
+        can_win = (states == MY_TURN) | (states == IN_GAME)
+
+        scores = np.zeros(can_win.shape, dtype=np.int64)
+        showdown = can_win.sum(axis=1) > 1
+        showdown_tables, showdown_seats = np.nonzero(can_win & showdown[:, None])
+        if len(showdown_tables):
+            scores[showdown_tables, showdown_seats] = engine.evaluate_many(np.hstack([
+                self.hole_cards[tables[showdown_tables], showdown_seats],
+                self.community_cards[tables[showdown_tables]]
+            ]))
+        scores[~can_win] = -1
+
+        # Layers of the commitments, sorted once: a pot closes at the commitment of each player who can win it. Blinds
+        # are not capped to the stacks, which can go below 0, and then so can calls: the engine leaves such commitments
+        # out of the pots
+        committed = np.maximum(committed, 0)
+        order = np.argsort(committed, axis=1, kind="stable")
+        sorted_committed = np.take_along_axis(committed, order, axis=1)
+        sorted_can_win = np.take_along_axis(can_win, order, axis=1)
+        best_scores = np.maximum.accumulate(np.take_along_axis(scores, order, axis=1)[:, ::-1], axis=1)[:, ::-1]
+        best_scores = np.hstack([best_scores, np.full((len(tables), 1), -1)])
+        winnings = np.zeros(committed.shape, dtype=np.int64)
+        amounts = np.zeros(len(tables), dtype=np.int64)
+        levels = np.zeros(len(tables), dtype=np.int64)
+        for index in range(seats):
+            amounts += (sorted_committed[:, index] - levels) * (seats - index)
+            levels = sorted_committed[:, index]
+            closing = (amounts > 0) & (sorted_can_win[:, index] | (best_scores[:, index + 1] < 0))
+            best = best_scores[:, index, None]
+            winners = closing[:, None] & (committed >= levels[:, None]) & np.where(
+                best >= 0, can_win & (scores == best), self.seated[tables]
+            )
+            shares, odd_chips = np.divmod(amounts, np.maximum(winners.sum(axis=1), 1))
+            winnings += winners * (shares[:, None] + (np.cumsum(winners, axis=1) <= odd_chips[:, None]))
+            amounts[closing] = 0
+
+        stacks = self.stacks[tables] - self.committed[tables] + winnings
+        self.stacks[tables] = stacks
+        lost = self.seated[tables] & (stacks == 0)
+        lost_tables, lost_seats = np.nonzero(lost)
+        self.seated[tables[lost_tables], lost_seats] = False
+        self.committed[tables[lost_tables], lost_seats] = 0
+        self.players_states[tables[lost_tables], lost_seats] = WAITING_NEW_GAME
+
+        # The last player left waits for others
+        stopped = tables[self.seated[tables].sum(axis=1) < 2]
+        self.game_states[stopped] = NOT_STARTED
+        self.dealers[stopped] = -1
+        self.community_cards[stopped] = -1
+        self.committed[stopped] = 0
+        self.players_states[stopped] = WAITING_NEW_GAME
@@ -1,22 +1,77 @@
-from drunkpoker.main.models import Table
-from drunkpoker.main.engine import initial_state
+from django.db import transaction
+from drunkpoker.main.models import Table, TableEvent
+from drunkpoker.main.engine import initial_state, pack_deck, unpack_deck, process_event, encode_event, decode_event, \
+    replay_events, encode_legacy_cards, HAND_SEED_BITS
 from channels.db import database_sync_to_async
 import json
+import os
+import secrets
+
+"""
+Tables are stored as a snapshot of their state and the log of the events accepted since, a new snapshot being written
+every SNAPSHOT_EVERY events so that rebuilding a table only replays the last few ones
+"""
+SNAPSHOT_EVERY = int(os.environ.get("TABLE_SNAPSHOT_EVERY", 50))
+
+
+def _load_snapshot(table):
+    state = json.loads(table.state)
+    # Tables stored before decks were packed have a list of cards, of [value, suit] pairs before cards were ints
+    if isinstance(state.get("deck"), str):
+        state["deck"] = unpack_deck(state["deck"])
+    return encode_legacy_cards(state)
+
+
+def _dump_snapshot(state):
+    stored_state = dict(state)
+    if stored_state.get("deck"):
+        stored_state["deck"] = pack_deck(stored_state["deck"])
+    return json.dumps(stored_state, separators=(",", ":"))
+
+
+def _rebuild_state(table):
+    return replay_events(
+        _load_snapshot(table),
+        (
+            (decode_event(event), int(hand_seed) if hand_seed else None)
+            for event, hand_seed in table.events.filter(sequence__gt=table.snapshot_sequence)
+            .order_by("sequence").values_list("event", "hand_seed")
+        )
+    )
 
 
 @database_sync_to_async
 def get_table(name, table_type):
     try:
-        return json.loads(Table.objects.get(name=f"{table_type}_{name}").state)
+        return _rebuild_state(Table.objects.get(name=f"{table_type}_{name}"))
     except Table.DoesNotExist:
         return initial_state(table_type)
 
 
 @database_sync_to_async
-def set_table(name, table_type, state):
-    try:
-        the_table = Table.objects.get(name=f"{table_type}_{name}")
-    except Table.DoesNotExist:
-        the_table = Table(name=f"{table_type}_{name}")
-    the_table.state = json.dumps(state)
-    the_table.save()
+def apply_event(name, table_type, event):
+    """
+    Processes an event on a table and appends it to the log of the table, unless it is rejected
+    :return: the new state of the table
+    """
+    with transaction.atomic():
+        the_table, _ = Table.objects.select_for_update().get_or_create(
+            name=f"{table_type}_{name}",
+            defaults={"state": _dump_snapshot(initial_state(table_type))}
+        )
+        last_event = the_table.events.order_by("-sequence").first()
+        sequence = (last_event.sequence if last_event else the_table.snapshot_sequence) + 1
+        hand_seed = secrets.randbits(HAND_SEED_BITS)
+        state = process_event(_rebuild_state(the_table), event, hand_seed=hand_seed)
+        TableEvent.objects.create(
+            table=the_table,
+            sequence=sequence,
+            event=encode_event(event),
+            # Only kept when the event started a hand
+            hand_seed=str(hand_seed) if state.get("hand_seed") == hand_seed else None
+        )
+        if sequence - the_table.snapshot_sequence >= SNAPSHOT_EVERY:
+            the_table.state = _dump_snapshot(state)
+            the_table.snapshot_sequence = sequence
+            the_table.save(update_fields=["state", "snapshot_sequence"])
+    return state
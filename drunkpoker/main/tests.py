@@ -1,3 +1,118 @@
-from django.test import TestCase
+import json
+import random
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.test import TestCase, TransactionTestCase
+
+from drunkpoker.main import engine, state
+from drunkpoker.main.models import Table, TableEvent
+
+
+def sit(player_number):
+    return {
+        "type": engine.Event.PLAYER_SIT,
+        "player_id": f"P{player_number}",
+        "parameters": {"player_name": f"P{player_number}", "seat_number": 2 * player_number + 1}
+    }
+
+
+class SnapshotTest(TestCase):
+
+    def test_dump_and_load(self):
+        the_state = engine.process_event(engine.initial_state("normal"), sit(0))
+        the_state = engine.process_event(the_state, sit(1))
+
+        dumped = state._dump_snapshot(the_state)
+
+        assert isinstance(json.loads(dumped)["deck"], str)
+        assert state._load_snapshot(Table(state=dumped)) == json.loads(json.dumps(the_state))
+
+    def test_load_legacy_snapshot(self):
+        legacy_state = {**engine.initial_state("normal"), "deck": [[14, "SPADE"], [2, "HEART"]]}
+
+        the_state = state._load_snapshot(Table(state=json.dumps(legacy_state)))
+
+        assert the_state["deck"] == [
+            engine.encode_card(14, engine.Suit.SPADE), engine.encode_card(2, engine.Suit.HEART)
+        ]
+
+
+class TableStorageTest(TransactionTestCase):
+    """
+    get_table and apply_event are run the way the consumers run them, from an event loop
+    """
+
+    def setUp(self):
+        self.rng = random.Random(5)
+
+    def apply_event(self, event):
+        return async_to_sync(state.apply_event)("table", "normal", event)
+
+    def play(self, number_of_events):
+        """
+        Sits two players on a new table, which starts a hand, then plays random actions until the table has
+        number_of_events events
+        :return: the state after the last accepted event
+        """
+        if not TableEvent.objects.exists():
+            self.apply_event(sit(0))
+            the_state = self.apply_event(sit(1))
+        else:
+            the_state = async_to_sync(state.get_table)("table", "normal")
+        while TableEvent.objects.count() < number_of_events:
+            if the_state["game_state"] == engine.GameState.GAME_OVER:
+                event = {"type": engine.Event.PLAYER_READY_FOR_NEXT_GAME, "player_id": self.rng.choice(["P0", "P1"])}
+            else:
+                event = {
+                    "type": self.rng.choice([engine.Event.FOLD, engine.Event.CHECK, engine.Event.CALL]),
+                    "player_id": engine.find_player_ids_if(
+                        the_state["players"], lambda player: player["state"] == engine.PlayerState.MY_TURN
+                    )[0]
+                }
+            try:
+                the_state = self.apply_event(event)
+            except engine.EventRejected:
+                continue
+        return the_state
+
+    def test_new_table(self):
+        assert async_to_sync(state.get_table)("table", "normal") == engine.initial_state("normal")
+
+    def test_events_are_numbered(self):
+        self.play(7)
+
+        assert list(TableEvent.objects.order_by("sequence").values_list("sequence", flat=True)) == list(range(1, 8))
+
+    def test_rejected_events_are_not_logged(self):
+        self.apply_event(sit(0))
+
+        with self.assertRaises(engine.EventRejected):
+            self.apply_event({"type": engine.Event.CHECK, "player_id": "P0"})
+        assert TableEvent.objects.count() == 1
+        self.apply_event(sit(1))
+        assert TableEvent.objects.get(sequence=2).event == engine.encode_event(sit(1))
+
+    @mock.patch.object(state, "SNAPSHOT_EVERY", 3)
+    def test_snapshot_every_few_events(self):
+        the_state = self.play(7)
+
+        table = Table.objects.get(name="normal_table")
+        assert table.snapshot_sequence == 6
+        assert TableEvent.objects.count() == 7
+        assert async_to_sync(state.get_table)("table", "normal") == the_state
+
+    def test_only_the_seeds_of_new_hands_are_logged(self):
+        self.apply_event(sit(0))
+        the_state = self.apply_event(sit(1))
+
+        assert list(TableEvent.objects.order_by("sequence").values_list("hand_seed", flat=True)) == [
+            None, str(the_state["hand_seed"])
+        ]
+
+    @mock.patch.object(state, "SNAPSHOT_EVERY", 4)
+    def test_rebuilt_table_is_the_live_one(self):
+        for number_of_events in (3, 4, 10, 30):
+            the_state = self.play(number_of_events)
+
+            assert async_to_sync(state.get_table)("table", "normal") == the_state
@@ -0,0 +1,85 @@
+import pytest
+import random
+import numpy as np
+
+from drunkpoker.main import analytics, engine
+from drunkpoker.main.engine import encode_card, Suit
+
+
+def random_hands(how_many, players, seed):
+    rng = random.Random(seed)
+    hands = [rng.sample(engine.deck, 5 + 2 * players) for _ in range(how_many)]
+    boards = np.array([hand[:5] for hand in hands])
+    hole_cards = np.array([hand[5:] for hand in hands]).reshape(how_many, players, 2)
+    return hole_cards, boards
+
+
+class TestBoardTextures:
+
+    @pytest.mark.parametrize("board, texture", [
+        ([(2, Suit.SPADE), (7, Suit.HEART), (13, Suit.CLUBS)], 0),
+        ([(7, Suit.SPADE), (7, Suit.HEART), (13, Suit.CLUBS)], analytics.PAIRED),
+        ([(2, Suit.HEART), (7, Suit.HEART), (13, Suit.HEART)], analytics.MONOTONE),
+        ([(9, Suit.SPADE), (10, Suit.HEART), (12, Suit.CLUBS)], analytics.CONNECTED),
+        ([(14, Suit.SPADE), (2, Suit.HEART), (5, Suit.CLUBS)], analytics.CONNECTED),
+        ([(12, Suit.DIAMONDS), (13, Suit.DIAMONDS), (14, Suit.DIAMONDS)], analytics.MONOTONE | analytics.CONNECTED),
+        ([(8, Suit.SPADE), (8, Suit.HEART), (9, Suit.CLUBS), (10, Suit.CLUBS)], analytics.PAIRED | analytics.CONNECTED),
+        ([(2, Suit.SPADE), (3, Suit.HEART), (8, Suit.CLUBS), (9, Suit.CLUBS), (13, Suit.CLUBS)], 0),
+    ])
+    def test_textures(self, board, texture):
+        assert analytics.board_textures([[encode_card(value, suit) for value, suit in board]]).tolist() == [texture]
+
+    def test_describe_texture(self):
+        assert analytics.describe_texture(0) == "dry"
+        assert analytics.describe_texture(analytics.PAIRED | analytics.CONNECTED) == "paired, connected"
+
+
+class TestAnalyseHands:
+
+    def test_showdown_scores_same_as_best_combination(self):
+        hole_cards, boards = random_hands(200, 3, seed=1)
+        hole_cards[::2, 2] = -1
+
+        scores = analytics.showdown_scores(hole_cards, boards)
+
+        assert scores.tolist() == [
+            [
+                engine.hand_score(engine.best_combination(cards + board)) if cards[0] >= 0 else -1
+                for cards in players_cards
+            ]
+            for players_cards, board in zip(hole_cards.tolist(), boards.tolist())
+        ]
+
+    def test_same_as_counting_hand_by_hand_whatever_the_chunks(self):
+        hole_cards, boards = random_hands(500, 4, seed=2)
+        hole_cards[::3, 1:] = -1
+
+        result = analytics.analyse_hands(hole_cards, boards, chunk_size=70)
+
+        winning_combinations, combinations_counts = [], [0] * analytics.COMBINATIONS
+        for players_cards, board in zip(hole_cards.tolist(), boards.tolist()):
+            results = [engine.best_combination(cards + board) for cards in players_cards if cards[0] >= 0]
+            for combination, _ in results:
+                combinations_counts[combination] += 1
+            winning_combinations.append(max(results).combination)
+        textures = analytics.board_textures(boards[:, :3]).tolist()
+        assert result.hands == 500
+        assert result.combinations_counts.tolist() == combinations_counts
+        assert result.textures_counts.tolist() == [textures.count(texture) for texture in range(analytics.TEXTURES)]
+        assert result.winning_combinations_counts.tolist() == [
+            winning_combinations.count(combination) for combination in range(analytics.COMBINATIONS)
+        ]
+        assert result.winning_combinations_by_texture.tolist() == [
+            [
+                sum(1 for won_with, flop_texture in zip(winning_combinations, textures)
+                    if (flop_texture, won_with) == (texture, combination))
+                for combination in range(analytics.COMBINATIONS)
+            ]
+            for texture in range(analytics.TEXTURES)
+        ]
+
+    def test_as_many_boards_as_hands(self):
+        hole_cards, boards = random_hands(10, 2, seed=3)
+
+        with pytest.raises(ValueError):
+            analytics.analyse_hands(hole_cards, boards[:5])
@@ -0,0 +1,51 @@
+from unittest import mock
+import numpy as np
+
+from drunkpoker.main import benchmark, engine
+
+
+def test_units_cover_all_hands():
+    assert sum(
+        benchmark.number_of_combinations(len(engine.deck) - second_lowest - 1, 5)
+        for _, second_lowest in benchmark.seven_cards_units()
+    ) == benchmark.number_of_combinations(52, 7) == sum(benchmark.SEVEN_CARDS_COMBINATIONS_COUNTS)
+
+
+def test_seven_cards_hands():
+    hands = benchmark.seven_cards_hands(3, 40)
+
+    assert len(hands) == benchmark.number_of_combinations(11, 5)
+    assert len({tuple(hand) for hand in hands.tolist()}) == len(hands)
+    assert (hands[:, 0] == 3).all() and (hands[:, 1] == 40).all()
+    assert (np.diff(hands, axis=1) > 0).all() and hands.max() == 51
+
+
+def test_benchmark_unit():
+    result = benchmark.benchmark_unit("evaluate_many", (30, 40), check_fraction=1, seed=0)
+
+    assert result.hands == result.checked == sum(result.combinations_counts) == len(benchmark.seven_cards_hands(30, 40))
+    assert result.mismatches == []
+
+
+def test_benchmark_unit_reports_mismatches():
+    def wrong_evaluator(hands):
+        scores = engine.evaluate_many(hands)
+        scores[0] += 1
+        return scores
+
+    with mock.patch.dict(benchmark.EVALUATORS, {"wrong": wrong_evaluator}):
+        result = benchmark.benchmark_unit("wrong", (30, 40), check_fraction=1, seed=0)
+
+    assert result.mismatches == [benchmark.seven_cards_hands(30, 40)[0].tolist()]
+
+
+def test_benchmark_sums_the_evaluation_times_of_the_units():
+    units = [(40, 45), (41, 45), (42, 46)]
+
+    result = benchmark.benchmark("evaluate_many", check_fraction=1, processes=2, units=units)
+
+    units_results = [benchmark.benchmark_unit("evaluate_many", unit, check_fraction=1, seed=0) for unit in units]
+    assert result.hands == result.checked == sum(unit_result.hands for unit_result in units_results)
+    assert result.mismatches == []
+    # Evaluating is only part of what a unit does, and the whole benchmark also starts the processes
+    assert 0 < result.seconds < result.wall_clock_seconds
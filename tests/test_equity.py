@@ -0,0 +1,232 @@
+import pytest
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import numpy as np
+
+from drunkpoker.main import engine, equity
+from drunkpoker.main.engine import encode_card, Suit
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=2) as the_executor:
+        yield the_executor
+
+
+ACES = [encode_card(14, Suit.SPADE), encode_card(14, Suit.HEART)]
+KINGS = [encode_card(13, Suit.SPADE), encode_card(13, Suit.HEART)]
+
+
+class TestEstimateEquity:
+
+    def test_aces_against_kings(self, executor):
+        equities = equity.estimate_equity({"P1": ACES, "P2": KINGS}, samples=20000, executor=executor)
+
+        assert equities["P1"].win == pytest.approx(0.82, abs=0.02)
+        assert equities["P2"].win == pytest.approx(0.17, abs=0.02)
+        assert equities["P1"].tie == equities["P2"].tie
+
+    def test_all_community_cards_known(self, executor):
+        community_cards = [encode_card(13, Suit.CLUBS),
+                           encode_card(7, Suit.DIAMONDS),
+                           encode_card(2, Suit.CLUBS),
+                           encode_card(3, Suit.CLUBS),
+                           encode_card(9, Suit.HEART)]
+
+        equities = equity.estimate_equity(
+            {"P1": ACES, "P2": KINGS}, community_cards, samples=1000, executor=executor
+        )
+
+        assert equities == {"P1": equity.Equity(0.0, 0.0), "P2": equity.Equity(1.0, 0.0)}
+
+    def test_split_pot(self, executor):
+        community_cards = [encode_card(10, Suit.CLUBS),
+                           encode_card(11, Suit.DIAMONDS),
+                           encode_card(12, Suit.CLUBS),
+                           encode_card(13, Suit.CLUBS),
+                           encode_card(14, Suit.DIAMONDS)]
+
+        equities = equity.estimate_equity(
+            {"P1": [encode_card(2, Suit.SPADE), encode_card(3, Suit.SPADE)],
+             "P2": [encode_card(2, Suit.HEART), encode_card(4, Suit.HEART)]},
+            community_cards,
+            samples=1000,
+            executor=executor
+        )
+
+        assert equities == {"P1": equity.Equity(0.0, 1.0), "P2": equity.Equity(0.0, 1.0)}
+
+    def test_same_seed_same_estimation_whatever_the_executor(self, executor):
+        players_cards = {"P1": ACES, "P2": KINGS, "P3": [encode_card(7, Suit.CLUBS), encode_card(8, Suit.CLUBS)]}
+
+        in_threads = equity.estimate_equity(players_cards, samples=12000, seed=7, executor=executor)
+        in_processes = equity.estimate_equity(players_cards, samples=12000, seed=7)
+
+        assert in_threads == in_processes
+
+    def test_dead_cards_are_not_dealt(self, executor):
+        community_cards = [encode_card(13, Suit.CLUBS),
+                           encode_card(7, Suit.DIAMONDS),
+                           encode_card(2, Suit.CLUBS),
+                           encode_card(3, Suit.CLUBS)]
+        # The only card that could make the aces win is dead
+        dead_cards = [encode_card(14, Suit.CLUBS), encode_card(14, Suit.DIAMONDS)]
+
+        equities = equity.estimate_equity(
+            {"P1": ACES, "P2": KINGS}, community_cards, dead_cards, samples=1000, executor=executor
+        )
+
+        assert equities["P1"].win == 0
+
+    def test_same_card_twice(self, executor):
+        with pytest.raises(ValueError):
+            equity.estimate_equity({"P1": ACES, "P2": ACES}, executor=executor)
+
+    def test_two_hole_cards(self, executor):
+        with pytest.raises(ValueError):
+            equity.estimate_equity(
+                {"P1": ACES + KINGS, "P2": [encode_card(12, Suit.SPADE), encode_card(12, Suit.HEART)]},
+                executor=executor
+            )
+
+    def test_async(self, executor):
+        equities = asyncio.run(
+            equity.estimate_equity_async({"P1": ACES, "P2": KINGS}, samples=5000, seed=3, executor=executor)
+        )
+
+        assert equities == equity.estimate_equity({"P1": ACES, "P2": KINGS}, samples=5000, seed=3, executor=executor)
+
+
+class TestExactEquity:
+
+    def test_same_as_evaluating_every_runout(self):
+        players_cards = {"P1": ACES, "P2": KINGS, "P3": [encode_card(7, Suit.CLUBS), encode_card(8, Suit.CLUBS)]}
+        community_cards = [encode_card(6, Suit.CLUBS), encode_card(9, Suit.DIAMONDS), encode_card(2, Suit.CLUBS)]
+        remaining_cards = [
+            card for card in engine.deck
+            if card not in community_cards + ACES + KINGS + players_cards["P3"]
+        ]
+        wins = {"P1": 0, "P2": 0, "P3": 0}
+        runouts = list(itertools.combinations(remaining_cards, 2))
+        for runout in runouts:
+            ranking = engine.rank_players(
+                {player_id: {"cards": cards} for player_id, cards in players_cards.items()},
+                community_cards + list(runout)
+            )
+            if len(ranking[0]) == 1:
+                wins[ranking[0][0][0]] += 1
+
+        equities = equity.exact_equity(players_cards, community_cards)
+
+        assert {player_id: equities[player_id].win for player_id in wins} == {
+            player_id: player_wins / len(runouts) for player_id, player_wins in wins.items()
+        }
+
+    def test_used_after_the_flop(self):
+        community_cards = [encode_card(6, Suit.CLUBS), encode_card(9, Suit.DIAMONDS), encode_card(2, Suit.CLUBS)]
+
+        with mock.patch("drunkpoker.main.equity.get_executor") as mock_get_executor:
+            equities = equity.estimate_equity({"P1": ACES, "P2": KINGS}, community_cards)
+
+        mock_get_executor.assert_not_called()
+        assert equities == equity.exact_equity({"P1": ACES, "P2": KINGS}, community_cards)
+
+    def test_canonical_hand_ignores_suits_and_order(self):
+        community_cards = [encode_card(6, Suit.CLUBS), encode_card(9, Suit.DIAMONDS), encode_card(2, Suit.CLUBS)]
+        same_with_other_suits = [encode_card(2, Suit.HEART), encode_card(9, Suit.SPADE), encode_card(6, Suit.HEART)]
+        aces_other_suits = [encode_card(14, Suit.DIAMONDS), encode_card(14, Suit.CLUBS)]
+        kings_other_suits = [encode_card(13, Suit.CLUBS), encode_card(13, Suit.DIAMONDS)]
+
+        assert equity.canonical_hand([ACES, KINGS], community_cards, []) == equity.canonical_hand(
+            [aces_other_suits, kings_other_suits], same_with_other_suits, []
+        )
+        assert equity.canonical_hand([ACES, KINGS], community_cards, []) != equity.canonical_hand(
+            [KINGS, ACES], community_cards, []
+        )
+
+    def test_cached_by_canonical_hand(self):
+        community_cards = [encode_card(6, Suit.CLUBS), encode_card(9, Suit.DIAMONDS), encode_card(2, Suit.CLUBS),
+                           encode_card(3, Suit.SPADE)]
+        same_with_other_suits = [encode_card(6, Suit.HEART), encode_card(9, Suit.SPADE), encode_card(2, Suit.HEART),
+                                 encode_card(3, Suit.CLUBS)]
+        aces_other_suits = [encode_card(14, Suit.DIAMONDS), encode_card(14, Suit.CLUBS)]
+        kings_other_suits = [encode_card(13, Suit.CLUBS), encode_card(13, Suit.DIAMONDS)]
+        equity.exact_equity({"P1": ACES, "P2": KINGS}, community_cards)
+        hits = equity._exact_wins.cache_info().hits
+
+        equities = equity.exact_equity({"P3": aces_other_suits, "P4": kings_other_suits}, same_with_other_suits)
+
+        assert equity._exact_wins.cache_info().hits == hits + 1
+        assert equities["P3"] == equity.exact_equity({"P1": ACES, "P2": KINGS}, community_cards)["P1"]
+
+
+def test_draw_without_replacement():
+    drawn = equity.draw_without_replacement(np.random.default_rng(0), 10, 1000, 5)
+
+    assert drawn.shape == (1000, 5)
+    assert drawn.min() == 0 and drawn.max() == 9
+    assert all(len(set(row)) == 5 for row in drawn.tolist())
+
+
+def test_players_cards_for_state():
+    state = {
+        "game_type": "normal",
+        "players": {
+            "P1": {"state": engine.PlayerState.MY_TURN, "cards": ACES},
+            "P2": {"state": engine.PlayerState.FOLDED, "cards": KINGS},
+            "P3": {"state": engine.PlayerState.IN_GAME, "cards": [encode_card(2, Suit.SPADE)]},
+            "P4": {"state": engine.PlayerState.WAITING_NEW_GAME}
+        }
+    }
+
+    assert equity.players_cards_for_state(state) == (
+        {"P1": ACES, "P3": [encode_card(2, Suit.SPADE)]},
+        KINGS
+    )
+
+
+@pytest.mark.parametrize("game_type", ["omaha", "shortdeck", "hilo"])
+def test_no_equity_for_other_games(game_type):
+    with pytest.raises(ValueError):
+        equity.players_cards_for_state({"game_type": game_type, "players": {}})
+
+
+class TestPreflopEquity:
+
+    def test_starting_hand_index(self):
+        combos = [equity.starting_hand_combos(index) for index in range(equity.STARTING_HANDS)]
+
+        assert sum(map(len, combos)) == len(list(itertools.combinations(engine.deck, 2)))
+        assert sorted(map(len, combos)) == [4] * 78 + [6] * 13 + [12] * 78
+        assert equity.starting_hand_index(ACES) == 0
+        assert equity.starting_hand_index([encode_card(14, Suit.SPADE), encode_card(13, Suit.SPADE)]) == 1
+        assert equity.starting_hand_index([encode_card(13, Suit.HEART), encode_card(14, Suit.SPADE)]) == 13
+        assert equity.starting_hand_index([encode_card(2, Suit.CLUBS), encode_card(2, Suit.HEART)]) == 168
+
+    def test_simulate_preflop_row(self):
+        wins, ties = equity.simulate_preflop_row(167, 2000, 0)
+
+        assert wins.shape == ties.shape == (2,)
+        # 3-2 offsuit against itself, then against deuces
+        assert ties[0] > 0.5
+        assert 0.25 < wins[1] < 0.4
+
+    def test_matrix_is_consistent_and_memory_mapped(self, executor, tmp_path):
+        def simulate_preflop_row(row, samples, seed):
+            return np.full(equity.STARTING_HANDS - row, 0.5), np.full(equity.STARTING_HANDS - row, 0.125)
+
+        with mock.patch("drunkpoker.main.equity.simulate_preflop_row", simulate_preflop_row):
+            matrix = equity.compute_preflop_equity_matrix(samples=10, executor=executor)
+        path = str(tmp_path / "data" / "preflop_equity.bin")
+        equity.write_preflop_equity_matrix(matrix, path)
+
+        assert isinstance(equity.preflop_equity_matrix(path), np.memmap)
+        assert equity.preflop_equity(ACES, KINGS, path) == equity.Equity(win=0.5, tie=0.125)
+        assert equity.preflop_equity(KINGS, ACES, path) == equity.Equity(win=0.375, tie=0.125)
+        assert equity.preflop_equity(ACES, ACES, path) == equity.Equity(win=0.4375, tie=0.125)
+
+    def test_missing_matrix(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            equity.preflop_equity(ACES, KINGS, str(tmp_path / "missing.bin"))
@@ -0,0 +1,74 @@
+import pytest
+import copy
+import json
+import pickle
+
+from drunkpoker.main import journal
+
+
+@pytest.fixture
+def state():
+    return journal.journaled({
+        "deck": [1, 2, 3, 4],
+        "players": {"P1": {"state": "IN_GAME", "committed_by": 0}},
+        "results": None
+    })
+
+
+def test_journaled_state_is_like_the_plain_state(state):
+    plain = {"deck": [1, 2, 3, 4], "players": {"P1": {"state": "IN_GAME", "committed_by": 0}}, "results": None}
+
+    assert state == plain
+    assert json.loads(json.dumps(state)) == plain
+    assert journal.journaled(state) is state
+    for copied in (copy.deepcopy(state), pickle.loads(pickle.dumps(state))):
+        assert copied == plain
+        assert copied["players"]["P1"].journal is copied.journal is not state.journal
+
+
+def test_rollback(state):
+    state.journal.begin()
+    del state["deck"][:2]
+    state["deck"].append(9)
+    state["players"]["P1"]["committed_by"] = 10
+    state["players"]["P1"]["committed_by"] = 20
+    state["players"]["P2"] = {"state": "IN_GAME"}
+    state["players"]["P2"]["committed_by"] = 5
+    state.pop("results")
+    state["outs"] = {"P1": []}
+    state.journal.rollback()
+
+    assert state == {"deck": [1, 2, 3, 4], "players": {"P1": {"state": "IN_GAME", "committed_by": 0}}, "results": None}
+    assert not state.journal.in_transaction()
+
+
+def test_containers_added_are_journaled_on_commit(state):
+    state.journal.begin()
+    state["players"]["P2"] = {"state": "IN_GAME", "cards": [7, 8]}
+    state["deck"].append({"not": "a card"})
+    state.journal.commit()
+
+    assert isinstance(state["players"]["P2"], journal.JournaledDict)
+    assert isinstance(state["players"]["P2"]["cards"], journal.JournaledList)
+    assert isinstance(state["deck"][-1], journal.JournaledDict)
+
+    state.journal.begin()
+    state["players"]["P2"]["cards"].pop()
+    state.journal.rollback()
+    assert state["players"]["P2"]["cards"] == [7, 8]
+
+
+def test_nothing_recorded_out_of_transactions(state):
+    state["deck"].pop()
+    state["players"]["P1"]["committed_by"] = 3
+
+    assert state.journal.entries is None
+
+
+def test_containers_added_out_of_transactions_are_journaled_when_one_begins(state):
+    state["deck"] = [5, 6]
+    state.journal.begin()
+    state["deck"].pop()
+    state.journal.rollback()
+
+    assert state["deck"] == [5, 6]
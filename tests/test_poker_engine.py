@@ -1,22 +1,27 @@
 import pytest
 import copy
+import itertools
+import json
 from unittest import mock
 import random
 
+import numpy as np
+
 from drunkpoker.main import engine
-from drunkpoker.main.engine import Card, Suit
+from drunkpoker.main.engine import encode_card, Suit
+from drunkpoker.main.journal import JournaledDict
 
 
 @pytest.fixture
 def shuffled_test_deck():
     # 4 As on top!
     return tuple([
-        Card(14, Suit.SPADE),
-        Card(14, Suit.DIAMONDS),
-        Card(14, Suit.HEART),
-        Card(14, Suit.CLUBS),
-        Card(2, Suit.HEART),
-        Card(3, Suit.SPADE)
+        encode_card(14, Suit.SPADE),
+        encode_card(14, Suit.DIAMONDS),
+        encode_card(14, Suit.HEART),
+        encode_card(14, Suit.CLUBS),
+        encode_card(2, Suit.HEART),
+        encode_card(3, Suit.SPADE)
     ])
 
 
@@ -230,7 +235,9 @@ def ongoing_game_with_two_players():
 def ongoing_game_with_three_players_one_folded():
     return {
         'deck': engine.deck,
-        'community_cards': [Card(14, engine.Suit.SPADE), Card(13, engine.Suit.SPADE), Card(12, engine.Suit.SPADE)],
+        'community_cards': [encode_card(14, engine.Suit.SPADE),
+                            encode_card(13, engine.Suit.SPADE),
+                            encode_card(12, engine.Suit.SPADE)],
         'seats': {
             "1": "",
             "2": "",
@@ -271,7 +278,9 @@ def ongoing_game_with_three_players_one_folded():
 def ongoing_game_with_three_players_all_in_game():
     return {
         'deck': engine.deck,
-        'community_cards': [Card(14, engine.Suit.SPADE), Card(13, engine.Suit.SPADE), Card(12, engine.Suit.SPADE)],
+        'community_cards': [encode_card(14, engine.Suit.SPADE),
+                            encode_card(13, engine.Suit.SPADE),
+                            encode_card(12, engine.Suit.SPADE)],
         'seats': {
             "1": "",
             "2": "",
@@ -312,7 +321,9 @@ def ongoing_game_with_three_players_all_in_game():
 def ongoing_game_all_called_turn_to_small_blind_to_raise_or_call():
     return {
         'deck': engine.deck,
-        'community_cards': [Card(14, engine.Suit.SPADE), Card(13, engine.Suit.SPADE), Card(12, engine.Suit.SPADE)],
+        'community_cards': [encode_card(14, engine.Suit.SPADE),
+                            encode_card(13, engine.Suit.SPADE),
+                            encode_card(12, engine.Suit.SPADE)],
         'seats': {
             "1": "",
             "2": "",
@@ -353,7 +364,9 @@ def ongoing_game_all_called_turn_to_small_blind_to_raise_or_call():
 def ongoing_game_all_called_turn_to_small_blind_to_check_or_raise():
     return {
         'deck': engine.deck,
-        'community_cards': [Card(14, engine.Suit.SPADE), Card(13, engine.Suit.SPADE), Card(12, engine.Suit.SPADE)],
+        'community_cards': [encode_card(14, engine.Suit.SPADE),
+                            encode_card(13, engine.Suit.SPADE),
+                            encode_card(12, engine.Suit.SPADE)],
         'seats': {
             "1": "",
             "2": "",
@@ -394,7 +407,9 @@ def ongoing_game_all_called_turn_to_small_blind_to_check_or_raise():
 def ongoing_game_all_called_turn_to_big_blind_to_call_or_raise():
     return {
         'deck': engine.deck,
-        'community_cards': [Card(14, engine.Suit.SPADE), Card(13, engine.Suit.SPADE), Card(12, engine.Suit.SPADE)],
+        'community_cards': [encode_card(14, engine.Suit.SPADE),
+                            encode_card(13, engine.Suit.SPADE),
+                            encode_card(12, engine.Suit.SPADE)],
         'seats': {
             "1": "",
             "2": "",
@@ -435,7 +450,9 @@ def ongoing_game_all_called_turn_to_big_blind_to_call_or_raise():
 def ongoing_game_all_called_turn_to_big_blind_to_check_or_raise():
     return {
         'deck': engine.deck,
-        'community_cards': [Card(14, engine.Suit.SPADE), Card(13, engine.Suit.SPADE), Card(12, engine.Suit.SPADE)],
+        'community_cards': [encode_card(14, engine.Suit.SPADE),
+                            encode_card(13, engine.Suit.SPADE),
+                            encode_card(12, engine.Suit.SPADE)],
         'seats': {
             "1": "",
             "2": "",
@@ -950,6 +967,67 @@ class TestProcessEvent:
             mock_end_game.assert_called_once_with("dummy_state_3")
             assert new_state == "dummy_state_4"
 
+    def test_rejected_event_rolls_back_the_whole_chain(self):
+        state = engine.initial_state("normal")
+        for player_id, seat_number in (("P1", 1), ("P2", 2)):
+            state = engine.process_event(state, {
+                "type": engine.Event.PLAYER_SIT,
+                "player_id": player_id,
+                "parameters": {"player_name": player_id, "seat_number": seat_number}
+            })
+        small_blind_id, big_blind_id = sorted(
+            state["players"], key=lambda player_id: state["players"][player_id]["committed_by"]
+        )
+        state = engine.process_event(state, {"type": engine.Event.CALL, "player_id": small_blind_id})
+        # Not enough cards left to draw the flop once the big blind checks
+        state["deck"] = state["deck"][:2]
+        state_before_check = copy.deepcopy(state)
+
+        with pytest.raises(engine.EventRejected):
+            engine.process_event(state, {"type": engine.Event.CHECK, "player_id": big_blind_id})
+
+        assert state == state_before_check
+        assert state["players"][big_blind_id]["state"] == engine.PlayerState.MY_TURN
+
+    def test_all_events_have_a_handler(self):
+        assert set(engine.EVENT_HANDLERS) == set(engine.Event) - {engine.Event.MULTI_EVENT, engine.Event.NONE}
+
+    def test_long_chains_of_events_dont_recurse(self):
+        with mock.patch('drunkpoker.main.engine.players_lost') as mock_players_lost, \
+             mock.patch('drunkpoker.main.engine.exclude_player') as mock_exclude_player:
+            mock_players_lost.return_value = {
+                "type": engine.Event.MULTI_EVENT,
+                "events": [{"type": engine.Event.PLAYER_LEAVE, "player_id": f"P{i}"} for i in range(5000)]
+            }, "dummy_state"
+            mock_exclude_player.side_effect = lambda state, player_id: (
+                {"type": engine.Event.SHOW_CARDS, "player_id": player_id} if player_id == "P0" else None,
+                state
+            )
+
+            with mock.patch('drunkpoker.main.engine.show_cards') as mock_show_cards:
+                mock_show_cards.return_value = None, "dummy_state_after_show"
+                new_state = engine.process_event("state", {"type": engine.Event.PLAYERS_LOST, "players_ids": []})
+
+        assert mock_exclude_player.call_count == 5000
+        # Events generated by the first leave are processed before the second leave
+        assert mock_exclude_player.call_args_list[1] == mock.call("dummy_state_after_show", "P1")
+        assert new_state == "dummy_state_after_show"
+
+    def test_counts_generated_events(self):
+        engine.event_loop_stats.clear()
+        with mock.patch('drunkpoker.main.engine.end_game') as mock_end_game, \
+             mock.patch('drunkpoker.main.engine.resolve_stacks') as mock_resolve_stacks:
+            mock_end_game.return_value = {"type": engine.Event.RESOLVE_STACKS}, "dummy_state"
+            mock_resolve_stacks.return_value = None, "dummy_state"
+
+            engine.process_event("dummy_state", {"type": engine.Event.END_GAME})
+            engine.process_event("dummy_state", {"type": engine.Event.RESOLVE_STACKS})
+
+        assert engine.event_loop_stats.stats() == {
+            "END_GAME": {"processed": 1, "generated": 1, "max_generated": 1, "generated_per_event": 1},
+            "RESOLVE_STACKS": {"processed": 1, "generated": 0, "max_generated": 0, "generated_per_event": 0}
+        }
+
 
 class TestDetermineNextDealer:
 
@@ -1429,6 +1507,103 @@ class TestStripStateForPlayer:
             assert "cards" not in new_state["players"][player_id]
 
 
+class TestCardEncoding:
+
+    def test_encode_decode(self):
+        for value in engine.card_values:
+            for suit in engine.suits:
+                assert engine.decode_card(encode_card(value, suit)) == engine.Card(value, suit)
+
+    def test_deck_is_52_different_cards(self):
+        assert sorted(engine.deck) == list(range(0, 52))
+
+    def test_deal_takes_the_next_cards(self):
+        state = {"deck": list(engine.deck)}
+
+        assert engine.deal(state, 3) == list(engine.deck[:3])
+        assert engine.deal(state, 2) == list(engine.deck[3:5])
+        assert state["deck"] == list(engine.deck[5:])
+
+    def test_pack_deck(self):
+        the_deck = engine.shuffle_deck()[9:]
+
+        assert len(engine.pack_deck(the_deck)) < len(json.dumps(the_deck)) / 2
+        assert engine.unpack_deck(json.loads(json.dumps(engine.pack_deck(the_deck)))) == the_deck
+        assert engine.unpack_deck(engine.pack_deck([])) == []
+
+    def test_encoded_cards_sort_by_value(self):
+        assert encode_card(2, Suit.CLUBS) < encode_card(3, Suit.SPADE) < encode_card(14, Suit.SPADE)
+
+    def test_decode_cards_for_client(self):
+        state = {
+            "community_cards": [encode_card(14, Suit.SPADE), encode_card(10, Suit.HEART), encode_card(2, Suit.CLUBS)],
+            "players": {
+                "P1": {"cards": [encode_card(11, Suit.DIAMONDS), encode_card(12, Suit.CLUBS)]},
+                "P2": {"state": engine.PlayerState.IN_GAME}
+            }
+        }
+
+        new_state = engine.decode_cards_for_client(state)
+
+        assert json.loads(json.dumps(new_state)) == {
+            "community_cards": [[14, "SPADE"], [10, "HEART"], [2, "CLUBS"]],
+            "players": {
+                "P1": {"cards": [[11, "DIAMONDS"], [12, "CLUBS"]]},
+                "P2": {"state": engine.PlayerState.IN_GAME}
+            }
+        }
+
+    def test_tables_stored_before_cards_were_ints(self):
+        legacy_deck = [[value, suit] for suit in engine.suits for value in engine.card_values][10:]
+        state = json.loads(json.dumps({
+            "deck": legacy_deck,
+            "community_cards": [[2, "SPADE"], [3, "SPADE"], [4, "SPADE"]],
+            "seats": {"1": "P1", "2": "P2", **{str(seat): "" for seat in range(3, 11)}},
+            "turn_to": -1,
+            "players": {
+                "P1": {"name": "P1", "state": "MY_TURN", "committed_by": 20, "cards": [[5, "HEART"], [6, "HEART"]]},
+                "P2": {"name": "P2", "state": "IN_GAME", "committed_by": 20, "cards": [[7, "CLUBS"], [8, "CLUBS"]]}
+            },
+            "game_state": "FLOP",
+            "dealing": "1",
+            "small_blind": 10,
+            "big_blind": 20,
+            "all_in": 20,
+            "game_type": "normal",
+            "players_stacks": {"P1": 1000, "P2": 1000}
+        }))
+
+        state = engine.encode_legacy_cards(state)
+        state = engine.process_event(state, {"type": engine.Event.CHECK, "player_id": "P1"})
+        state = engine.process_event(state, {"type": engine.Event.CHECK, "player_id": "P2"})
+
+        assert state["players"]["P1"]["cards"] == [encode_card(5, Suit.HEART), encode_card(6, Suit.HEART)]
+        assert state["community_cards"] == [
+            encode_card(2, Suit.SPADE), encode_card(3, Suit.SPADE), encode_card(4, Suit.SPADE),
+            encode_card(*legacy_deck[0])
+        ]
+        assert engine.decode_cards_for_client(engine.strip_state_for_player(state, "P1"))["community_cards"][3] == \
+            engine.Card(*legacy_deck[0])
+
+    def test_decode_scores_for_client(self):
+        state = {
+            "game_type": "shortdeck",
+            "community_cards": [],
+            "players": {},
+            "results": {"scores": {
+                "P1": engine.short_deck_score(engine.Result(engine.Combinations.FLUSH, (12, 10, 8, 7, 6))),
+                "P2": None
+            }}
+        }
+
+        new_state = engine.decode_cards_for_client(state)
+
+        assert json.loads(json.dumps(new_state["results"]["scores"])) == {
+            "P1": [engine.Combinations.FLUSH, [12, 10, 8, 7, 6]],
+            "P2": None
+        }
+
+
 class TestShowCards:
 
     def test_show_cards_player_does_not_exist(self):
@@ -1450,66 +1625,402 @@ class TestShowCards:
 class TestRankPlayers:
 
     def test_rank_players_tie(self, add_player):
-        p1 = add_player("P1", cards=[Card(value=14, suit=Suit.HEART), Card(value=14, suit=Suit.SPADE)])
-        p2 = add_player("P2", cards=[Card(value=14, suit=Suit.CLUBS), Card(value=14, suit=Suit.DIAMONDS)])
+        p1 = add_player("P1", cards=[encode_card(value=14, suit=Suit.HEART), encode_card(value=14, suit=Suit.SPADE)])
+        p2 = add_player("P2", cards=[encode_card(value=14, suit=Suit.CLUBS), encode_card(value=14, suit=Suit.DIAMONDS)])
 
         players_ranked = engine.rank_players(
             {"P1": p1, "P2": p2},
-            [Card(value=13, suit=Suit.HEART),
-             Card(value=13, suit=Suit.SPADE),
-             Card(value=13, suit=Suit.DIAMONDS),
-             Card(value=12, suit=Suit.HEART),
-             Card(value=11, suit=Suit.HEART)]
+            [encode_card(value=13, suit=Suit.HEART),
+             encode_card(value=13, suit=Suit.SPADE),
+             encode_card(value=13, suit=Suit.DIAMONDS),
+             encode_card(value=12, suit=Suit.HEART),
+             encode_card(value=11, suit=Suit.HEART)]
         )
 
         assert players_ranked == [
-            [("P1", (engine.Combinations.FULL_HOUSE, (13, 14))),
-             ("P2", (engine.Combinations.FULL_HOUSE, (13, 14)))]
+            [("P1", engine.hand_score(engine.Result(engine.Combinations.FULL_HOUSE, (13, 14)))),
+             ("P2", engine.hand_score(engine.Result(engine.Combinations.FULL_HOUSE, (13, 14))))]
         ]
 
     def test_rank_players_p1_wins(self, add_player):
-        p1 = add_player("P1", cards=[Card(value=14, suit=Suit.HEART), Card(value=14, suit=Suit.SPADE)])
-        p2 = add_player("P1", cards=[Card(value=12, suit=Suit.CLUBS), Card(value=12, suit=Suit.DIAMONDS)])
+        p1 = add_player("P1", cards=[encode_card(value=14, suit=Suit.HEART), encode_card(value=14, suit=Suit.SPADE)])
+        p2 = add_player("P1", cards=[encode_card(value=12, suit=Suit.CLUBS), encode_card(value=12, suit=Suit.DIAMONDS)])
 
         players_ranked = engine.rank_players(
             {"P1": p1, "P2": p2},
-            [Card(value=13, suit=Suit.HEART),
-             Card(value=13, suit=Suit.SPADE),
-             Card(value=13, suit=Suit.DIAMONDS),
-             Card(value=12, suit=Suit.HEART),
-             Card(value=11, suit=Suit.HEART)]
+            [encode_card(value=13, suit=Suit.HEART),
+             encode_card(value=13, suit=Suit.SPADE),
+             encode_card(value=13, suit=Suit.DIAMONDS),
+             encode_card(value=12, suit=Suit.HEART),
+             encode_card(value=11, suit=Suit.HEART)]
         )
 
         assert players_ranked == [
-            [("P1", (engine.Combinations.FULL_HOUSE, (13, 14)))],
-            [("P2", (engine.Combinations.FULL_HOUSE, (13, 12)))]
+            [("P1", engine.hand_score(engine.Result(engine.Combinations.FULL_HOUSE, (13, 14))))],
+            [("P2", engine.hand_score(engine.Result(engine.Combinations.FULL_HOUSE, (13, 12))))]
         ]
 
     def test_rank_5_players(self, add_player):
-        p1 = add_player("P1", cards=[Card(value=14, suit=Suit.HEART), Card(value=13, suit=Suit.DIAMONDS)])
-        p2 = add_player("P2", cards=[Card(value=7, suit=Suit.CLUBS), Card(value=8, suit=Suit.CLUBS)])
-        p3 = add_player("P3", cards=[Card(value=10, suit=Suit.CLUBS), Card(value=10, suit=Suit.HEART)])
-        p4 = add_player("P4", cards=[Card(value=7, suit=Suit.SPADE), Card(value=8, suit=Suit.SPADE)])
-        p5 = add_player("P5", cards=[Card(value=2, suit=Suit.CLUBS), Card(value=3, suit=Suit.CLUBS)])
+        p1 = add_player("P1", cards=[encode_card(value=14, suit=Suit.HEART), encode_card(value=13, suit=Suit.DIAMONDS)])
+        p2 = add_player("P2", cards=[encode_card(value=7, suit=Suit.CLUBS), encode_card(value=8, suit=Suit.CLUBS)])
+        p3 = add_player("P3", cards=[encode_card(value=10, suit=Suit.CLUBS), encode_card(value=10, suit=Suit.HEART)])
+        p4 = add_player("P4", cards=[encode_card(value=7, suit=Suit.SPADE), encode_card(value=8, suit=Suit.SPADE)])
+        p5 = add_player("P5", cards=[encode_card(value=2, suit=Suit.CLUBS), encode_card(value=3, suit=Suit.CLUBS)])
 
         players_ranked = engine.rank_players(
             {"P1": p1, "P2": p2, "P3": p3, "P4": p4, "P5": p5},
-            [Card(value=14, suit=Suit.SPADE),
-             Card(value=4, suit=Suit.SPADE),
-             Card(value=5, suit=Suit.SPADE),
-             Card(value=6, suit=Suit.SPADE),
-             Card(value=11, suit=Suit.HEART)]
+            [encode_card(value=14, suit=Suit.SPADE),
+             encode_card(value=4, suit=Suit.SPADE),
+             encode_card(value=5, suit=Suit.SPADE),
+             encode_card(value=6, suit=Suit.SPADE),
+             encode_card(value=11, suit=Suit.HEART)]
         )
 
         assert players_ranked == [
-            [("P4", (engine.Combinations.STRAIGHT_FLUSH, (8,)))],
-            [("P2", (engine.Combinations.STRAIGHT, (8,)))],
-            [("P5", (engine.Combinations.STRAIGHT, (6,)))],
-            [("P1", (engine.Combinations.ONE_PAIR, (14, 13, 11, 6)))],
-            [("P3", (engine.Combinations.ONE_PAIR, (10, 14, 11, 6)))]
+            [("P4", engine.hand_score(engine.Result(engine.Combinations.STRAIGHT_FLUSH, (8,))))],
+            [("P2", engine.hand_score(engine.Result(engine.Combinations.STRAIGHT, (8,))))],
+            [("P5", engine.hand_score(engine.Result(engine.Combinations.STRAIGHT, (6,))))],
+            [("P1", engine.hand_score(engine.Result(engine.Combinations.ONE_PAIR, (14, 13, 11, 6))))],
+            [("P3", engine.hand_score(engine.Result(engine.Combinations.ONE_PAIR, (10, 14, 11, 6))))]
         ]
 
 
+    def test_rank_players_same_as_best_combination_of_each_player(self, add_player):
+        cards = random.Random(3).sample(engine.deck, 25)
+        players = {
+            f"P{i}": add_player(f"P{i}", seat_number=i + 1, cards=cards[2 * i:2 * i + 2])
+            for i in range(10)
+        }
+
+        players_ranked = engine.rank_players(players, cards[20:])
+
+        assert [score for players_and_scores in players_ranked for _, score in players_and_scores] == sorted(
+            [engine.hand_score(engine.best_combination(player["cards"] + cards[20:])) for player in players.values()],
+            reverse=True
+        )
+
+
+class TestAnalyseCards:
+
+    def test_extending_an_analysis_leaves_it_untouched(self):
+        community_cards = [encode_card(14, Suit.SPADE),
+                           encode_card(13, Suit.SPADE),
+                           encode_card(2, Suit.SPADE),
+                           encode_card(2, Suit.HEART),
+                           encode_card(7, Suit.CLUBS)]
+        community_cards_analysis = engine.analyse_cards(community_cards)
+
+        flush = engine.analyse_cards([encode_card(4, Suit.SPADE), encode_card(5, Suit.SPADE)], community_cards_analysis)
+        pair = engine.analyse_cards([encode_card(4, Suit.HEART), encode_card(5, Suit.HEART)], community_cards_analysis)
+
+        assert engine.best_combination_from_analysis(flush) == engine.Result(
+            engine.Combinations.FLUSH, (14, 13, 5, 4, 2)
+        )
+        assert engine.best_combination_from_analysis(pair) == engine.Result(
+            engine.Combinations.ONE_PAIR, (2, 14, 13, 7)
+        )
+        assert community_cards_analysis == engine.analyse_cards(community_cards)
+
+
+class TestHandCache:
+
+    def test_same_whatever_the_order_of_the_cards(self):
+        cards = random.Random(5).sample(engine.deck, 7)
+        cache = engine.HandCache(10)
+
+        assert cache.best_combination(cards) == engine.best_combination(cards)
+        assert cache.best_combination(list(reversed(cards))) == engine.best_combination(cards)
+        assert cache.best_combination(
+            cards[0:2], engine.cards_mask(cards[2:]), engine.analyse_cards(cards[2:])
+        ) == engine.best_combination(cards)
+        assert cache.stats() == {
+            "size": 1, "max_size": 10, "hits": 2, "misses": 1, "evictions": 0, "hit_rate": 2 / 3
+        }
+
+    def test_least_recently_used_are_evicted(self):
+        hands = [random.Random(seed).sample(engine.deck, 7) for seed in range(4)]
+        cache = engine.HandCache(2)
+
+        cache.best_combination(hands[0])
+        cache.best_combination(hands[1])
+        cache.best_combination(hands[0])
+        cache.best_combination(hands[2])
+        assert cache.stats()["evictions"] == 1
+
+        cache.best_combination(hands[0])
+        assert cache.stats()["hits"] == 2
+        cache.best_combination(hands[1])
+        assert cache.stats()["misses"] == 4
+        assert cache.stats()["size"] == 2
+
+    def test_clear(self):
+        cache = engine.HandCache(2)
+        cache.best_combination(random.Random(0).sample(engine.deck, 7))
+
+        cache.clear()
+
+        assert cache.stats() == {"size": 0, "max_size": 2, "hits": 0, "misses": 0, "evictions": 0, "hit_rate": 0}
+
+    @pytest.mark.parametrize("hand_cache", [None, engine.HandCache(100)])
+    def test_rank_players_with_or_without_cache(self, add_player, hand_cache):
+        cards = random.Random(3).sample(engine.deck, 25)
+        players = {
+            f"P{i}": add_player(f"P{i}", seat_number=i + 1, cards=cards[2 * i:2 * i + 2])
+            for i in range(10)
+        }
+
+        with mock.patch("drunkpoker.main.engine.hand_cache", hand_cache):
+            players_ranked = engine.rank_players(players, cards[20:])
+            assert engine.rank_players(players, cards[20:]) == players_ranked
+
+        assert [score for players_and_scores in players_ranked for _, score in players_and_scores] == sorted(
+            [engine.hand_score(engine.best_combination(player["cards"] + cards[20:])) for player in players.values()],
+            reverse=True
+        )
+        if hand_cache:
+            assert hand_cache.stats()["hits"] == 10
+
+
+class TestOmaha:
+
+    @staticmethod
+    def brute_force(hole_cards, community_cards):
+        return max(
+            engine.best_combination(list(pair) + list(triple))
+            for pair in itertools.combinations(hole_cards, 2)
+            for triple in itertools.combinations(community_cards, 3)
+        )
+
+    @pytest.mark.parametrize("number_of_community_cards", [3, 4, 5])
+    def test_same_as_best_of_all_combinations(self, number_of_community_cards):
+        rng = random.Random(number_of_community_cards)
+        for _ in range(500):
+            cards = rng.sample(engine.deck, 4 + number_of_community_cards)
+            assert engine.best_omaha_combination(
+                cards[:4], engine.analyse_omaha_board(cards[4:])
+            ) == self.brute_force(cards[:4], cards[4:])
+
+    def test_exactly_two_hole_cards(self):
+        community_cards = [encode_card(14, Suit.HEART),
+                           encode_card(13, Suit.HEART),
+                           encode_card(12, Suit.HEART),
+                           encode_card(11, Suit.HEART),
+                           encode_card(2, Suit.CLUBS)]
+        board_analysis = engine.analyse_omaha_board(community_cards)
+
+        # One heart isn't a flush, nor a royal flush
+        one_heart = [encode_card(10, Suit.HEART), encode_card(11, Suit.CLUBS),
+                     encode_card(4, Suit.DIAMONDS), encode_card(6, Suit.SPADE)]
+        assert engine.best_omaha_combination(one_heart, board_analysis) == engine.Result(
+            engine.Combinations.STRAIGHT, (14,)
+        )
+        # Four of a kind in hand is only a pair
+        four_of_a_kind = [encode_card(7, suit) for suit in engine.suits]
+        assert engine.best_omaha_combination(four_of_a_kind, board_analysis) == engine.Result(
+            engine.Combinations.ONE_PAIR, (7, 14, 13, 12)
+        )
+
+    def test_rank_players(self, add_player):
+        cards = random.Random(4).sample(engine.deck, 41)
+        players = {
+            f"P{i}": add_player(f"P{i}", seat_number=i + 1, cards=cards[4 * i:4 * i + 4])
+            for i in range(9)
+        }
+
+        players_ranked = engine.rank_players(players, cards[36:], "omaha")
+
+        assert [score for players_and_scores in players_ranked for _, score in players_and_scores] == sorted(
+            [engine.hand_score(self.brute_force(player["cards"], cards[36:])) for player in players.values()],
+            reverse=True
+        )
+
+    def test_start_game_deals_four_cards(self, iddle_game_with_4_players_and_a_dealer):
+        iddle_game_with_4_players_and_a_dealer["game_type"] = "omaha"
+        iddle_game_with_4_players_and_a_dealer["players_stacks"] = {
+            player_id: 1000 for player_id in iddle_game_with_4_players_and_a_dealer["players"]
+        }
+
+        _, new_state = engine.start_game(iddle_game_with_4_players_and_a_dealer)
+
+        assert len(new_state["deck"]) == 52 - 16
+        for player in new_state["players"].values():
+            assert len(player["cards"]) == 4
+
+    def test_pot_limit(self, base_table, add_player):
+        base_table["game_type"] = "omaha"
+        add_player("P1", seat_number=1, committed_by=10, state=engine.PlayerState.IN_GAME)
+        add_player("P2", seat_number=2, committed_by=20, state=engine.PlayerState.IN_GAME)
+        add_player("P3", seat_number=3, state=engine.PlayerState.MY_TURN)
+        base_table["players_stacks"] = {"P1": 1000, "P2": 1000, "P3": 1000}
+
+        # Call 20, then raise by the pot of 50
+        assert engine.get_raise_limit(base_table, "P3") == 70
+        base_table["players_stacks"]["P3"] = 50
+        assert engine.get_raise_limit(base_table, "P3") == 50
+
+
+class TestShortDeck:
+
+    def test_flush_beats_full_house(self, add_player):
+        community_cards = [encode_card(10, Suit.HEART),
+                           encode_card(10, Suit.SPADE),
+                           encode_card(8, Suit.HEART),
+                           encode_card(7, Suit.HEART),
+                           encode_card(13, Suit.CLUBS)]
+        players = {
+            "P1": add_player("P1", seat_number=1, cards=[encode_card(10, Suit.CLUBS), encode_card(13, Suit.SPADE)]),
+            "P2": add_player("P2", seat_number=2, cards=[encode_card(6, Suit.HEART), encode_card(12, Suit.HEART)])
+        }
+
+        flush = engine.Result(engine.Combinations.FLUSH, (12, 10, 8, 7, 6))
+        full_house = engine.Result(engine.Combinations.FULL_HOUSE, (10, 13))
+        assert engine.rank_players(players, community_cards, "shortdeck") == [
+            [("P2", engine.short_deck_score(flush))],
+            [("P1", engine.short_deck_score(full_house))]
+        ]
+        assert engine.rank_players(players, community_cards, "normal") == [
+            [("P1", engine.hand_score(full_house))],
+            [("P2", engine.hand_score(flush))]
+        ]
+
+    def test_as_six_seven_eight_nine_is_a_straight(self):
+        flush_table, values_table = engine.hand_tables("shortdeck")
+        low_straight = [encode_card(14, Suit.HEART),
+                        encode_card(6, Suit.SPADE),
+                        encode_card(7, Suit.HEART),
+                        encode_card(8, Suit.HEART),
+                        encode_card(9, Suit.CLUBS)]
+        low_straight_flush = [encode_card(value, Suit.SPADE) for value in (14, 6, 7, 8, 9)]
+
+        assert engine.best_combination_from_analysis(
+            engine.analyse_cards(low_straight), flush_table, values_table
+        ) == engine.Result(engine.Combinations.STRAIGHT, (9,))
+        assert engine.best_combination_from_analysis(
+            engine.analyse_cards(low_straight_flush), flush_table, values_table
+        ) == engine.Result(engine.Combinations.STRAIGHT_FLUSH, (9,))
+        # Still not a straight for the whole deck
+        assert engine.best_combination(low_straight) == engine.Result(
+            engine.Combinations.HIGH_CARD, (14, 9, 8, 7, 6)
+        )
+
+    def test_results_sort_in_short_deck_order(self):
+        flush_table, values_table = engine.hand_tables("shortdeck")
+        results = sorted(set(values_table.values()) | set(flush_table.values()))
+
+        assert [combination for combination, _ in itertools.groupby(result.combination for result in results)][-4:] == [
+            engine.Combinations.FULL_HOUSE,
+            engine.Combinations.FLUSH,
+            engine.Combinations.FOUR_OF_A_KIND,
+            engine.Combinations.STRAIGHT_FLUSH
+        ]
+        scores = [engine.short_deck_score(result) for result in results]
+        assert scores == sorted(scores)
+        assert [engine.decode_hand_score(score, "shortdeck") for score in scores] == results
+
+    def test_start_game_deals_from_the_short_deck(self, iddle_game_with_4_players_and_a_dealer):
+        iddle_game_with_4_players_and_a_dealer["game_type"] = "shortdeck"
+        iddle_game_with_4_players_and_a_dealer["players_stacks"] = {
+            player_id: 1000 for player_id in iddle_game_with_4_players_and_a_dealer["players"]
+        }
+
+        _, new_state = engine.start_game(iddle_game_with_4_players_and_a_dealer)
+
+        assert len(new_state["deck"]) == 36 - 8
+        assert set(new_state["deck"]) < set(engine.short_deck)
+
+
+class TestHiLo:
+
+    @pytest.mark.parametrize("cards, low", [
+        ([(14, Suit.SPADE), (2, Suit.HEART), (3, Suit.HEART), (4, Suit.CLUBS), (5, Suit.HEART)], (5, 4, 3, 2, 1)),
+        ([(8, Suit.SPADE), (7, Suit.HEART), (6, Suit.HEART), (4, Suit.CLUBS), (2, Suit.HEART), (2, Suit.SPADE),
+          (13, Suit.SPADE)], (8, 7, 6, 4, 2)),
+        ([(8, Suit.SPADE), (7, Suit.HEART), (6, Suit.HEART), (4, Suit.CLUBS), (3, Suit.HEART), (2, Suit.SPADE),
+          (14, Suit.SPADE)], (6, 4, 3, 2, 1)),
+        ([(9, Suit.SPADE), (7, Suit.HEART), (6, Suit.HEART), (4, Suit.CLUBS), (2, Suit.HEART), (2, Suit.SPADE),
+          (14, Suit.SPADE)], (7, 6, 4, 2, 1)),
+        ([(9, Suit.SPADE), (7, Suit.HEART), (6, Suit.HEART), (4, Suit.CLUBS), (2, Suit.HEART), (2, Suit.SPADE),
+          (13, Suit.SPADE)], None),
+    ])
+    def test_low(self, add_player, cards, low):
+        cards = [encode_card(value, suit) for value, suit in cards]
+        players = {"P1": add_player("P1", seat_number=1, cards=cards[0:2])}
+
+        assert engine.rank_players_low(players, cards[2:]) == ([[("P1", low)]] if low else [])
+
+    def test_rank_players_low(self, add_player):
+        community_cards = [encode_card(14, Suit.SPADE),
+                           encode_card(3, Suit.SPADE),
+                           encode_card(5, Suit.HEART),
+                           encode_card(12, Suit.CLUBS),
+                           encode_card(13, Suit.CLUBS)]
+        players = {
+            "P1": add_player("P1", seat_number=1, cards=[encode_card(8, Suit.CLUBS), encode_card(7, Suit.SPADE)]),
+            "P2": add_player("P2", seat_number=2, cards=[encode_card(2, Suit.HEART), encode_card(4, Suit.HEART)]),
+            "P3": add_player("P3", seat_number=3, cards=[encode_card(2, Suit.CLUBS), encode_card(4, Suit.DIAMONDS)]),
+            "P4": add_player("P4", seat_number=4, cards=[encode_card(14, Suit.HEART), encode_card(9, Suit.HEART)]),
+        }
+
+        assert engine.rank_players_low(players, community_cards) == [
+            [("P2", (5, 4, 3, 2, 1)), ("P3", (5, 4, 3, 2, 1))],
+            [("P1", (8, 7, 5, 3, 1))]
+        ]
+
+    def test_end_game_results(self, base_not_drunk_table, add_player):
+        base_not_drunk_table["game_type"] = "hilo"
+        base_not_drunk_table["community_cards"] = [encode_card(14, Suit.SPADE),
+                                                   encode_card(3, Suit.SPADE),
+                                                   encode_card(5, Suit.HEART),
+                                                   encode_card(12, Suit.CLUBS),
+                                                   encode_card(13, Suit.CLUBS)]
+        add_player("P1", seat_number=1, committed_by=10,
+                   cards=[encode_card(14, Suit.HEART), encode_card(13, Suit.HEART)])
+        add_player("P2", seat_number=2, committed_by=10,
+                   cards=[encode_card(2, Suit.HEART), encode_card(4, Suit.HEART)])
+        add_player("P3", seat_number=3, committed_by=10,
+                   cards=[encode_card(9, Suit.HEART), encode_card(9, Suit.CLUBS)])
+
+        _, state = engine.end_game(base_not_drunk_table)
+
+        assert state["results"]["winners"] == ["P2"]
+        assert state["results"]["low_winners"] == ["P2"]
+        assert state["results"]["low_scores"] == {"P2": (5, 4, 3, 2, 1)}
+        assert state["results"]["low_ranking"] == [["P2"]]
+
+    @pytest.mark.parametrize("ranking, low_ranking, commits, stacks", [
+        # Scoops
+        ([["P1"], ["P2"], ["P3"]], [["P1"]], (10, 10, 10), (120, 90, 90)),
+        # Split
+        ([["P1"], ["P2"], ["P3"]], [["P2"]], (10, 10, 10), (105, 105, 90)),
+        # Odd chip of the pot to the high hand
+        ([["P1"], ["P2"]], [["P2"]], (5, 5, 1), (101, 100, 99)),
+        # Low half shared
+        ([["P1"], ["P2"], ["P3"]], [["P2", "P3"]], (20, 20, 20), (110, 95, 95)),
+        # No low, all for the high hand
+        ([["P1"], ["P2"], ["P3"]], [], (10, 10, 10), (120, 90, 90)),
+        # P3 has the best low but is all in for less, the low half of the side pot goes to the best high hand
+        ([["P1"], ["P2"], ["P3"]], [["P3"]], (20, 20, 10), (115, 80, 105)),
+    ])
+    def test_resolve_stacks(self, base_not_drunk_table, add_player, ranking, low_ranking, commits, stacks):
+        for player_number, commit in enumerate(commits, 1):
+            add_player(f"P{player_number}", seat_number=player_number, committed_by=commit, stack=100)
+        base_not_drunk_table["game_type"] = "hilo"
+        base_not_drunk_table["game_state"] = engine.GameState.GAME_OVER
+        base_not_drunk_table["results"] = {"ranking": ranking, "low_ranking": low_ranking}
+
+        _, state = engine.resolve_stacks(base_not_drunk_table)
+
+        assert tuple(state["players_stacks"][f"P{player_number}"] for player_number in (1, 2, 3)) == stacks
+
+    def test_one_odd_chip_per_pot(self):
+        high_pots, low_pots = engine.build_split_pots(
+            [["P1"], ["P2"], ["P3"]], [["P2"]], {"P1": 101, "P2": 101, "P3": 101}
+        )
+
+        assert high_pots == [{"amount": 152, "players": ["P1", "P2", "P3"], "winners": ["P1"]}]
+        assert low_pots == [{"amount": 151, "players": ["P1", "P2", "P3"], "winners": ["P2"]}]
+
+
 class TestGetBestCombination:
     """
     As I'm not going to write the 81 possible combinations of x vs y, this is assuming transitivity of the
@@ -1518,28 +2029,14 @@ class TestGetBestCombination:
     y=[straight flush, four of a kind, ..., high card]
     """
 
-    def test_accept_list_of_list_instead_of_cards(self):
-        cards = [[2, Suit.SPADE],
-                 [3, Suit.SPADE],
-                 [4, Suit.SPADE],
-                 [6, Suit.SPADE],
-                 [7, Suit.HEART],
-                 [5, Suit.SPADE],
-                 [8, Suit.CLUBS]]
-
-        assert engine.best_combination(cards) == engine.Result(
-            combination=engine.Combinations.STRAIGHT_FLUSH,
-            best_cards=(6,)
-        )
-
     def test_straight_flush_against_higher_straight(self):
-        cards = [Card(value=2, suit=Suit.SPADE),
-                 Card(value=3, suit=Suit.SPADE),
-                 Card(value=4, suit=Suit.SPADE),
-                 Card(value=6, suit=Suit.SPADE),
-                 Card(value=7, suit=Suit.HEART),
-                 Card(value=5, suit=Suit.SPADE),
-                 Card(value=8, suit=Suit.CLUBS)]
+        cards = [encode_card(value=2, suit=Suit.SPADE),
+                 encode_card(value=3, suit=Suit.SPADE),
+                 encode_card(value=4, suit=Suit.SPADE),
+                 encode_card(value=6, suit=Suit.SPADE),
+                 encode_card(value=7, suit=Suit.HEART),
+                 encode_card(value=5, suit=Suit.SPADE),
+                 encode_card(value=8, suit=Suit.CLUBS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.STRAIGHT_FLUSH,
@@ -1547,13 +2044,13 @@ class TestGetBestCombination:
         )
 
     def test_straight_against_two_pairs(self):
-        cards = [Card(value=10, suit=Suit.SPADE),
-                 Card(value=11, suit=Suit.SPADE),
-                 Card(value=12, suit=Suit.DIAMONDS),
-                 Card(value=13, suit=Suit.SPADE),
-                 Card(value=13, suit=Suit.CLUBS),
-                 Card(value=14, suit=Suit.HEART),
-                 Card(value=14, suit=Suit.SPADE)]
+        cards = [encode_card(value=10, suit=Suit.SPADE),
+                 encode_card(value=11, suit=Suit.SPADE),
+                 encode_card(value=12, suit=Suit.DIAMONDS),
+                 encode_card(value=13, suit=Suit.SPADE),
+                 encode_card(value=13, suit=Suit.CLUBS),
+                 encode_card(value=14, suit=Suit.HEART),
+                 encode_card(value=14, suit=Suit.SPADE)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.STRAIGHT,
@@ -1561,13 +2058,13 @@ class TestGetBestCombination:
         )
 
     def test_straight_against_lower_straight(self):
-        cards = [Card(value=2, suit=Suit.SPADE),
-                 Card(value=3, suit=Suit.CLUBS),
-                 Card(value=4, suit=Suit.DIAMONDS),
-                 Card(value=5, suit=Suit.SPADE),
-                 Card(value=6, suit=Suit.SPADE),
-                 Card(value=7, suit=Suit.HEART),
-                 Card(value=8, suit=Suit.CLUBS)]
+        cards = [encode_card(value=2, suit=Suit.SPADE),
+                 encode_card(value=3, suit=Suit.CLUBS),
+                 encode_card(value=4, suit=Suit.DIAMONDS),
+                 encode_card(value=5, suit=Suit.SPADE),
+                 encode_card(value=6, suit=Suit.SPADE),
+                 encode_card(value=7, suit=Suit.HEART),
+                 encode_card(value=8, suit=Suit.CLUBS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.STRAIGHT,
@@ -1575,13 +2072,13 @@ class TestGetBestCombination:
         )
 
     def test_full_house_against_two_pairs(self):
-        cards = [Card(value=2, suit=Suit.SPADE),
-                 Card(value=2, suit=Suit.CLUBS),
-                 Card(value=2, suit=Suit.DIAMONDS),
-                 Card(value=5, suit=Suit.SPADE),
-                 Card(value=5, suit=Suit.HEART),
-                 Card(value=14, suit=Suit.HEART),
-                 Card(value=14, suit=Suit.CLUBS)]
+        cards = [encode_card(value=2, suit=Suit.SPADE),
+                 encode_card(value=2, suit=Suit.CLUBS),
+                 encode_card(value=2, suit=Suit.DIAMONDS),
+                 encode_card(value=5, suit=Suit.SPADE),
+                 encode_card(value=5, suit=Suit.HEART),
+                 encode_card(value=14, suit=Suit.HEART),
+                 encode_card(value=14, suit=Suit.CLUBS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.FULL_HOUSE,
@@ -1589,13 +2086,13 @@ class TestGetBestCombination:
         )
 
     def test_two_pairs(self):
-        cards = [Card(value=2, suit=Suit.SPADE),
-                 Card(value=2, suit=Suit.CLUBS),
-                 Card(value=6, suit=Suit.DIAMONDS),
-                 Card(value=5, suit=Suit.SPADE),
-                 Card(value=5, suit=Suit.HEART),
-                 Card(value=14, suit=Suit.HEART),
-                 Card(value=14, suit=Suit.CLUBS)]
+        cards = [encode_card(value=2, suit=Suit.SPADE),
+                 encode_card(value=2, suit=Suit.CLUBS),
+                 encode_card(value=6, suit=Suit.DIAMONDS),
+                 encode_card(value=5, suit=Suit.SPADE),
+                 encode_card(value=5, suit=Suit.HEART),
+                 encode_card(value=14, suit=Suit.HEART),
+                 encode_card(value=14, suit=Suit.CLUBS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.TWO_PAIRS,
@@ -1609,13 +2106,13 @@ class TestGetBestCombination:
         assert True
 
     def test_four_of_a_kind_against_full_house(self):
-        cards = [Card(value=14, suit=Suit.DIAMONDS),
-                 Card(value=14, suit=Suit.HEART),
-                 Card(value=14, suit=Suit.SPADE),
-                 Card(value=14, suit=Suit.HEART),
-                 Card(value=13, suit=Suit.DIAMONDS),
-                 Card(value=13, suit=Suit.HEART),
-                 Card(value=13, suit=Suit.CLUBS)]
+        cards = [encode_card(value=14, suit=Suit.DIAMONDS),
+                 encode_card(value=14, suit=Suit.HEART),
+                 encode_card(value=14, suit=Suit.SPADE),
+                 encode_card(value=14, suit=Suit.HEART),
+                 encode_card(value=13, suit=Suit.DIAMONDS),
+                 encode_card(value=13, suit=Suit.HEART),
+                 encode_card(value=13, suit=Suit.CLUBS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.FOUR_OF_A_KIND,
@@ -1629,13 +2126,13 @@ class TestGetBestCombination:
         assert True
 
     def test_full_house(self):
-        cards = [Card(value=12, suit=Suit.HEART),
-                 Card(value=12, suit=Suit.CLUBS),
-                 Card(value=14, suit=Suit.DIAMONDS),
-                 Card(value=14, suit=Suit.HEART),
-                 Card(value=14, suit=Suit.SPADE),
-                 Card(value=13, suit=Suit.HEART),
-                 Card(value=13, suit=Suit.DIAMONDS)]
+        cards = [encode_card(value=12, suit=Suit.HEART),
+                 encode_card(value=12, suit=Suit.CLUBS),
+                 encode_card(value=14, suit=Suit.DIAMONDS),
+                 encode_card(value=14, suit=Suit.HEART),
+                 encode_card(value=14, suit=Suit.SPADE),
+                 encode_card(value=13, suit=Suit.HEART),
+                 encode_card(value=13, suit=Suit.DIAMONDS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.FULL_HOUSE,
@@ -1643,13 +2140,13 @@ class TestGetBestCombination:
         )
 
     def test_flush(self):
-        cards = [Card(value=2, suit=Suit.DIAMONDS),
-                 Card(value=3, suit=Suit.DIAMONDS),
-                 Card(value=6, suit=Suit.SPADE),
-                 Card(value=7, suit=Suit.DIAMONDS),
-                 Card(value=8, suit=Suit.DIAMONDS),
-                 Card(value=9, suit=Suit.HEART),
-                 Card(value=10, suit=Suit.DIAMONDS)]
+        cards = [encode_card(value=2, suit=Suit.DIAMONDS),
+                 encode_card(value=3, suit=Suit.DIAMONDS),
+                 encode_card(value=6, suit=Suit.SPADE),
+                 encode_card(value=7, suit=Suit.DIAMONDS),
+                 encode_card(value=8, suit=Suit.DIAMONDS),
+                 encode_card(value=9, suit=Suit.HEART),
+                 encode_card(value=10, suit=Suit.DIAMONDS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.FLUSH,
@@ -1657,13 +2154,13 @@ class TestGetBestCombination:
         )
 
     def test_flush_against_straight(self):
-        cards = [Card(value=2, suit=Suit.DIAMONDS),
-                 Card(value=3, suit=Suit.DIAMONDS),
-                 Card(value=6, suit=Suit.DIAMONDS),
-                 Card(value=7, suit=Suit.DIAMONDS),
-                 Card(value=8, suit=Suit.DIAMONDS),
-                 Card(value=9, suit=Suit.HEART),
-                 Card(value=10, suit=Suit.DIAMONDS)]
+        cards = [encode_card(value=2, suit=Suit.DIAMONDS),
+                 encode_card(value=3, suit=Suit.DIAMONDS),
+                 encode_card(value=6, suit=Suit.DIAMONDS),
+                 encode_card(value=7, suit=Suit.DIAMONDS),
+                 encode_card(value=8, suit=Suit.DIAMONDS),
+                 encode_card(value=9, suit=Suit.HEART),
+                 encode_card(value=10, suit=Suit.DIAMONDS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.FLUSH,
@@ -1671,13 +2168,13 @@ class TestGetBestCombination:
         )
 
     def test_straight_against_three_of_a_kind(self):
-        cards = [Card(value=10, suit=Suit.HEART),
-                 Card(value=10, suit=Suit.SPADE),
-                 Card(value=6, suit=Suit.DIAMONDS),
-                 Card(value=7, suit=Suit.DIAMONDS),
-                 Card(value=8, suit=Suit.DIAMONDS),
-                 Card(value=9, suit=Suit.HEART),
-                 Card(value=10, suit=Suit.DIAMONDS)]
+        cards = [encode_card(value=10, suit=Suit.HEART),
+                 encode_card(value=10, suit=Suit.SPADE),
+                 encode_card(value=6, suit=Suit.DIAMONDS),
+                 encode_card(value=7, suit=Suit.DIAMONDS),
+                 encode_card(value=8, suit=Suit.DIAMONDS),
+                 encode_card(value=9, suit=Suit.HEART),
+                 encode_card(value=10, suit=Suit.DIAMONDS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.STRAIGHT,
@@ -1691,13 +2188,13 @@ class TestGetBestCombination:
         assert True
 
     def test_three_of_a_kind_against_one_pair(self):
-        cards = [Card(value=10, suit=Suit.HEART),
-                 Card(value=10, suit=Suit.SPADE),
-                 Card(value=14, suit=Suit.DIAMONDS),
-                 Card(value=13, suit=Suit.CLUBS),
-                 Card(value=8, suit=Suit.DIAMONDS),
-                 Card(value=9, suit=Suit.HEART),
-                 Card(value=10, suit=Suit.DIAMONDS)]
+        cards = [encode_card(value=10, suit=Suit.HEART),
+                 encode_card(value=10, suit=Suit.SPADE),
+                 encode_card(value=14, suit=Suit.DIAMONDS),
+                 encode_card(value=13, suit=Suit.CLUBS),
+                 encode_card(value=8, suit=Suit.DIAMONDS),
+                 encode_card(value=9, suit=Suit.HEART),
+                 encode_card(value=10, suit=Suit.DIAMONDS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.THREE_OF_A_KIND,
@@ -1705,13 +2202,13 @@ class TestGetBestCombination:
         )
 
     def test_two_pairs_against_one_pair(self):
-        cards = [Card(value=2, suit=Suit.HEART),
-                 Card(value=14, suit=Suit.DIAMONDS),
-                 Card(value=2, suit=Suit.SPADE),
-                 Card(value=14, suit=Suit.CLUBS),
-                 Card(value=8, suit=Suit.DIAMONDS),
-                 Card(value=11, suit=Suit.HEART),
-                 Card(value=11, suit=Suit.DIAMONDS)]
+        cards = [encode_card(value=2, suit=Suit.HEART),
+                 encode_card(value=14, suit=Suit.DIAMONDS),
+                 encode_card(value=2, suit=Suit.SPADE),
+                 encode_card(value=14, suit=Suit.CLUBS),
+                 encode_card(value=8, suit=Suit.DIAMONDS),
+                 encode_card(value=11, suit=Suit.HEART),
+                 encode_card(value=11, suit=Suit.DIAMONDS)]
         random.shuffle(cards)
 
         assert engine.best_combination(cards) == engine.Result(
@@ -1720,13 +2217,13 @@ class TestGetBestCombination:
         )
 
     def test_pair_against_high_card(self):
-        cards = [Card(value=5, suit=Suit.DIAMONDS),
-                 Card(value=4, suit=Suit.HEART),
-                 Card(value=7, suit=Suit.DIAMONDS),
-                 Card(value=10, suit=Suit.HEART),
-                 Card(value=10, suit=Suit.SPADE),
-                 Card(value=14, suit=Suit.DIAMONDS),
-                 Card(value=12, suit=Suit.CLUBS)]
+        cards = [encode_card(value=5, suit=Suit.DIAMONDS),
+                 encode_card(value=4, suit=Suit.HEART),
+                 encode_card(value=7, suit=Suit.DIAMONDS),
+                 encode_card(value=10, suit=Suit.HEART),
+                 encode_card(value=10, suit=Suit.SPADE),
+                 encode_card(value=14, suit=Suit.DIAMONDS),
+                 encode_card(value=12, suit=Suit.CLUBS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.ONE_PAIR,
@@ -1734,19 +2231,143 @@ class TestGetBestCombination:
         )
 
     def test_high_card(self):
-        cards = [Card(value=9, suit=Suit.HEART),
-                 Card(value=10, suit=Suit.SPADE),
-                 Card(value=13, suit=Suit.DIAMONDS),
-                 Card(value=12, suit=Suit.CLUBS),
-                 Card(value=5, suit=Suit.DIAMONDS),
-                 Card(value=4, suit=Suit.HEART),
-                 Card(value=7, suit=Suit.DIAMONDS)]
+        cards = [encode_card(value=9, suit=Suit.HEART),
+                 encode_card(value=10, suit=Suit.SPADE),
+                 encode_card(value=13, suit=Suit.DIAMONDS),
+                 encode_card(value=12, suit=Suit.CLUBS),
+                 encode_card(value=5, suit=Suit.DIAMONDS),
+                 encode_card(value=4, suit=Suit.HEART),
+                 encode_card(value=7, suit=Suit.DIAMONDS)]
 
         assert engine.best_combination(cards) == engine.Result(
             combination=engine.Combinations.HIGH_CARD,
             best_cards=(13, 12, 10, 9, 7)
         )
 
+    def test_straight_flush_with_a_pair_in_the_sequence(self):
+        cards = [encode_card(value=9, suit=Suit.SPADE),
+                 encode_card(value=9, suit=Suit.HEART),
+                 encode_card(value=8, suit=Suit.SPADE),
+                 encode_card(value=7, suit=Suit.SPADE),
+                 encode_card(value=6, suit=Suit.SPADE),
+                 encode_card(value=5, suit=Suit.SPADE),
+                 encode_card(value=2, suit=Suit.CLUBS)]
+
+        assert engine.best_combination(cards) == engine.Result(
+            combination=engine.Combinations.STRAIGHT_FLUSH,
+            best_cards=(9,)
+        )
+
+    def test_as_plays_as_one_in_lowest_straight(self):
+        cards = [encode_card(value=14, suit=Suit.HEART),
+                 encode_card(value=2, suit=Suit.SPADE),
+                 encode_card(value=3, suit=Suit.DIAMONDS),
+                 encode_card(value=4, suit=Suit.CLUBS),
+                 encode_card(value=5, suit=Suit.DIAMONDS),
+                 encode_card(value=5, suit=Suit.HEART),
+                 encode_card(value=11, suit=Suit.DIAMONDS)]
+
+        assert engine.best_combination(cards) == engine.Result(
+            combination=engine.Combinations.STRAIGHT,
+            best_cards=(5,)
+        )
+
+    def test_lowest_straight_against_higher_straight(self):
+        cards = [encode_card(value=14, suit=Suit.HEART),
+                 encode_card(value=2, suit=Suit.SPADE),
+                 encode_card(value=3, suit=Suit.DIAMONDS),
+                 encode_card(value=4, suit=Suit.CLUBS),
+                 encode_card(value=5, suit=Suit.DIAMONDS),
+                 encode_card(value=6, suit=Suit.HEART),
+                 encode_card(value=11, suit=Suit.DIAMONDS)]
+
+        assert engine.best_combination(cards) == engine.Result(
+            combination=engine.Combinations.STRAIGHT,
+            best_cards=(6,)
+        )
+
+
+class TestEvaluateMany:
+
+    def test_same_as_best_combination(self):
+        rng = random.Random(1)
+        hands = [rng.sample(engine.deck, 7) for _ in range(2000)]
+
+        scores = engine.evaluate_many(hands)
+
+        assert scores.tolist() == [engine.hand_score(engine.best_combination(hand)) for hand in hands]
+
+    @pytest.mark.parametrize("number_of_cards", [5, 6])
+    def test_less_than_7_cards(self, number_of_cards):
+        rng = random.Random(2)
+        hands = [rng.sample(engine.deck, number_of_cards) for _ in range(2000)]
+
+        scores = engine.evaluate_many(hands)
+
+        assert scores.tolist() == [engine.hand_score(engine.best_combination(hand)) for hand in hands]
+
+    @pytest.mark.parametrize("hands", [np.zeros((0, 7), dtype=int), np.zeros((0, 5), dtype=int), []])
+    def test_no_hands(self, hands):
+        assert engine.evaluate_many(hands).tolist() == []
+        assert [analysis.tolist() for analysis in engine.analyse_many(hands)] == [[], []]
+
+    def test_a_single_hand_must_be_a_row(self):
+        with pytest.raises(ValueError):
+            engine.evaluate_many(engine.deck[:7])
+        with pytest.raises(ValueError):
+            engine.analyse_many(engine.deck[:7])
+        assert engine.evaluate_many([engine.deck[:7]]).tolist() == [
+            engine.hand_score(engine.best_combination(list(engine.deck[:7])))
+        ]
+
+    def test_players_sharing_the_boards(self):
+        rng = random.Random(3)
+        hands = [rng.sample(engine.deck, 9) for _ in range(200)]
+        boards = [hand[4:] for hand in hands]
+
+        scores = engine.evaluate_many_players([[hand[:2] for hand in hands], [hand[2:4] for hand in hands]], boards)
+
+        assert scores.tolist() == [
+            engine.evaluate_many([hand[:2] + hand[4:] for hand in hands]).tolist(),
+            engine.evaluate_many([hand[2:4] + hand[4:] for hand in hands]).tolist()
+        ]
+        assert engine.evaluate_many_players([hands[0][:2]], boards)[0].tolist() == engine.evaluate_many(
+            [hands[0][:2] + board for board in boards]
+        ).tolist()
+
+    def test_hand_score_compares_like_result(self):
+        results = sorted({
+            engine.best_combination(random.Random(seed).sample(engine.deck, 7))
+            for seed in range(200)
+        })
+
+        assert sorted(results, key=engine.hand_score) == results
+
+    def test_score_combination(self):
+        flush = engine.hand_score(engine.Result(engine.Combinations.FLUSH, (10, 9, 5, 4, 2)))
+        pair = engine.hand_score(engine.Result(engine.Combinations.ONE_PAIR, (14, 13, 11, 6)))
+
+        assert engine.score_combination(flush) == engine.Combinations.FLUSH
+        assert engine.score_combination(np.array([flush, pair])).tolist() == [
+            engine.Combinations.FLUSH, engine.Combinations.ONE_PAIR
+        ]
+        assert engine.COMBINATIONS_NAMES[engine.Combinations.FLUSH] == "FLUSH"
+
+    def test_flush_beats_straight(self):
+        hands = [
+            [encode_card(10, Suit.SPADE), encode_card(9, Suit.SPADE), encode_card(5, Suit.SPADE),
+             encode_card(4, Suit.SPADE), encode_card(2, Suit.SPADE), encode_card(3, Suit.HEART),
+             encode_card(6, Suit.HEART)],
+            [encode_card(10, Suit.SPADE), encode_card(9, Suit.SPADE), encode_card(5, Suit.SPADE),
+             encode_card(4, Suit.SPADE), encode_card(2, Suit.CLUBS), encode_card(3, Suit.HEART),
+             encode_card(6, Suit.HEART)],
+        ]
+
+        flush_score, straight_score = engine.evaluate_many(hands).tolist()
+
+        assert flush_score == engine.hand_score(engine.Result(engine.Combinations.FLUSH, (10, 9, 5, 4, 2)))
+        assert straight_score == engine.hand_score(engine.Result(engine.Combinations.STRAIGHT, (6,)))
+
 
 class TestEndGame:
 
@@ -1822,7 +2443,8 @@ class TestEndGame:
             assert new_state["game_state"] == engine.GameState.GAME_OVER
             mock_rank_players.assert_called_with(
                 {"P1": p1, "P2": p2, "P5": p5},
-                base_table["community_cards"])
+                base_table["community_cards"],
+                base_table["game_type"])
             assert new_state["results"]["winners"] == winners
 
     def test_end_game_correct_number_of_sips_and_scores(self, base_table, add_player):
@@ -1871,14 +2493,14 @@ class TestEndGame:
         assert new_state["results"]["ranking"] == [["P1"], ["P5"], ["P2", "P8"]]
 
     def test_end_game_end_to_end_ie_not_mocking_rank_players(self, base_table, add_player):
-        add_player("P1", cards=[Card(value=14, suit=Suit.HEART), Card(value=14, suit=Suit.SPADE)])
-        add_player("P2", cards=[Card(value=14, suit=Suit.CLUBS), Card(value=14, suit=Suit.DIAMONDS)])
+        add_player("P1", cards=[encode_card(value=14, suit=Suit.HEART), encode_card(value=14, suit=Suit.SPADE)])
+        add_player("P2", cards=[encode_card(value=14, suit=Suit.CLUBS), encode_card(value=14, suit=Suit.DIAMONDS)])
         base_table["community_cards"] =\
-            [Card(value=13, suit=Suit.HEART),
-             Card(value=13, suit=Suit.SPADE),
-             Card(value=13, suit=Suit.DIAMONDS),
-             Card(value=12, suit=Suit.HEART),
-             Card(value=11, suit=Suit.HEART)]
+            [encode_card(value=13, suit=Suit.HEART),
+             encode_card(value=13, suit=Suit.SPADE),
+             encode_card(value=13, suit=Suit.DIAMONDS),
+             encode_card(value=12, suit=Suit.HEART),
+             encode_card(value=11, suit=Suit.HEART)]
 
         event, new_state = engine.end_game(base_table)
 
@@ -1886,20 +2508,22 @@ class TestEndGame:
         assert new_state["game_state"] == engine.GameState.GAME_OVER
         assert new_state["results"]["winners"] == ["P1", "P2"]
         assert new_state["results"]["scores"] == {
-            "P1": (engine.Combinations.FULL_HOUSE, (13, 14)),
-            "P2": (engine.Combinations.FULL_HOUSE, (13, 14))
+            "P1": engine.hand_score(engine.Result(engine.Combinations.FULL_HOUSE, (13, 14))),
+            "P2": engine.hand_score(engine.Result(engine.Combinations.FULL_HOUSE, (13, 14)))
         }
 
     def test_end_game_doesnt_affect_committed_by(self, base_table, add_player):
-        add_player("P1", committed_by=10, cards=[Card(value=14, suit=Suit.HEART), Card(value=14, suit=Suit.SPADE)])
-        add_player("P2", committed_by=10, cards=[Card(value=14, suit=Suit.CLUBS), Card(value=14, suit=Suit.DIAMONDS)])
+        add_player("P1", committed_by=10,
+                   cards=[encode_card(value=14, suit=Suit.HEART), encode_card(value=14, suit=Suit.SPADE)])
+        add_player("P2", committed_by=10,
+                   cards=[encode_card(value=14, suit=Suit.CLUBS), encode_card(value=14, suit=Suit.DIAMONDS)])
         add_player("P3", committed_by=5, state=engine.PlayerState.FOLDED)
         base_table["community_cards"] = \
-            [Card(value=13, suit=Suit.HEART),
-             Card(value=13, suit=Suit.SPADE),
-             Card(value=13, suit=Suit.DIAMONDS),
-             Card(value=12, suit=Suit.HEART),
-             Card(value=11, suit=Suit.HEART)]
+            [encode_card(value=13, suit=Suit.HEART),
+             encode_card(value=13, suit=Suit.SPADE),
+             encode_card(value=13, suit=Suit.DIAMONDS),
+             encode_card(value=12, suit=Suit.HEART),
+             encode_card(value=11, suit=Suit.HEART)]
 
         event, new_state = engine.end_game(base_table)
 
@@ -2046,6 +2670,264 @@ class TestListOfPlayerIdsStartingAtDealer:
         }
 
 
+class TestSeatRing:
+
+    def test_start_game_computes_the_ring_from_the_dealer(self, iddle_game_with_4_players_and_a_dealer):
+        _, new_state = engine.start_game(iddle_game_with_4_players_and_a_dealer)
+
+        assert new_state["dealing"] == "4"
+        assert new_state["seat_ring"] == {
+            "order": ["p3", "p4", "p1", "p2"],
+            "positions": {"p3": 0, "p4": 1, "p1": 2, "p2": 3}
+        }
+
+    def test_updated_when_players_sit_and_leave(self, iddle_game_with_4_players_and_a_dealer):
+        _, state = engine.start_game(iddle_game_with_4_players_and_a_dealer)
+
+        _, state = engine.sit_player(state, "p5", "P5", 5)
+        assert state["seat_ring"]["order"] == ["p3", "p5", "p4", "p1", "p2"]
+        _, state = engine.exclude_player(state, "p1")
+        assert state["seat_ring"] == engine.make_seat_ring(["p3", "p5", "p4", "p2"])
+
+    def test_computed_for_states_without_it(self, iddle_game_with_4_players_and_a_dealer):
+        assert "seat_ring" not in iddle_game_with_4_players_and_a_dealer
+        assert engine.seat_ring(iddle_game_with_4_players_and_a_dealer)["order"] == ["p2", "p3", "p4", "p1"]
+
+        _, state = engine.sit_player(iddle_game_with_4_players_and_a_dealer, "p5", "P5", 5)
+        assert "seat_ring" not in state
+
+    def test_not_sent_to_players(self, iddle_game_with_4_players_and_a_dealer):
+        _, state = engine.start_game(iddle_game_with_4_players_and_a_dealer)
+
+        assert "seat_ring" not in engine.strip_state_for_player(state, "p1")
+
+
+class TestBettingAggregates:
+
+    def test_start_game_computes_them(self, iddle_game_with_4_players_and_a_dealer):
+        _, new_state = engine.start_game(iddle_game_with_4_players_and_a_dealer)
+
+        assert new_state["betting"] == {
+            "max_bet": 2,
+            "pot": 3,
+            "at_max_bet": 1,
+            "in_game": 4,
+            "folded": 0,
+            "live_not_all_in": 4
+        }
+
+    def test_kept_up_to_date_by_the_actions(self, iddle_game_with_4_players_and_a_dealer):
+        _, state = engine.start_game(iddle_game_with_4_players_and_a_dealer)
+        state["all_in"] = 20
+
+        for event_type, amount in ((engine.Event.CALL, None), (engine.Event.RAISE, 20), (engine.Event.FOLD, None),
+                                   (engine.Event.CALL, None)):
+            player_id = engine.find_player_ids_if(
+                state["players"], lambda player: player["state"] == engine.PlayerState.MY_TURN
+            )[0]
+            event = {"type": event_type, "player_id": player_id, "parameters": {"amount": amount}}
+            state = engine.process_event(state, event)
+            assert state["betting"] == engine.compute_betting(state)
+
+        assert state["betting"]["max_bet"] == 20
+        assert state["betting"]["folded"] == 1
+
+    def test_same_decisions_without_them(self):
+        rng = random.Random(5)
+        state = engine.initial_state("normal")
+        for i in range(4):
+            state = engine.process_event(state, {
+                "type": engine.Event.PLAYER_SIT,
+                "player_id": f"P{i}",
+                "parameters": {"player_name": f"P{i}", "seat_number": 2 * i + 1}
+            })
+
+        for step in range(200):
+            if state["game_state"] == engine.GameState.GAME_OVER:
+                event = {
+                    "type": engine.Event.PLAYER_READY_FOR_NEXT_GAME,
+                    "player_id": rng.choice(list(state["players"]))
+                }
+            else:
+                event = {
+                    "type": rng.choice([engine.Event.FOLD, engine.Event.CHECK, engine.Event.CALL, engine.Event.RAISE]),
+                    "player_id": engine.find_player_ids_if(
+                        state["players"], lambda player: player["state"] == engine.PlayerState.MY_TURN
+                    )[0],
+                    "parameters": {"amount": rng.choice([20, 50, 200, 1000])}
+                }
+            without_aggregates = copy.deepcopy(state)
+            without_aggregates.pop("betting", None)
+            try:
+                new_state = engine.process_event(copy.deepcopy(state), event, hand_seed=step)
+            except engine.EventRejected:
+                with pytest.raises(engine.EventRejected):
+                    engine.process_event(without_aggregates, event)
+                continue
+            expected = engine.process_event(without_aggregates, event, hand_seed=step)
+
+            if "betting" in new_state:
+                assert new_state["betting"] == engine.compute_betting(new_state)
+            expected.pop("betting", None)
+            assert {key: value for key, value in new_state.items() if key != "betting"} == expected
+            state = new_state
+
+    def test_not_sent_to_players(self, iddle_game_with_4_players_and_a_dealer):
+        _, state = engine.start_game(iddle_game_with_4_players_and_a_dealer)
+
+        assert "betting" not in engine.strip_state_for_player(state, "p1")
+
+
+class TestEventLog:
+
+    @staticmethod
+    def play(state, rng, steps):
+        """
+        :return: the state after steps random events, and the (event, hand seed) of the ones accepted, like
+            state.apply_event logs them
+        """
+        logged_events = []
+        for _ in range(steps):
+            if len(state["players"]) < 2:
+                break
+            if state["game_state"] == engine.GameState.GAME_OVER:
+                event = {
+                    "type": engine.Event.PLAYER_READY_FOR_NEXT_GAME,
+                    "player_id": rng.choice(list(state["players"]))
+                }
+            else:
+                event = {
+                    "type": rng.choice([engine.Event.FOLD, engine.Event.CHECK, engine.Event.CALL, engine.Event.RAISE]),
+                    "player_id": engine.find_player_ids_if(
+                        state["players"], lambda player: player["state"] == engine.PlayerState.MY_TURN
+                    )[0],
+                    "parameters": {"amount": rng.choice([20, 50, 200, 1000])}
+                }
+            hand_seed = rng.getrandbits(engine.HAND_SEED_BITS)
+            try:
+                state = engine.process_event(state, event, hand_seed=hand_seed)
+            except engine.EventRejected:
+                continue
+            logged_events.append((
+                engine.decode_event(engine.encode_event(event)),
+                hand_seed if state.get("hand_seed") == hand_seed else None
+            ))
+        return state, logged_events
+
+    def test_encode_decode_event(self):
+        event = {
+            "type": engine.Event.MULTI_EVENT,
+            "events": [
+                {
+                    "type": engine.Event.PLAYER_SIT,
+                    "player_id": "p1",
+                    "parameters": {"player_name": "P1", "seat_number": 2}
+                },
+                {"type": engine.Event.START_GAME}
+            ]
+        }
+
+        assert json.loads(engine.encode_event(event))["events"][1] == {"type": "START_GAME"}
+        assert engine.decode_event(engine.encode_event(event)) == event
+
+    def test_only_the_parameters_used_are_kept(self):
+        parameters = {"player_name": "P1", "seat_number": 2, "amount": 50, "padding": "x" * 2000}
+
+        assert engine.event_parameters(engine.Event.PLAYER_SIT, parameters) == {"player_name": "P1", "seat_number": 2}
+        assert engine.event_parameters(engine.Event.RAISE, parameters) == {"amount": 50}
+        assert engine.event_parameters(engine.Event.FOLD, parameters) == {}
+
+    def test_same_seed_same_deck(self, iddle_game_with_4_players_and_a_dealer):
+        states = [
+            engine.process_event(
+                copy.deepcopy(iddle_game_with_4_players_and_a_dealer), {"type": engine.Event.START_GAME}, hand_seed=42
+            )
+            for _ in range(2)
+        ]
+
+        assert states[0] == states[1]
+        assert engine.process_event(
+            copy.deepcopy(iddle_game_with_4_players_and_a_dealer), {"type": engine.Event.START_GAME}, hand_seed=43
+        )["deck"] != states[0]["deck"]
+
+    def test_replay_from_snapshot(self):
+        rng = random.Random(3)
+        state = engine.initial_state("normal")
+        for i in range(4):
+            state = engine.process_event(state, {
+                "type": engine.Event.PLAYER_SIT,
+                "player_id": f"P{i}",
+                "parameters": {"player_name": f"P{i}", "seat_number": 2 * i + 1}
+            })
+        state, _ = self.play(state, rng, 50)
+        snapshot = json.loads(json.dumps({**state, "deck": engine.pack_deck(state["deck"])}))
+        snapshot["deck"] = engine.unpack_deck(snapshot["deck"])
+
+        state, logged_events = self.play(state, rng, 100)
+
+        assert any(hand_seed is not None for _, hand_seed in logged_events)
+        engine.event_loop_stats.clear()
+        replayed = engine.replay_events(snapshot, logged_events)
+        assert replayed == state
+        assert not isinstance(replayed, JournaledDict)
+        assert engine.event_loop_stats.stats() == {}
+
+
+class TestHandReplay:
+
+    def test_start_game_shuffles_with_a_new_hand_seed(self, iddle_game_with_4_players_and_a_dealer):
+        _, state = engine.start_game(copy.deepcopy(iddle_game_with_4_players_and_a_dealer))
+        _, other_state = engine.start_game(copy.deepcopy(iddle_game_with_4_players_and_a_dealer))
+
+        assert 0 <= state["hand_seed"] < 2 ** engine.HAND_SEED_BITS
+        assert state["hand_seed"] != other_state["hand_seed"]
+        dealt_cards = [card for player in state["players"].values() for card in player["cards"]]
+        assert engine.shuffle_deck(seed=state["hand_seed"]) == dealt_cards + state["deck"]
+
+    def test_seeded_shuffle(self):
+        shuffled = engine.shuffle_deck(engine.short_deck, seed=12)
+
+        assert shuffled == engine.shuffle_deck(engine.short_deck, seed=12)
+        assert shuffled != engine.shuffle_deck(engine.short_deck, seed=13)
+        assert sorted(shuffled) == sorted(engine.short_deck)
+
+    def test_hand_seed_not_sent_to_players(self, iddle_game_with_4_players_and_a_dealer):
+        _, state = engine.start_game(iddle_game_with_4_players_and_a_dealer)
+
+        assert "hand_seed" not in engine.strip_state_for_player(state, "p1")
+
+    def test_replay_a_hand(self):
+        rng = random.Random(8)
+        state = engine.process_event(engine.initial_state("normal"), {
+            "type": engine.Event.PLAYER_SIT,
+            "player_id": "P0",
+            "parameters": {"player_name": "P0", "seat_number": 1}
+        })
+        before = json.loads(json.dumps(state))
+
+        events = [{
+            "type": engine.Event.PLAYER_SIT,
+            "player_id": "P1",
+            "parameters": {"player_name": "P1", "seat_number": 4}
+        }]
+        state = engine.process_event(state, events[0])
+        while state["game_state"] != engine.GameState.GAME_OVER:
+            event = {
+                "type": rng.choice([engine.Event.CHECK, engine.Event.CALL]),
+                "player_id": engine.find_player_ids_if(
+                    state["players"], lambda player: player["state"] == engine.PlayerState.MY_TURN
+                )[0]
+            }
+            try:
+                state = engine.process_event(state, event)
+            except engine.EventRejected:
+                continue
+            events.append(event)
+
+        assert engine.replay(state["hand_seed"], events, json.loads(json.dumps(before))) == state
+        assert engine.replay(state["hand_seed"] + 1, events, before)["deck"] != state["deck"]
+
+
 class TestNextGame:
 
     @pytest.fixture
@@ -2608,6 +3490,94 @@ class TestDrawFlopRiverOrTurn:
         assert event is None
 
 
+class TestOuts:
+
+    @pytest.fixture
+    def flush_draw_against_deuces(self, base_table, add_player):
+        ace_king_of_hearts = [encode_card(14, Suit.HEART), encode_card(13, Suit.HEART)]
+        deuces = [encode_card(2, Suit.CLUBS), encode_card(2, Suit.DIAMONDS)]
+        flop = [encode_card(12, Suit.HEART), encode_card(7, Suit.HEART), encode_card(3, Suit.SPADE)]
+        add_player("P1", seat_number=1, cards=ace_king_of_hearts)
+        add_player("P2", seat_number=2, cards=deuces)
+        add_player("P3", seat_number=3, cards=[encode_card(9, Suit.CLUBS), encode_card(8, Suit.CLUBS)],
+                   state=engine.PlayerState.FOLDED)
+        base_table["game_state"] = engine.GameState.PREFLOP
+        base_table["deck"] = flop + [
+            card for card in engine.deck
+            if card not in flop + ace_king_of_hearts + deuces + base_table["players"]["P3"]["cards"]
+        ]
+        return base_table
+
+    def test_outs_after_flop(self, flush_draw_against_deuces):
+        _, state = engine.draw_flop(flush_draw_against_deuces)
+
+        assert sorted(state["outs"]["P1"]) == sorted(
+            [encode_card(value, Suit.HEART) for value in (2, 3, 4, 5, 6, 8, 9, 10, 11)]
+            + [encode_card(value, suit) for value in (14, 13) for suit in (Suit.SPADE, Suit.DIAMONDS, Suit.CLUBS)]
+        )
+        # Already has the best hand
+        assert state["outs"]["P2"] == []
+        # Folded
+        assert "P3" not in state["outs"]
+
+    def test_outs_are_updated_from_the_previous_street(self, flush_draw_against_deuces):
+        _, state = engine.draw_flop(flush_draw_against_deuces)
+        state = json.loads(json.dumps(state))
+        _, state = engine.draw_river(state)
+        outs = state["outs"]
+
+        del state["hands_analyses"]
+        engine.update_outs(state, [])
+
+        assert outs == state["outs"]
+
+    def test_no_outs_after_turn(self, flush_draw_against_deuces):
+        _, state = engine.draw_flop(flush_draw_against_deuces)
+        _, state = engine.draw_river(state)
+        _, state = engine.draw_turn(state)
+
+        assert "outs" not in state
+        assert "hands_analyses" not in state
+
+    def test_outs_are_updated_when_a_player_folds(self, flush_draw_against_deuces):
+        flush_draw_against_deuces["players"]["P3"]["state"] = engine.PlayerState.IN_GAME
+        _, state = engine.draw_flop(flush_draw_against_deuces)
+        assert state["players"]["P1"]["state"] == engine.PlayerState.MY_TURN
+        p3_outs = state["outs"]["P3"]
+
+        _, state = engine.fold_player(state, "P1")
+
+        assert "P1" not in state["outs"] and "P1" not in state["hands_analyses"]
+        # The hearts don't give P1 a flush anymore
+        assert sorted(state["outs"]["P3"]) == sorted(
+            p3_outs + [encode_card(value, Suit.HEART) for value in (8, 9)]
+        )
+
+    def test_no_outs_once_the_hand_is_over(self, flush_draw_against_deuces):
+        _, state = engine.draw_flop(flush_draw_against_deuces)
+
+        _, state = engine.exclude_player(state, "P2")
+
+        assert state["game_state"] == engine.GameState.GAME_OVER
+        assert "outs" not in state and "hands_analyses" not in state
+        assert "outs" not in engine.strip_state_for_player(state, "P1")["players"]["P1"]
+
+    def test_players_only_see_their_outs(self, flush_draw_against_deuces):
+        _, state = engine.draw_flop(flush_draw_against_deuces)
+        outs = state["outs"]["P1"]
+
+        state_for_p1 = engine.strip_state_for_player(copy.deepcopy(state), "P1")
+        state_for_p2 = engine.strip_state_for_player(copy.deepcopy(state), "P2")
+
+        assert state_for_p1["players"]["P1"]["outs"] == outs
+        assert "outs" not in state_for_p1 and "hands_analyses" not in state_for_p1
+        assert state_for_p2["players"]["P2"]["outs"] == []
+        assert all("outs" not in player for player_id, player in state_for_p2["players"].items() if player_id != "P2")
+        assert engine.decode_cards_for_client(state_for_p1)["players"]["P1"]["outs"] == [
+            engine.decode_card(card) for card in outs
+        ]
+
+
 class TestRaise:
 
     def test_raise_not_her_turn(self, base_table, add_player):
@@ -2895,12 +3865,18 @@ class TestResolveStacks:
         event, new_state = engine.resolve_stacks(base_not_drunk_table)
 
         # Total pot is 140
-        assert 50 + 80 + 10 + 0 + 60 == 10 + 20 + 30 + 40 + 100
+        assert 50 + 40 + 30 + 20 + 60 == 10 + 20 + 30 + 40 + 100
         assert new_state["players_stacks"]["P1"] == 50  # P1 wins 10 from all 5 players, pot is now 90
-        assert new_state["players_stacks"]["P2"] == 80  # P2 wins 20 from all 4 players left, pot is now 10
-        assert new_state["players_stacks"]["P3"] == 10  # P3 gets the rest of the pot
-        assert new_state["players_stacks"]["P4"] == 0
+        assert new_state["players_stacks"]["P2"] == 40  # P2 wins the next 10 from all 4 players left, pot is now 50
+        assert new_state["players_stacks"]["P3"] == 30  # P3 wins the next 10 from all 3 players left, pot is now 20
+        assert new_state["players_stacks"]["P4"] == 20  # P4 wins the last 10 from P5 and themselves
         assert new_state["players_stacks"]["P5"] == 60
+        assert new_state["results"]["pots"] == [
+            {"amount": 50, "players": ["P1", "P2", "P3", "P4", "P5"], "winners": ["P1"]},
+            {"amount": 40, "players": ["P2", "P3", "P4", "P5"], "winners": ["P2"]},
+            {"amount": 30, "players": ["P3", "P4", "P5"], "winners": ["P3"]},
+            {"amount": 20, "players": ["P4", "P5"], "winners": ["P4"]}
+        ]
 
     def test_pot_splitting_with_one_all_in(self, base_not_drunk_table, add_player):
         add_player("P1", committed_by=10, stack=10, state=engine.PlayerState.IN_GAME)
@@ -2953,6 +3929,40 @@ class TestResolveStacks:
             "players_ids": ["P1", "P3"]
         }
 
+    def test_folded_commitments_go_to_the_pot_they_are_in(self, base_not_drunk_table, add_player):
+        add_player("P1", committed_by=10, stack=10, state=engine.PlayerState.IN_GAME)
+        add_player("P2", committed_by=30, stack=100, state=engine.PlayerState.FOLDED)
+        add_player("P3", committed_by=40, stack=100, state=engine.PlayerState.IN_GAME)
+        add_player("P4", committed_by=50, stack=100, state=engine.PlayerState.FOLDED)
+        base_not_drunk_table["game_state"] = engine.GameState.GAME_OVER
+        base_not_drunk_table["results"] = {
+            "ranking": [["P1"], ["P3"], ["P2", "P4"]]
+        }
+
+        event, new_state = engine.resolve_stacks(base_not_drunk_table)
+
+        assert new_state["results"]["pots"] == [
+            {"amount": 40, "players": ["P1", "P3"], "winners": ["P1"]},
+            {"amount": 80, "players": ["P3"], "winners": ["P3"]},
+            {"amount": 10, "players": ["P4"], "winners": ["P4"]}
+        ]
+        assert new_state["players_stacks"] == {"P1": 40, "P2": 70, "P3": 140, "P4": 60}
+
+    def test_odd_chips_go_to_the_first_winners(self, base_not_drunk_table, add_player):
+        add_player("P1", committed_by=11, stack=100, state=engine.PlayerState.IN_GAME)
+        add_player("P2", committed_by=11, stack=100, state=engine.PlayerState.IN_GAME)
+        add_player("P3", committed_by=11, stack=100, state=engine.PlayerState.IN_GAME)
+        add_player("P4", committed_by=2, stack=100, state=engine.PlayerState.FOLDED)
+        base_not_drunk_table["game_state"] = engine.GameState.GAME_OVER
+        base_not_drunk_table["results"] = {
+            "ranking": [["P3", "P1"], ["P2"], ["P4"]]
+        }
+
+        event, new_state = engine.resolve_stacks(base_not_drunk_table)
+
+        assert new_state["players_stacks"] == {"P1": 106, "P2": 89, "P3": 107, "P4": 98}
+        assert sum(new_state["players_stacks"].values()) == 400
+
     @pytest.mark.parametrize(
         "losers_rank",
         [
@@ -0,0 +1,118 @@
+import numpy as np
+
+from drunkpoker.main import engine, simulation
+from drunkpoker.main.engine import Event, EventRejected
+
+
+ACTIONS_EVENTS = {
+    simulation.FOLD: Event.FOLD,
+    simulation.CHECK: Event.CHECK,
+    simulation.CALL: Event.CALL,
+    simulation.RAISE: Event.RAISE
+}
+
+
+def table_state(stacks):
+    """
+    The state of the engine of a table of the simulation, its players having sat in the order of the seats
+    """
+    state = engine.initial_state("normal")
+    for seat, stack in enumerate(stacks):
+        if stack:
+            player_id = f"P{seat + 1}"
+            state["seats"][str(seat + 1)] = player_id
+            state["players"][player_id] = {"name": player_id, "state": engine.PlayerState.WAITING_NEW_GAME}
+            state["players_stacks"][player_id] = int(stack)
+    return state
+
+
+def start_hand(state, the_deck, monkeypatch):
+    monkeypatch.setattr(engine, "shuffle_deck", lambda *args, **kwargs: [int(card) for card in the_deck])
+    if state["game_state"] == engine.GameState.NOT_STARTED:
+        return engine.process_event(state, {"type": Event.START_GAME})
+    for player_id in list(state["players"]):
+        state = engine.process_event(state, {"type": Event.PLAYER_READY_FOR_NEXT_GAME, "player_id": player_id})
+    return state
+
+
+def play(state, player_id, action, amount):
+    """
+    :return: the new state, and whether the action was accepted
+    """
+    try:
+        return engine.process_event(
+            state, {"type": ACTIONS_EVENTS[action], "player_id": player_id, "parameters": {"amount": int(amount)}}
+        ), True
+    except (EventRejected, IndexError):
+        # The engine fails on raises nobody can answer
+        return state, False
+
+
+def assert_same_table(tables, index, state):
+    assert simulation.GAME_STATES[tables.game_states[index]] == state["game_state"]
+    dealer = tables.dealers[index]
+    assert (str(dealer + 1) if dealer >= 0 else "") == state["dealing"]
+    assert [
+        card for card in tables.community_cards[index].tolist() if card >= 0
+    ] == list(state["community_cards"])
+    for seat in range(tables.stacks.shape[1]):
+        player_id = state["seats"].get(str(seat + 1))
+        assert bool(player_id) == tables.seated[index, seat]
+        if not player_id:
+            continue
+        player = state["players"][player_id]
+        assert tables.stacks[index, seat] == state["players_stacks"][player_id]
+        assert tables.committed[index, seat] == player.get("committed_by", 0)
+        assert simulation.PLAYER_STATES[tables.players_states[index, seat]] == player["state"]
+        if state["game_state"] != engine.GameState.NOT_STARTED:
+            assert tables.hole_cards[index, seat].tolist() == player["cards"]
+
+
+class TestTables:
+
+    def test_start_hands_deals_and_sets_the_blinds(self):
+        tables = simulation.Tables([[1000, 0, 1000, 1000], [500, 500, 0, 0], [1000, 0, 0, 0]])
+
+        started = tables.start_hands(decks=np.tile(np.arange(52), (3, 1)))
+
+        assert started.tolist() == [True, True, False]
+        assert tables.dealers.tolist() == [2, 1, -1]
+        assert tables.hole_cards[0].tolist() == [[0, 1], [-1, -1], [2, 3], [4, 5]]
+        # The dealer plays first, the big blind is right before them and the small blind before the big blind
+        assert tables.committed[:2].tolist() == [[20, 0, 0, 10], [20, 10, 0, 0]]
+        assert tables.turns().tolist() == [2, 1, -1]
+        assert tables.game_states.tolist() == [simulation.PREFLOP, simulation.PREFLOP, simulation.NOT_STARTED]
+
+    def test_rejected_actions_leave_the_table_as_it_was(self):
+        tables = simulation.Tables([[1000, 1000, 1000]])
+        tables.start_hands(decks=[np.arange(52)])
+        committed = tables.committed.copy()
+
+        assert not tables.act([simulation.CHECK]).any()
+        assert not tables.act([simulation.RAISE], [2000]).any()
+        assert (tables.committed == committed).all()
+        assert tables.act([simulation.RAISE], [100]).all()
+        assert tables.committed[0].tolist() == [20, 100, 10]
+
+    def test_same_as_the_engine(self, monkeypatch):
+        rng = np.random.default_rng(3)
+        stacks = rng.choice([0, 0, 30, 100, 1000], size=(40, 6))
+        stacks[:, :2] = np.maximum(stacks[:, :2], 50)
+        tables = simulation.Tables(stacks)
+        states = [table_state(table_stacks) for table_stacks in stacks]
+
+        for _ in range(1500):
+            decks = np.argsort(rng.random((len(tables), 52)), axis=1)
+            started = np.flatnonzero(tables.start_hands(decks=decks))
+            for index in started:
+                states[index] = start_hand(states[index], decks[index], monkeypatch)
+
+            actions = rng.choice([simulation.FOLD, simulation.CHECK, simulation.CALL, simulation.RAISE], len(tables))
+            amounts = rng.choice([0, 10, 20, 50, 200, 1000], len(tables))
+            turns = tables.turns()
+            accepted = tables.act(actions, amounts)
+            for index, seat in enumerate(turns):
+                if seat >= 0:
+                    states[index], state_accepted = play(states[index], f"P{seat + 1}", actions[index], amounts[index])
+                    assert accepted[index] == state_accepted
+                assert_same_table(tables, index, states[index])